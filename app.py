@@ -1,14 +1,13 @@
 """Flask主应用入口"""
+import os
 import logging
 from datetime import timedelta
 from flask import Flask
 from config import Config
-from database.models import Database
-from database.db_manager import DBManager
-from services.file_processor import FileProcessor
-from services.gemini_service import GeminiService
-from services.banana_service import BananaService
-from services.ppt_generator import PPTGenerator
+from services.container import ServiceContainer
+from services.image_derivatives import VARIANTS
+from services.job_queue import JobWorkerPool
+from services.generation_recovery import GenerationRecovery
 
 # 导入路由
 from routes.auth import init_routes as init_auth_routes
@@ -16,6 +15,8 @@ from routes.workspace import init_routes as init_workspace_routes
 from routes.knowledge import init_routes as init_knowledge_routes
 from routes.outline import init_routes as init_outline_routes
 from routes.ppt import init_routes as init_ppt_routes
+from routes.system import init_routes as init_system_routes
+from routes.jobs import init_routes as init_jobs_routes
 
 # 配置日志
 logging.basicConfig(
@@ -40,31 +41,20 @@ def create_app():
     Config.init_app(app)
     logger.info("配置初始化完成")
 
-    # 初始化数据库
-    db = Database(Config.DATABASE_PATH)
-    db_manager = DBManager(db)
-    logger.info("数据库初始化完成")
-
-    # 初始化服务
-    file_processor = FileProcessor(Config)
-    gemini_service = GeminiService(Config)
-    banana_service = BananaService(Config)
-    ppt_generator = PPTGenerator(Config, db_manager, banana_service)
-    logger.info("服务层初始化完成")
-
-    # 恢复未完成的生成任务
-    logger.info("检查是否有未完成的生成任务...")
-    try:
-        # 查找所有状态为generating的项目
-        all_workspaces = db_manager.get_all_workspaces()
-        for workspace in all_workspaces:
-            projects = db_manager.get_ppt_projects(workspace['id'])
-            for project in projects:
-                if project['status'] == 'generating':
-                    logger.info(f"发现未完成的项目: {project['id']} - {project['title']}")
-                    ppt_generator.resume_generation(project['id'])
-    except Exception as e:
-        logger.error(f"恢复生成任务失败: {str(e)}")
+    # 初始化数据库和服务
+    services = ServiceContainer(Config)
+    db_manager = services.db_manager
+    image_derivatives = services.image_derivatives
+    static_assets = services.static_assets
+
+    # 启动后台任务执行线程（重启前未完成的任务在租约过期后会被重新领取执行）
+    # 使用独立执行者进程（python worker.py）时关闭，Web进程只负责提交任务
+    job_workers = None
+    if Config.RUN_EMBEDDED_WORKERS:
+        job_workers = JobWorkerPool(Config, services.job_queue)
+        job_workers.start()
+    else:
+        logger.info("Web进程不执行后台任务，请启动独立执行者进程: python worker.py")
 
     # 注册路由蓝图
     # 先注册认证路由
@@ -74,14 +64,23 @@ def create_app():
     workspace_bp = init_workspace_routes(db_manager)
     app.register_blueprint(workspace_bp)
 
-    knowledge_bp = init_knowledge_routes(db_manager, file_processor)
+    knowledge_bp = init_knowledge_routes(db_manager, services.file_processor)
     app.register_blueprint(knowledge_bp)
 
-    outline_bp = init_outline_routes(db_manager, gemini_service)
+    outline_bp = init_outline_routes(db_manager, services.gemini_service, services.outline_generator)
     app.register_blueprint(outline_bp)
 
-    ppt_bp_instance = init_ppt_routes(db_manager, banana_service, ppt_generator)
+    ppt_bp_instance = init_ppt_routes(db_manager, services.banana_service, services.ppt_generator, static_assets,
+                                      services.deck_exporter, services.export_artifacts)
     app.register_blueprint(ppt_bp_instance)
+
+    system_bp = init_system_routes(services.http_transport, services.banana_service, services.retry_engine,
+                                   image_derivatives, services.export_artifacts, services.job_queue, job_workers,
+                                   services.progress_store, services.scheduler)
+    app.register_blueprint(system_bp)
+
+    jobs_bp = init_jobs_routes(services.job_queue)
+    app.register_blueprint(jobs_bp)
     logger.info("路由注册完成")
 
     # 添加登录验证中间件
@@ -112,17 +111,43 @@ def create_app():
     app.config['MAX_CONTENT_LENGTH'] = Config.MAX_UPLOAD_SIZE
 
     # 添加静态文件路由，用于访问生成的图片
-    from flask import send_from_directory
+    from flask import abort
+    from werkzeug.security import safe_join
+
+    def resolve_file(directory, filename):
+        """将URL中的文件名解析为目录下的文件路径，不存在或越界时返回404"""
+        path = safe_join(directory, filename)
+        if not path or not os.path.isfile(path):
+            abort(404)
+        return path
 
     @app.route('/generated/<path:filename>')
     def serve_generated_file(filename):
-        """提供生成的文件访问"""
-        return send_from_directory(Config.GENERATED_FOLDER, filename)
+        """提供生成的文件访问（?variant=thumb|medium 返回缩略图/预览图）"""
+        variant = request.args.get('variant')
+        if variant and variant not in VARIANTS:
+            abort(400)
+        source_path = resolve_file(Config.GENERATED_FOLDER, filename)
+        if not variant:
+            return static_assets.send(source_path)
+
+        if not image_derivatives.is_supported(source_path):
+            abort(404)
+        try:
+            derivative_path = image_derivatives.get(source_path, variant)
+        except Exception as e:
+            logger.error(f"获取衍生图失败，返回原图: {filename}, {str(e)}")
+            return static_assets.send(source_path)
+        return static_assets.send(source_path, derivative_path, mimetype=image_derivatives.mimetype,
+                                  etag_suffix=f'-{variant}')
 
     @app.route('/uploads/<path:filename>')
     def serve_upload_file(filename):
         """提供上传的文件访问"""
-        return send_from_directory(Config.UPLOAD_FOLDER, filename)
+        return static_assets.send(resolve_file(Config.UPLOAD_FOLDER, filename))
+
+    # 在后台恢复中断的生成（延迟执行，不影响启动速度）
+    GenerationRecovery(Config, db_manager, services.ppt_generator).start()
 
     logger.info("Flask应用初始化完成")
     return app
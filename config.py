@@ -30,10 +30,58 @@ class Config:
     # 图片生成分辨率配置
     STYLE_TEMPLATE_IMAGE_SIZE = os.getenv('STYLE_TEMPLATE_IMAGE_SIZE', '2K')  # 样式模板图片分辨率
     PPT_PAGE_IMAGE_SIZE = os.getenv('PPT_PAGE_IMAGE_SIZE', '4K')  # PPT页面图片分辨率
+    DRAFT_PAGE_IMAGE_SIZE = os.getenv('DRAFT_PAGE_IMAGE_SIZE', '1K')  # 草稿模式下PPT页面图片分辨率
     IMAGE_ASPECT_RATIO = os.getenv('IMAGE_ASPECT_RATIO', '16:9')  # 图片宽高比
 
+    # 参考图片编码缓存上限（MB），样式模板图片只需编码一次即可在所有页面间复用
+    REFERENCE_CACHE_MAX_BYTES = int(os.getenv('REFERENCE_CACHE_MAX_MB', '64')) * 1024 * 1024
+
+    # 图片生成结果缓存配置（相同提示词、参考图、模型、比例和分辨率的请求直接返回缓存结果）
+    IMAGE_RESULT_CACHE_ENABLED = os.getenv('IMAGE_RESULT_CACHE_ENABLED', 'True').lower() == 'true'
+    IMAGE_RESULT_CACHE_DIR = os.getenv('IMAGE_RESULT_CACHE_DIR', './cache/images')
+    IMAGE_RESULT_CACHE_MAX_BYTES = int(os.getenv('IMAGE_RESULT_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+    # 图片后处理配置（模型返回的图片字节直接写入文件，格式不一致时在后台转换）
+    IMAGE_CONVERT_MISMATCHED_FORMAT = os.getenv('IMAGE_CONVERT_MISMATCHED_FORMAT', 'True').lower() == 'true'
+    IMAGE_POSTPROCESS_WORKERS = int(os.getenv('IMAGE_POSTPROCESS_WORKERS', '1'))  # 后处理线程数
+
+    # 图片衍生图配置（页面和样式的缩略图、中等尺寸WebP预览图，通过 ?variant=thumb|medium 访问）
+    IMAGE_DERIVATIVE_DIR = os.getenv('IMAGE_DERIVATIVE_DIR', './cache/derivatives')
+    IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '82'))  # WebP压缩质量
+    IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', '2'))  # 生成衍生图的线程数
+    IMAGE_DERIVATIVE_EAGER = os.getenv('IMAGE_DERIVATIVE_EAGER', 'True').lower() == 'true'  # 图片生成完成后立即在后台生成衍生图
+
+    # PPTX/PDF导出配置
+    EXPORT_JPEG_QUALITY = int(os.getenv('EXPORT_JPEG_QUALITY', '92'))  # PDF中页面图片的JPEG压缩质量
+    EXPORT_ARTIFACT_ENABLED = os.getenv('EXPORT_ARTIFACT_ENABLED', 'True').lower() == 'true'  # 页面完成后在后台预先生成导出文件
+    EXPORT_ARTIFACT_DIR = os.getenv('EXPORT_ARTIFACT_DIR', './cache/exports')  # 预先生成的导出文件目录
+    EXPORT_ARTIFACT_DEBOUNCE = float(os.getenv('EXPORT_ARTIFACT_DEBOUNCE', '3'))  # 最后一页完成多少秒后组装导出文件
+
+    # 后台任务队列配置（样式和页面生成作为持久化任务执行）
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # 同时执行的任务数
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))  # 任务租约时长，执行者崩溃后超过该时间任务被重新领取
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))  # 任务最大尝试次数，超过后转入死信
+    JOB_RETRY_BASE_DELAY = float(os.getenv('JOB_RETRY_BASE_DELAY', '5'))  # 失败重试的初始等待秒数（指数退避）
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))  # 空闲时查询新任务的间隔（秒）
+
+    # 生成进度配置（进度保存在数据库中，Web进程和执行者进程共享）
+    PROGRESS_TTL = float(os.getenv('PROGRESS_TTL', '86400'))  # 进度在最后一次更新多少秒后过期清理
+    PROGRESS_POLL_INTERVAL = float(os.getenv('PROGRESS_POLL_INTERVAL', '0.5'))  # 查询其他进程更新的进度的间隔（秒）
+
+    # 中断生成恢复配置（启动后在后台恢复状态为generating但没有任务的项目）
+    RECOVERY_ENABLED = os.getenv('RECOVERY_ENABLED', 'True').lower() == 'true'
+    RECOVERY_DELAY = float(os.getenv('RECOVERY_DELAY', '10'))  # 启动后多少秒开始恢复
+    RECOVERY_JITTER = float(os.getenv('RECOVERY_JITTER', '10'))  # 启动延迟附加的最大随机秒数，避免多个进程同时恢复
+    RECOVERY_STAGGER = float(os.getenv('RECOVERY_STAGGER', '1'))  # 恢复相邻两个项目之间的最大随机间隔（秒）
+
+    # 独立执行者进程配置（通过 python worker.py 启动，与Web进程共享数据库和文件目录）
+    RUN_EMBEDDED_WORKERS = os.getenv('RUN_EMBEDDED_WORKERS', 'True').lower() == 'true'  # Web进程内是否执行后台任务，使用独立执行者时设为False
+    WORKER_SHUTDOWN_TIMEOUT = float(os.getenv('WORKER_SHUTDOWN_TIMEOUT', '30'))  # 执行者收到停止信号后等待执行中任务结束的秒数
+
     # 数据库配置
     DATABASE_PATH = os.getenv('DATABASE_PATH', './database/easyaippt.db')
+    DATABASE_BUSY_TIMEOUT = float(os.getenv('DATABASE_BUSY_TIMEOUT', '30'))  # 等待写锁的最长秒数（多进程同时写入时）
+    DATABASE_JOURNAL_MODE = os.getenv('DATABASE_JOURNAL_MODE', 'WAL')  # 日志模式，数据库位于网络文件系统时改为DELETE
 
     # 文件存储配置
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', './uploads')
@@ -46,11 +94,45 @@ class Config:
         'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'
     }
 
-    # API重试配置
-    MAX_API_RETRIES = 10
-    RETRY_DELAY_BASE = 2  # 指数退避的基数（秒）
+    # API重试配置（只重试超时、限流和服务端错误，4xx等不可恢复的错误立即失败）
+    MAX_API_RETRIES = int(os.getenv('MAX_API_RETRIES', '10'))  # 图片生成最大尝试次数
+    RETRY_DELAY_BASE = 2  # 指数退避的初始等待时间（秒），实际等待时间带随机抖动
+    RETRY_MAX_DELAY = int(os.getenv('RETRY_MAX_DELAY', '60'))  # 单次退避等待上限（秒）
+    IMAGE_RETRY_DEADLINE = int(os.getenv('IMAGE_RETRY_DEADLINE', '600'))  # 单张图片生成（含重试）的总时限（秒）
+    OUTLINE_MAX_RETRIES = int(os.getenv('OUTLINE_MAX_RETRIES', '5'))  # 大纲生成最大尝试次数
+    OUTLINE_RETRY_DEADLINE = int(os.getenv('OUTLINE_RETRY_DEADLINE', '300'))  # 大纲生成（含重试）的总时限（秒）
     API_TIMEOUT = 60  # API调用超时时间（秒）
 
+    # HTTP连接池配置（GeminiService 和 BananaService 共用）
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))  # 缓存的主机连接池数量
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))  # 每个主机的最大连接数
+    HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'True').lower() == 'true'  # 连接数达到上限时是否等待空闲连接
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))  # 建立连接超时时间（秒）
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', str(API_TIMEOUT)))  # 读取响应超时时间（秒）
+
+    # 上游API限流配置（每个模型端点独立限流，遇到429/503时自动降速）
+    RATE_LIMIT_REQUESTS_PER_MINUTE = float(os.getenv('RATE_LIMIT_REQUESTS_PER_MINUTE', '60'))  # 每分钟最大请求数
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '10'))  # 允许的突发请求数
+    RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv('RATE_LIMIT_MAX_CONCURRENCY', '8'))  # 每个端点的最大并发请求数
+
+    # 模型端点熔断配置（连续失败后快速失败，避免大量请求在故障期间排队重试）
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5'))  # 连续失败多少次后熔断
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT = float(os.getenv('CIRCUIT_BREAKER_RECOVERY_TIMEOUT', '30'))  # 熔断后多少秒开始探测（秒）
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES = int(os.getenv('CIRCUIT_BREAKER_HALF_OPEN_PROBES', '1'))  # 半开状态允许的探测请求数
+
+    # 图片请求对冲配置（请求耗时超过近期耗时的百分位数时再发一个相同请求，先成功者胜出）
+    IMAGE_HEDGE_ENABLED = os.getenv('IMAGE_HEDGE_ENABLED', 'False').lower() == 'true'
+    IMAGE_HEDGE_PERCENTILE = float(os.getenv('IMAGE_HEDGE_PERCENTILE', '95'))  # 触发对冲的耗时百分位数
+    IMAGE_HEDGE_MIN_SAMPLES = int(os.getenv('IMAGE_HEDGE_MIN_SAMPLES', '20'))  # 统计样本数达到多少后才开始对冲
+    IMAGE_HEDGE_MIN_DELAY = float(os.getenv('IMAGE_HEDGE_MIN_DELAY', '10'))  # 发出对冲请求前的最短等待时间（秒）
+    IMAGE_HEDGE_BUDGET_RATIO = float(os.getenv('IMAGE_HEDGE_BUDGET_RATIO', '0.1'))  # 对冲请求数占请求总数的比例上限
+    IMAGE_HEDGE_MAX_IN_FLIGHT = int(os.getenv('IMAGE_HEDGE_MAX_IN_FLIGHT', '2'))  # 同时进行的对冲请求数上限
+
+    # 页面并发生成配置
+    PAGE_GENERATION_CONCURRENCY = int(os.getenv('PAGE_GENERATION_CONCURRENCY', '3'))  # 单个项目同时生成的页面数
+    MAX_CONCURRENT_PAGE_GENERATIONS = int(os.getenv('MAX_CONCURRENT_PAGE_GENERATIONS', '6'))  # 同时进行的图片生成总数上限（按优先级和工作区/项目公平分配）
+    GENERATION_CONTROL_POLL_INTERVAL = float(os.getenv('GENERATION_CONTROL_POLL_INTERVAL', '1'))  # 生成期间检查暂停/取消请求的间隔（秒）
+
     @staticmethod
     def init_app(app):
         """初始化应用配置"""
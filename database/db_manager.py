@@ -1,4 +1,5 @@
 """数据库操作封装"""
+import time
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from database.models import Database
@@ -100,11 +101,27 @@ class DBManager:
         results = self.db.execute_query(query, (project_id,))
         return results[0] if results else None
 
+    def get_projects_by_status(self, status: str) -> List[Dict[str, Any]]:
+        """获取所有指定状态的PPT项目（按更新时间排序）"""
+        query = 'SELECT * FROM ppt_projects WHERE status = ? ORDER BY updated_at'
+        return self.db.execute_query(query, (status,))
+
     def update_ppt_project_status(self, project_id: int, status: str) -> None:
         """更新PPT项目状态"""
         query = 'UPDATE ppt_projects SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?'
         self.db.execute_update(query, (status, project_id))
 
+    def transition_ppt_project_status(self, project_id: int, from_statuses: tuple, status: str) -> bool:
+        """项目状态为 from_statuses 之一时更新为 status，返回是否更新（与其他进程同时修改时只有一方成功）"""
+        placeholders = ','.join('?' * len(from_statuses))
+        query = f'''
+            UPDATE ppt_projects SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ({placeholders})
+        '''
+        with self.db.transaction() as conn:
+            cursor = conn.execute(query, (status, project_id, *from_statuses))
+            return cursor.rowcount == 1
+
     def update_ppt_project_style(self, project_id: int, style_index: int) -> None:
         """更新PPT项目选中的样式"""
         query = '''
@@ -114,6 +131,15 @@ class DBManager:
         '''
         self.db.execute_update(query, (style_index, project_id))
 
+    def update_ppt_project_draft_mode(self, project_id: int, draft_mode: bool) -> None:
+        """更新PPT项目的草稿模式"""
+        query = '''
+            UPDATE ppt_projects
+            SET draft_mode = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        '''
+        self.db.execute_update(query, (1 if draft_mode else 0, project_id))
+
     def delete_ppt_project(self, project_id: int) -> None:
         """删除PPT项目"""
         query = 'DELETE FROM ppt_projects WHERE id = ?'
@@ -183,14 +209,18 @@ class DBManager:
         return self.db.execute_query(query, (project_id,))
 
     def update_ppt_page(self, project_id: int, page_number: int, image_path: str,
-                       status: str, error_message: str = '') -> None:
-        """更新PPT页面"""
+                       status: str, error_message: str = '', image_size: Optional[str] = None,
+                       prompt: Optional[str] = None, input_fingerprint: Optional[str] = None) -> None:
+        """更新PPT页面（image_size 为实际生成分辨率，prompt、input_fingerprint 为空时保留原值）"""
         query = '''
             UPDATE ppt_pages
-            SET image_path = ?, status = ?, error_message = ?, updated_at = CURRENT_TIMESTAMP
+            SET image_path = ?, status = ?, error_message = ?, image_size = ?,
+                prompt = COALESCE(?, prompt), input_fingerprint = COALESCE(?, input_fingerprint),
+                updated_at = CURRENT_TIMESTAMP
             WHERE ppt_project_id = ? AND page_number = ?
         '''
-        self.db.execute_update(query, (image_path, status, error_message, project_id, page_number))
+        self.db.execute_update(query, (image_path, status, error_message, image_size, prompt, input_fingerprint,
+                                       project_id, page_number))
 
     def update_ppt_page_status(self, project_id: int, page_number: int, status: str) -> None:
         """更新PPT页面状态"""
@@ -210,7 +240,250 @@ class DBManager:
         '''
         self.db.execute_update(query, (project_id, page_number))
 
+    def delete_ppt_page(self, project_id: int, page_number: int) -> None:
+        """删除PPT项目的单个页面"""
+        query = 'DELETE FROM ppt_pages WHERE ppt_project_id = ? AND page_number = ?'
+        self.db.execute_update(query, (project_id, page_number))
+
     def delete_ppt_pages(self, project_id: int) -> None:
         """删除PPT项目的所有页面"""
         query = 'DELETE FROM ppt_pages WHERE ppt_project_id = ?'
         self.db.execute_update(query, (project_id,))
+
+    # ==================== 后台任务队列操作 ====================
+
+    def enqueue_job(self, job_type: str, payload: str, dedupe_key: Optional[str] = None,
+                    max_attempts: int = 3, available_at: Optional[float] = None, priority: int = 2,
+                    fair_key: Optional[str] = None) -> int:
+        """添加任务（存在相同去重键的排队中或执行中任务时返回该任务ID）"""
+        with self.db.transaction() as conn:
+            if dedupe_key:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')",
+                    (dedupe_key,)
+                ).fetchone()
+                if row:
+                    return row['id']
+            cursor = conn.execute(
+                '''
+                INSERT INTO jobs (job_type, payload, dedupe_key, max_attempts, available_at, priority, fair_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (job_type, payload, dedupe_key, max_attempts,
+                 available_at if available_at is not None else time.time(), priority, fair_key)
+            )
+            return cursor.lastrowid
+
+    def lease_job(self, owner: str, lease_seconds: float, job_types: Optional[List[str]] = None,
+                  dead_jobs: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """领取一个可执行的任务（排队中且已到执行时间，或租约已过期的执行中任务）
+
+        优先领取优先级高（数值小）的任务；同一优先级内，正在执行任务最少的 fair_key 优先，
+        一个工作区提交的大量任务不会挡住其他工作区的任务。
+        租约过期且尝试次数用尽的任务转入死信，传入 dead_jobs 列表时追加这些任务，由调用方处理。
+        """
+        now = time.time()
+        type_filter = ''
+        params: List[Any] = [now, now]
+        if job_types:
+            type_filter = f"AND job_type IN ({', '.join('?' for _ in job_types)})"
+            params.extend(job_types)
+
+        with self.db.transaction() as conn:
+            while True:
+                row = conn.execute(
+                    f'''
+                    SELECT * FROM jobs
+                    WHERE ((status = 'queued' AND available_at <= ?)
+                           OR (status = 'running' AND lease_expires_at < ?))
+                    {type_filter}
+                    ORDER BY priority,
+                             (SELECT COUNT(*) FROM jobs AS running
+                              WHERE running.fair_key = jobs.fair_key AND running.status = 'running'),
+                             available_at, id
+                    LIMIT 1
+                    ''',
+                    params
+                ).fetchone()
+                if not row:
+                    return None
+
+                # 租约过期且已达到最大尝试次数（如执行中进程反复崩溃）的任务转入死信
+                if row['status'] == 'running' and row['attempts'] >= row['max_attempts']:
+                    conn.execute(
+                        '''
+                        UPDATE jobs
+                        SET status = 'dead', lease_owner = NULL, lease_expires_at = NULL,
+                            last_error = COALESCE(last_error, '任务租约过期次数超过上限'),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ?
+                        ''',
+                        (row['id'],)
+                    )
+                    if dead_jobs is not None:
+                        dead_jobs.append(dict(row, status='dead',
+                                              last_error=row['last_error'] or '任务租约过期次数超过上限'))
+                    continue
+
+                conn.execute(
+                    '''
+                    UPDATE jobs
+                    SET status = 'running', lease_owner = ?, lease_expires_at = ?,
+                        attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    ''',
+                    (owner, now + lease_seconds, row['id'])
+                )
+                job = dict(row)
+                job.update(status='running', lease_owner=owner, lease_expires_at=now + lease_seconds,
+                           attempts=row['attempts'] + 1)
+                return job
+
+    def heartbeat_job(self, job_id: int, owner: str, lease_seconds: float) -> bool:
+        """延长任务租约，租约已被其他执行者接管时返回False"""
+        query = '''
+            UPDATE jobs
+            SET lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+        '''
+        with self.db.transaction() as conn:
+            cursor = conn.execute(query, (time.time() + lease_seconds, job_id, owner))
+            return cursor.rowcount == 1
+
+    def complete_job(self, job_id: int, owner: str, result: Optional[str] = None) -> bool:
+        """标记任务完成"""
+        query = '''
+            UPDATE jobs
+            SET status = 'completed', result = ?, lease_owner = NULL, lease_expires_at = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+        '''
+        with self.db.transaction() as conn:
+            cursor = conn.execute(query, (result, job_id, owner))
+            return cursor.rowcount == 1
+
+    def fail_job(self, job_id: int, owner: str, error: str, retry_at: Optional[float]) -> Optional[str]:
+        """记录任务失败：retry_at 不为空且未达到最大尝试次数时重新排队，否则转入死信，返回新状态"""
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (job_id, owner)
+            ).fetchone()
+            if not row:
+                return None
+            status = 'queued' if retry_at is not None and row['attempts'] < row['max_attempts'] else 'dead'
+            conn.execute(
+                '''
+                UPDATE jobs
+                SET status = ?, last_error = ?, available_at = COALESCE(?, available_at),
+                    lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                ''',
+                (status, error, retry_at if status == 'queued' else None, job_id)
+            )
+            return status
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """获取单个任务"""
+        query = 'SELECT * FROM jobs WHERE id = ?'
+        results = self.db.execute_query(query, (job_id,))
+        return results[0] if results else None
+
+    def has_active_job(self, dedupe_key: str) -> bool:
+        """是否存在指定去重键的排队中或执行中任务"""
+        query = "SELECT 1 FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running') LIMIT 1"
+        return bool(self.db.execute_query(query, (dedupe_key,)))
+
+    def get_job_counts(self) -> List[Dict[str, Any]]:
+        """按任务类型和状态统计任务数"""
+        query = 'SELECT job_type, status, COUNT(*) AS count FROM jobs GROUP BY job_type, status'
+        return self.db.execute_query(query)
+
+    # ==================== 生成进度操作 ====================
+
+    def get_progress(self, key: str) -> Optional[Dict[str, Any]]:
+        """获取未过期的进度记录"""
+        query = 'SELECT key, data, version, updated_at FROM progress WHERE key = ? AND expires_at > ?'
+        results = self.db.execute_query(query, (key, time.time()))
+        return results[0] if results else None
+
+    def update_progress(self, key: str, mutate, ttl: float, event_type: str = None) -> Optional[Dict[str, Any]]:
+        """在写事务中读取并更新进度记录
+
+        mutate 接收当前数据（不存在或已过期时为None），返回新数据，返回None表示不修改。
+        版本号在过期后继续递增，订阅者不会把新进度误认为旧进度。
+        指定 event_type 时在同一事务中记录一条以新数据为内容的进度事件。
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT data, version, expires_at FROM progress WHERE key = ?', (key,)).fetchone()
+            data = mutate(row['data'] if row and row['expires_at'] > now else None)
+            if data is None:
+                return None
+            version = (row['version'] if row else 0) + 1
+            conn.execute(
+                '''
+                INSERT INTO progress (key, data, version, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET data = excluded.data, version = excluded.version,
+                    expires_at = excluded.expires_at, updated_at = excluded.updated_at
+                ''',
+                (key, data, version, now + ttl, now)
+            )
+            event_id = None
+            if event_type:
+                event_id = conn.execute(
+                    'INSERT INTO progress_events (key, event_type, data, created_at) VALUES (?, ?, ?, ?)',
+                    (key, event_type, data, now)
+                ).lastrowid
+            return {'key': key, 'data': data, 'version': version, 'updated_at': now, 'event_id': event_id}
+
+    def delete_progress(self, key: str):
+        """删除进度记录"""
+        query = 'DELETE FROM progress WHERE key = ?'
+        self.db.execute_update(query, (key,))
+
+    def purge_expired_progress(self, event_ttl: float) -> int:
+        """删除已过期的进度记录和 event_ttl 秒前的进度事件，返回删除的进度记录数量"""
+        now = time.time()
+        with self.db.transaction() as conn:
+            cursor = conn.execute('DELETE FROM progress WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM progress_events WHERE created_at <= ?', (now - event_ttl,))
+            return cursor.rowcount
+
+    def add_progress_event(self, key: str, event_type: str, data: str) -> int:
+        """记录进度事件，返回事件ID"""
+        query = 'INSERT INTO progress_events (key, event_type, data, created_at) VALUES (?, ?, ?, ?)'
+        return self.db.execute_update(query, (key, event_type, data, time.time()))
+
+    def get_progress_events(self, key: str, after_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """获取指定ID之后的进度事件（按ID顺序）"""
+        query = '''
+            SELECT id, event_type, data FROM progress_events
+            WHERE key = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        '''
+        return self.db.execute_query(query, (key, after_id, limit))
+
+    def get_latest_progress_event_id(self, key: str) -> int:
+        """获取最新的进度事件ID（没有事件时为0）"""
+        query = 'SELECT COALESCE(MAX(id), 0) AS id FROM progress_events WHERE key = ?'
+        return self.db.execute_query(query, (key,))[0]['id']
+
+    def get_progress_markers(self, keys: List[str]) -> Dict[str, tuple]:
+        """指定键的变更标记 {键: (最新事件ID, 进度版本号)}，任意进程写入该键的进度或事件后改变"""
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' for _ in keys)
+        markers = {key: (0, 0) for key in keys}
+        query = f'SELECT key, MAX(id) AS id FROM progress_events WHERE key IN ({placeholders}) GROUP BY key'
+        for row in self.db.execute_query(query, tuple(keys)):
+            markers[row['key']] = (row['id'], 0)
+        query = f'SELECT key, version FROM progress WHERE key IN ({placeholders})'
+        for row in self.db.execute_query(query, tuple(keys)):
+            markers[row['key']] = (markers[row['key']][0], row['version'])
+        return markers
+
+    def count_progress(self) -> int:
+        """进度记录数"""
+        return self.db.execute_query('SELECT COUNT(*) AS count FROM progress')[0]['count']
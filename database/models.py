@@ -1,5 +1,6 @@
 """数据库模型定义"""
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
@@ -7,13 +8,15 @@ from typing import Optional, List, Dict, Any
 class Database:
     """数据库连接管理"""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, busy_timeout: float = 30, journal_mode: str = 'WAL'):
         self.db_path = db_path
+        self.busy_timeout = busy_timeout  # 等待其他连接（包括其他进程）释放写锁的最长秒数
+        self.journal_mode = journal_mode
         self.init_database()
 
     def get_connection(self):
         """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
         conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
         return conn
 
@@ -22,6 +25,10 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
 
+        # 日志模式保存在数据库文件中，WAL模式下读写互不阻塞，Web进程和执行者进程可以同时访问
+        if self.journal_mode:
+            cursor.execute(f'PRAGMA journal_mode={self.journal_mode}')
+
         # 创建工作空间表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS workspaces (
@@ -71,6 +78,17 @@ class Database:
             )
         ''')
 
+        # 添加 draft_mode 字段（如果不存在）：草稿模式下页面以最低分辨率生成
+        try:
+            cursor.execute("SELECT draft_mode FROM ppt_projects LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE ppt_projects ADD COLUMN draft_mode INTEGER DEFAULT 0")
+
+        # 按状态查找项目（启动时恢复中断的生成）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ppt_projects_status ON ppt_projects (status)
+        ''')
+
         # 创建PPT大纲表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS ppt_outlines (
@@ -113,9 +131,118 @@ class Database:
             )
         ''')
 
+        # 添加 image_size 和 prompt 字段（如果不存在）：记录页面实际生成的分辨率和完整提示词
+        try:
+            cursor.execute("SELECT image_size FROM ppt_pages LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE ppt_pages ADD COLUMN image_size TEXT")
+        try:
+            cursor.execute("SELECT prompt FROM ppt_pages LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE ppt_pages ADD COLUMN prompt TEXT")
+
+        # 添加 input_fingerprint 字段（如果不存在）：页面生成输入（提示词、样式参考、分辨率）的摘要，
+        # 同步时只重新生成指纹变化的页面
+        try:
+            cursor.execute("SELECT input_fingerprint FROM ppt_pages LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE ppt_pages ADD COLUMN input_fingerprint TEXT")
+
+        # 创建后台任务队列表（available_at、lease_expires_at 为Unix时间戳）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT DEFAULT 'queued',
+                dedupe_key TEXT,
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER DEFAULT 3,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at)
+        ''')
+
+        # 添加 priority 和 fair_key 字段（如果不存在）：领取任务时按优先级排序，同一优先级内
+        # 正在执行任务最少的 fair_key（工作区）优先
+        try:
+            cursor.execute("SELECT priority FROM jobs LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER DEFAULT 2")
+        try:
+            cursor.execute("SELECT fair_key FROM jobs LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute("ALTER TABLE jobs ADD COLUMN fair_key TEXT")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_fair_key ON jobs (fair_key, status)
+        ''')
+        # 同一去重键同时只允许一个排队中或执行中的任务
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_dedupe ON jobs (dedupe_key)
+            WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')
+        ''')
+
+        # 创建生成进度表（data 为JSON，version 每次更新加1，expires_at 为Unix时间戳）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS progress (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_progress_expires ON progress (expires_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_progress_updated ON progress (updated_at)
+        ''')
+
+        # 创建生成进度事件表（id 作为SSE事件ID，断线重连时从该ID之后继续推送）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS progress_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_progress_events_key ON progress_events (key, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_progress_events_created ON progress_events (created_at)
+        ''')
+
         conn.commit()
         conn.close()
 
+    @contextmanager
+    def transaction(self):
+        """写事务（BEGIN IMMEDIATE 立即获取写锁，多个进程同时领取任务时不会重复领取）"""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         """执行查询并返回结果"""
         conn = self.get_connection()
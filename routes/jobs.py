@@ -0,0 +1,26 @@
+"""后台任务查询路由"""
+from flask import Blueprint, jsonify
+from services.job_queue import JobQueue
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# 返回给前端的任务字段（不包含租约等内部信息）
+JOB_FIELDS = ('id', 'job_type', 'status', 'priority', 'attempts', 'max_attempts', 'last_error', 'result',
+              'created_at', 'updated_at')
+
+
+def init_routes(job_queue: JobQueue):
+    """初始化路由"""
+
+    @jobs_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+    def get_job(job_id):
+        """获取任务状态和结果"""
+        try:
+            job = job_queue.get_job(job_id)
+            if not job:
+                return jsonify({'success': False, 'error': '任务不存在'}), 404
+            return jsonify({'success': True, 'data': {field: job[field] for field in JOB_FIELDS}})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jobs_bp
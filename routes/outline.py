@@ -2,18 +2,18 @@
 from flask import Blueprint, request, jsonify, render_template
 from database.db_manager import DBManager
 from services.gemini_service import GeminiService
+from services.outline_generator import OutlineGenerator
 
 outline_bp = Blueprint('outline', __name__)
 
 
-def init_routes(db_manager: DBManager, gemini_service: GeminiService):
+def init_routes(db_manager: DBManager, gemini_service: GeminiService, outline_generator: OutlineGenerator):
     """初始化路由"""
 
     @outline_bp.route('/api/ppt/<int:project_id>/outline/generate', methods=['POST'])
     def generate_outline(project_id):
-        """生成PPT大纲"""
+        """提交大纲生成任务（由后台执行者执行，通过 /api/jobs/<任务ID> 查询结果）"""
         try:
-            print(f"[大纲生成] 开始生成项目 {project_id} 的大纲")
             project = db_manager.get_ppt_project(project_id)
             if not project:
                 print(f"[大纲生成] 项目 {project_id} 不存在")
@@ -23,44 +23,9 @@ def init_routes(db_manager: DBManager, gemini_service: GeminiService):
             data = request.get_json(silent=True) or {}
             custom_prompt = data.get('custom_prompt')  # 自定义提示词（可选）
 
-            print(f"[大纲生成] 获取知识库文本，工作区ID: {project['workspace_id']}")
-            # 获取知识库文本
-            knowledge_text = db_manager.get_workspace_knowledge_text(project['workspace_id'])
-            print(f"[大纲生成] 知识库文本长度: {len(knowledge_text)} 字符")
-
-            print(f"[大纲生成] 调用Gemini API生成大纲，期望页数: {project['expected_pages']}")
-            # 调用Gemini生成大纲
-            if custom_prompt:
-                print(f"[大纲生成] 使用自定义提示词")
-                outline_data = gemini_service.generate_outline_with_custom_prompt(custom_prompt)
-            else:
-                outline_data = gemini_service.generate_outline(
-                    knowledge_text,
-                    project['user_prompt'],
-                    project['expected_pages']
-                )
-            print(f"[大纲生成] Gemini API返回成功，生成了 {len(outline_data.get('pages', []))} 页")
-
-            # 删除旧大纲
-            db_manager.delete_outline_pages(project_id)
-            print(f"[大纲生成] 已删除旧大纲")
-
-            # 保存新大纲
-            for page in outline_data['pages']:
-                db_manager.add_outline_page(
-                    project_id,
-                    page['page_number'],
-                    page['title'],
-                    page['content'],
-                    page.get('image_prompt', '')
-                )
-            print(f"[大纲生成] 已保存新大纲到数据库")
-
-            # 更新项目状态
-            db_manager.update_ppt_project_status(project_id, 'outline_generated')
-            print(f"[大纲生成] 项目状态已更新为 outline_generated")
-
-            return jsonify({'success': True, 'data': outline_data})
+            job_id = outline_generator.start_generation(project_id, custom_prompt)
+            print(f"[大纲生成] 项目 {project_id} 的大纲生成任务已提交，任务ID: {job_id}")
+            return jsonify({'success': True, 'data': {'job_id': job_id}})
         except Exception as e:
             print(f"[大纲生成] 发生错误: {str(e)}")
             import traceback
@@ -2,18 +2,30 @@
 from flask import Blueprint, request, jsonify, render_template, Response, send_file
 import json
 import os
-import zipfile
-import io
 from database.db_manager import DBManager
 from services.banana_service import BananaService
 from services.ppt_generator import PPTGenerator
+from services.static_assets import StaticAssetService
+from services.zip_stream import ZipStream, attachment_headers
+from services.deck_exporter import DeckExporter, PPTX_MIMETYPE, PDF_MIMETYPE
+from services.export_artifacts import ExportArtifactService, export_pages
 
 ppt_bp = Blueprint('ppt', __name__)
 
 
-def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_generator: PPTGenerator):
+def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_generator: PPTGenerator,
+                static_assets: StaticAssetService, deck_exporter: DeckExporter,
+                export_artifacts: ExportArtifactService):
     """初始化路由"""
 
+    def send_artifact(project, pages, kind, mimetype, download_name):
+        """发送预先生成的导出文件，不存在或已过期时返回None"""
+        path, fingerprint = export_artifacts.get(project, pages, kind)
+        if not path:
+            return None
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                         conditional=True, etag=f'{fingerprint}-{kind}')
+
     @ppt_bp.route('/api/workspaces/<int:workspace_id>/ppt', methods=['GET'])
     def get_workspace_ppt_projects(workspace_id):
         """获取工作空间的所有PPT项目"""
@@ -72,10 +84,29 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
                 return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
 
             db_manager.delete_ppt_project(project_id)
+            export_artifacts.remove(project_id)
             return jsonify({'success': True})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    @ppt_bp.route('/api/ppt/<int:project_id>/draft-mode', methods=['POST'])
+    def set_draft_mode(project_id):
+        """开启或关闭草稿模式（草稿模式下页面以最低分辨率生成）"""
+        try:
+            project = db_manager.get_ppt_project(project_id)
+            if not project:
+                return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
+
+            data = request.get_json(silent=True)
+            if not data or 'enabled' not in data:
+                return jsonify({'success': False, 'error': '请求数据为空'}), 400
+
+            draft_mode = bool(data['enabled'])
+            db_manager.update_ppt_project_draft_mode(project_id, draft_mode)
+            return jsonify({'success': True, 'data': {'draft_mode': draft_mode}})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @ppt_bp.route('/api/ppt/<int:project_id>/styles/generate', methods=['POST'])
     def generate_styles(project_id):
         """生成样式模板（异步）"""
@@ -92,23 +123,14 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
             # 获取自定义提示词（可选，使用 silent=True 避免空请求体时抛出异常）
             data = request.get_json(silent=True) or {}
             custom_prompt = data.get('custom_prompt', '').strip()
+            use_cache = not data.get('bypass_cache', False)  # 跳过图片结果缓存（可选）
 
-            # 在新线程中异步生成样式模板
-            def generate_async():
-                try:
-                    logger.info(f"开始异步生成样式模板: project_id={project_id}, custom_prompt={custom_prompt}")
-                    ppt_generator.generate_style_templates(project_id, project, custom_prompt=custom_prompt)
-                    logger.info(f"样式模板生成完成: project_id={project_id}")
-                except Exception as e:
-                    logger.error(f"样式模板生成失败: project_id={project_id}, error={str(e)}")
-
-            import threading
-            thread = threading.Thread(target=generate_async)
-            thread.daemon = True
-            thread.start()
-            logger.info(f"样式生成线程已启动: project_id={project_id}")
-
-            return jsonify({'success': True, 'message': '样式生成任务已启动'})
+            # 提交后台任务异步生成样式模板
+            job_id = ppt_generator.start_style_generation(project_id, custom_prompt=custom_prompt,
+                                                          use_cache=use_cache)
+            logger.info(f"样式生成任务已提交: project_id={project_id}, job_id={job_id}")
+
+            return jsonify({'success': True, 'message': '样式生成任务已启动', 'data': {'job_id': job_id}})
         except Exception as e:
             logger.error(f"启动样式生成失败: {str(e)}")
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -117,12 +139,12 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
     def get_styles_status(project_id):
         """获取样式生成进度"""
         try:
-            status = ppt_generator.style_generation_status.get(project_id, {
+            status = ppt_generator.get_style_generation_status(project_id) or {
                 'current': 0,
                 'total': 3,
                 'status': 'idle',
                 'message': '未开始'
-            })
+            }
             return jsonify({'success': True, 'data': status})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -132,6 +154,7 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
         """获取样式模板列表"""
         try:
             styles = db_manager.get_style_templates(project_id)
+            static_assets.add_urls(styles)
             return jsonify({'success': True, 'data': styles})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -165,6 +188,9 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
                 return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
 
             pages = db_manager.get_ppt_pages(project_id)
+            for page in pages:
+                page['is_draft'] = ppt_generator.is_draft_page(page)
+            static_assets.add_urls(pages)
             return jsonify({'success': True, 'data': pages})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -210,10 +236,13 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
             project = db_manager.get_ppt_project(project_id)
             if not project:
                 return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
+            if ppt_generator.is_stopping(project_id, project):
+                return jsonify({'success': False, 'error': '正在停止当前生成任务，请稍后再试'}), 409
 
             # 获取请求数据（使用 silent=True 避免空请求体时抛出异常）
             data = request.get_json(silent=True) or {}
             custom_prompts = data.get('custom_prompts')  # 自定义提示词列表（可选）
+            use_cache = not data.get('bypass_cache', False)  # 跳过图片结果缓存（可选）
 
             # 检查是否需要恢复
             if project['status'] == 'generating':
@@ -222,10 +251,10 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
                 if resumed:
                     return jsonify({'success': True, 'message': '已恢复生成任务'})
 
-            # 启动生成任务（异步）
-            ppt_generator.start_generation(project_id, custom_prompts)
+            # 提交生成任务（异步）
+            job_id = ppt_generator.start_generation(project_id, custom_prompts, use_cache=use_cache)
 
-            return jsonify({'success': True})
+            return jsonify({'success': True, 'data': {'job_id': job_id}})
         except Exception as e:
             logger.error(f"启动生成失败: {str(e)}")
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -238,6 +267,8 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
 
         try:
             logger.info(f"收到恢复生成请求: project_id={project_id}")
+            if ppt_generator.is_stopping(project_id):
+                return jsonify({'success': False, 'error': '正在停止当前生成任务，请稍后再试'}), 409
             resumed = ppt_generator.resume_generation(project_id)
 
             if resumed:
@@ -248,17 +279,92 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
             logger.error(f"恢复生成失败: {str(e)}")
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    @ppt_bp.route('/api/ppt/<int:project_id>/pages/pause', methods=['POST'])
+    def pause_pages(project_id):
+        """暂停页面生成（进行中的页面完成后停止）"""
+        return _stop_pages(project_id, ppt_generator.pause_generation)
+
+    @ppt_bp.route('/api/ppt/<int:project_id>/pages/cancel', methods=['POST'])
+    def cancel_pages(project_id):
+        """取消页面生成（中断进行中的页面）"""
+        return _stop_pages(project_id, ppt_generator.cancel_generation)
+
+    def _stop_pages(project_id, stop):
+        try:
+            if not db_manager.get_ppt_project(project_id):
+                return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
+            if not stop(project_id):
+                return jsonify({'success': False, 'error': '项目不在生成中'}), 400
+            return jsonify({'success': True})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @ppt_bp.route('/api/ppt/<int:project_id>/pages/finalize', methods=['POST'])
+    def finalize_pages(project_id):
+        """以最终分辨率重新生成草稿页面（异步）"""
+        try:
+            project = db_manager.get_ppt_project(project_id)
+            if not project:
+                return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
+            if project['status'] == 'generating' or ppt_generator.is_stopping(project_id, project):
+                return jsonify({'success': False, 'error': '项目正在生成中，请等待完成后再定稿'}), 400
+
+            # 要定稿的页码（可选，不传时定稿所有草稿页）
+            data = request.get_json(silent=True) or {}
+            page_numbers = data.get('page_numbers')
+            if page_numbers is not None and not isinstance(page_numbers, list):
+                return jsonify({'success': False, 'error': '无效的页码列表'}), 400
+
+            numbers = ppt_generator.finalize_pages(project_id, page_numbers)
+            if not numbers:
+                return jsonify({'success': False, 'error': '没有需要定稿的草稿页面'}), 400
+
+            return jsonify({'success': True, 'data': {'page_numbers': numbers}})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @ppt_bp.route('/api/ppt/<int:project_id>/pages/sync', methods=['POST'])
+    def sync_pages(project_id):
+        """只重新生成大纲、样式或分辨率变化的页面（异步）"""
+        try:
+            project = db_manager.get_ppt_project(project_id)
+            if not project:
+                return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
+            if project['status'] == 'generating' or ppt_generator.is_stopping(project_id, project):
+                return jsonify({'success': False, 'error': '项目正在生成中，请等待完成后再同步'}), 400
+
+            numbers = ppt_generator.sync_pages(project_id)
+            return jsonify({'success': True, 'data': {'page_numbers': numbers}})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @ppt_bp.route('/api/ppt/<int:project_id>/pages/status')
     def get_pages_status(project_id):
-        """获取生成进度（SSE）"""
+        """获取生成进度（SSE，断线重连时浏览器携带 Last-Event-ID，从断点继续推送）"""
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
         def generate():
+            yield 'retry: 3000\n\n'
             try:
-                for progress in ppt_generator.get_generation_progress(project_id):
-                    yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
+                for event in ppt_generator.stream_generation_events(project_id, last_event_id):
+                    if event is None:
+                        yield ': heartbeat\n\n'  # 保持连接，避免被代理超时断开
+                        continue
+                    event_id, event_type, data = event
+                    if event_type == 'page':
+                        data['image_url'] = static_assets.url_for(data.get('image_path'))
+                        data['is_draft'] = ppt_generator.is_draft_page(data)
+                    message = f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                    yield f"id: {event_id}\n{message}" if event_id is not None else message
             except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+                yield f"event: progress\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
 
-        return Response(generate(), mimetype='text/event-stream')
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
     @ppt_bp.route('/api/ppt/<int:project_id>/pages/<int:page_number>/regenerate', methods=['POST'])
     def regenerate_page(project_id, page_number):
@@ -271,8 +377,11 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
             # 获取自定义提示词（可选，使用 silent=True 避免空请求体时抛出异常）
             data = request.get_json(silent=True) or {}
             custom_prompt = data.get('custom_prompt', '').strip()
+            use_cache = not data.get('bypass_cache', False)  # 跳过图片结果缓存（可选）
 
-            result = ppt_generator.regenerate_single_page(project_id, page_number, custom_prompt=custom_prompt)
+            result = ppt_generator.regenerate_single_page(project_id, page_number, custom_prompt=custom_prompt,
+                                                          use_cache=use_cache)
+            result['image_url'] = static_assets.url_for(result.get('image_path'))
 
             return jsonify({'success': True, 'data': result})
         except Exception as e:
@@ -286,23 +395,76 @@ def init_routes(db_manager: DBManager, banana_service: BananaService, ppt_genera
             if not project:
                 return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
 
-            pages = db_manager.get_ppt_pages(project_id)
+            pages = export_pages(db_manager.get_ppt_pages(project_id))
+            download_name = f"{project['title']}_ppt.zip"
+
+            # 优先发送页面完成后预先生成的ZIP
+            response = send_artifact(project, pages, 'zip', 'application/zip', download_name)
+            if response:
+                return response
 
-            # 创建ZIP文件
-            memory_file = io.BytesIO()
-            with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for page in pages:
-                    if page['image_path'] and os.path.exists(page['image_path']):
-                        filename = f"page_{page['page_number']:03d}.png"
-                        zf.write(page['image_path'], filename)
-
-            memory_file.seek(0)
-            return send_file(
-                memory_file,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f"{project['title']}_ppt.zip"
-            )
+            # 流式生成ZIP文件（不压缩，边读边发送）
+            archive = ZipStream()
+            try:
+                for page_number, image_path in pages:
+                    archive.add_file(image_path, f"page_{page_number:03d}.png")
+                content_length = archive.content_length()
+            except Exception:
+                archive.close()
+                raise
+
+            headers = attachment_headers(download_name)
+            headers['Content-Length'] = str(content_length)
+            response = Response(archive.generate(), mimetype='application/zip', headers=headers,
+                                direct_passthrough=True)
+            response.call_on_close(archive.close)  # 客户端提前断开时也关闭文件
+            return response
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @ppt_bp.route('/api/ppt/<int:project_id>/export/<export_format>')
+    def export_deck(project_id, export_format):
+        """导出整套PPT（pptx 或 pdf，?lightweight=1 使用中等尺寸图片减小文件体积）"""
+        try:
+            if export_format not in ('pptx', 'pdf'):
+                return jsonify({'success': False, 'error': '不支持的导出格式'}), 400
+
+            project = db_manager.get_ppt_project(project_id)
+            if not project:
+                return jsonify({'success': False, 'error': 'PPT项目不存在'}), 404
+
+            pages = export_pages(db_manager.get_ppt_pages(project_id))
+            if not pages:
+                return jsonify({'success': False, 'error': '没有已生成的页面'}), 400
+            image_paths = [image_path for _, image_path in pages]
+
+            lightweight = request.args.get('lightweight', '').lower() in ('1', 'true')
+            download_name = f"{project['title']}.{export_format}"
+            mimetype = PDF_MIMETYPE if export_format == 'pdf' else PPTX_MIMETYPE
+
+            # 完整分辨率导出优先发送预先生成的文件
+            if not lightweight:
+                response = send_artifact(project, pages, export_format, mimetype, download_name)
+                if response:
+                    return response
+
+            headers = attachment_headers(download_name)
+            if export_format == 'pdf':
+                return Response(deck_exporter.pdf_stream(project['title'], image_paths, lightweight),
+                                mimetype=PDF_MIMETYPE, headers=headers, direct_passthrough=True)
+
+            archive = deck_exporter.pptx_archive(project['title'], image_paths, lightweight)
+            try:
+                content_length = archive.content_length()
+            except Exception:
+                archive.close()
+                raise
+            if content_length is not None:
+                headers['Content-Length'] = str(content_length)
+            response = Response(archive.generate(), mimetype=PPTX_MIMETYPE, headers=headers,
+                                direct_passthrough=True)
+            response.call_on_close(archive.close)  # 客户端提前断开时也关闭文件
+            return response
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
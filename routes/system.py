@@ -0,0 +1,43 @@
+"""系统运行状态相关路由"""
+from flask import Blueprint, jsonify
+from services.http_transport import HTTPTransport
+from services.banana_service import BananaService
+from services.retry import RetryEngine
+from services.image_derivatives import ImageDerivativeService
+from services.export_artifacts import ExportArtifactService
+from services.job_queue import JobQueue, JobWorkerPool
+from services.progress_store import ProgressStore
+from services.scheduler import FairShareScheduler
+
+system_bp = Blueprint('system', __name__)
+
+
+def init_routes(http_transport: HTTPTransport, banana_service: BananaService, retry_engine: RetryEngine,
+                image_derivatives: ImageDerivativeService, export_artifacts: ExportArtifactService,
+                job_queue: JobQueue, job_workers: JobWorkerPool, progress_store: ProgressStore,
+                scheduler: FairShareScheduler):
+    """初始化路由"""
+
+    @system_bp.route('/api/system/status', methods=['GET'])
+    def get_system_status():
+        """获取系统运行状态（连接池、缓存统计等）"""
+        try:
+            return jsonify({'success': True, 'data': {
+                'http_transport': http_transport.get_stats(),
+                'rate_limiters': http_transport.rate_limiters.snapshot(),
+                'circuit_breakers': http_transport.circuit_breakers.snapshot(),
+                'retries': retry_engine.get_stats(),
+                'hedging': banana_service.hedger.get_stats(),
+                'reference_cache': banana_service.reference_cache.get_stats(),
+                'result_cache': banana_service.result_cache.get_stats() if banana_service.result_cache else None,
+                'image_derivatives': image_derivatives.get_stats(),
+                'export_artifacts': export_artifacts.get_stats(),
+                'jobs': job_queue.get_stats(),
+                'job_workers': job_workers.get_stats() if job_workers else None,
+                'progress': progress_store.get_stats(),
+                'scheduler': scheduler.get_stats()
+            }})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    return system_bp
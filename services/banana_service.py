@@ -1,21 +1,43 @@
 """Gemini图片生成API调用服务"""
 import os
-import time
+import uuid
 import logging
 import requests
-import base64
-import json
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from io import BytesIO
+from services.http_transport import HTTPTransport
+from services.rate_limiter import parse_retry_after
+from services.retry import RetryEngine, APIError
+from services.reference_cache import ReferenceImageCache
+from services.stream_decoder import InlineImageStreamDecoder
+from services.result_cache import ImageResultCache
+from services.hedging import RequestHedger
+from services.cancellation import OperationCancelled
 
 logger = logging.getLogger(__name__)
 
+STREAM_CHUNK_SIZE = 64 * 1024  # 流式读取响应的分块大小
+
 
 class BananaService:
     """Gemini图片生成服务（Nano Banana Pro）"""
 
-    def __init__(self, config):
+    def __init__(self, config, http_transport=None, retry_engine=None):
         self.config = config
+        self.http = http_transport or HTTPTransport(config)
+        self.retry_engine = retry_engine or RetryEngine(config)
+        self.reference_cache = ReferenceImageCache(config.REFERENCE_CACHE_MAX_BYTES)
+        # 图片生成结果缓存（相同请求直接返回磁盘上的结果）
+        self.result_cache = None
+        if config.IMAGE_RESULT_CACHE_ENABLED:
+            self.result_cache = ImageResultCache(config.IMAGE_RESULT_CACHE_DIR, config.IMAGE_RESULT_CACHE_MAX_BYTES)
+        # 对冲请求（默认关闭，开启后慢请求会并行发出一个相同请求，先成功者胜出）
+        self.hedger = RequestHedger(config)
+        # 图片后处理线程池（格式转换等耗CPU的操作不占用请求线程）
+        self._postprocess_executor = ThreadPoolExecutor(
+            max_workers=max(1, config.IMAGE_POSTPROCESS_WORKERS),
+            thread_name_prefix='image-postprocess'
+        )
         self.api_key = config.BANANA_API_KEY
         self.api_base_url = config.BANANA_API_BASE_URL
         self.model_name = config.BANANA_MODEL
@@ -27,32 +49,18 @@ class BananaService:
         with open(prompt_path, 'r', encoding='utf-8') as f:
             return f.read()
 
-    def retry_api_call(self, func, max_retries=None):
-        """API调用重试机制"""
-        if max_retries is None:
-            max_retries = self.config.MAX_API_RETRIES
+    def retry_api_call(self, func, policy_name='image', cancel_token=None):
+        """API调用重试机制（按调用点策略分类错误、抖动退避并限制总时长）"""
+        return self.retry_engine.run(func, policy_name, cancel_token)
 
-        for attempt in range(max_retries):
-            try:
-                logger.debug(f"API调用尝试 {attempt + 1}/{max_retries}")
-                return func()
-            except Exception as e:
-                logger.warning(f"API调用失败 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-                if attempt == max_retries - 1:
-                    logger.error(f'API调用失败，已重试{max_retries}次: {str(e)}')
-                    raise Exception(f'API调用失败，已重试{max_retries}次: {str(e)}')
-                # 指数退避
-                wait_time = self.config.RETRY_DELAY_BASE ** attempt
-                logger.info(f"等待 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
-
-    def generate_image(self, prompt, output_path, aspect_ratio="16:9", image_size="2K"):
-        """使用Gemini生成图片"""
+    def generate_image(self, prompt, output_path, aspect_ratio="16:9", image_size="2K", use_cache=True,
+                       cancel_token=None):
+        """使用Gemini生成图片（use_cache=False 时跳过结果缓存，cancel_token 取消时中断请求和重试）"""
         logger.info(f"开始生成图片: {output_path}")
         logger.debug(f"提示词: {prompt[:100]}...")
         logger.info(f"图片配置: 比例={aspect_ratio}, 尺寸={image_size}")
 
-        def api_call():
+        def api_call(cancel_token=None):
             logger.info(f"调用Gemini {self.model_name} 生成图片")
 
             # 构建API URL
@@ -100,58 +108,29 @@ class BananaService:
             
             try:
                 # 发送请求
-                response = requests.post(
+                with self.http.stream_post(
                     api_url,
+                    endpoint=f"{self.model_name}:streamGenerateContent",
+                    cancel_token=cancel_token,
                     json=request_body,
                     headers=headers,
-                    params=params,
-                    timeout=self.config.API_TIMEOUT
-                )
-                
-                logger.info(f"API 返回，状态码: {response.status_code}")
-                
-                # 检查响应状态
-                if response.status_code != 200:
-                    logger.error(f"API 返回错误: {response.text}")
-                    raise Exception(f"API返回错误状态码 {response.status_code}: {response.text}")
-                
-                # 解析响应
-                response_data = response.json()
-                logger.debug(f"响应数据类型: {type(response_data)}")
-
-                # 响应可能是数组或对象
-                if isinstance(response_data, list):
-                    response_data = response_data[0] if response_data else {}
-
-                # 提取图片数据
-                image_data = None
-                if 'candidates' in response_data:
-                    for candidate in response_data['candidates']:
-                        if 'content' in candidate and 'parts' in candidate['content']:
-                            for part in candidate['content']['parts']:
-                                if 'inlineData' in part:
-                                    image_data = part['inlineData']['data']
-                                    logger.info("从响应中提取图片数据")
-                                    break
-                        if image_data:
-                            break
-
-                if not image_data:
-                    logger.error(f"响应结构: {json.dumps(response_data, ensure_ascii=False)[:1000]}")
-                    raise Exception("Gemini未返回图片数据")
-                
-                # 解码base64图片数据
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(BytesIO(image_bytes))
-                
-                # 保存图片
-                image.save(output_path)
-                logger.info(f"图片已保存: {output_path}")
-                return output_path
+                    params=params
+                ) as response:
+                    logger.info(f"API 返回，状态码: {response.status_code}")
+
+                    # 检查响应状态
+                    if response.status_code != 200:
+                        logger.error(f"API 返回错误: {response.text}")
+                        raise APIError(f"API返回错误状态码 {response.status_code}: {response.text}",
+                                       status_code=response.status_code,
+                                       retry_after=parse_retry_after(response.headers.get('Retry-After')))
+
+                    # 流式解析响应，图片数据边下载边解码写入文件
+                    return self._save_streamed_image(response, output_path, cancel_token)
                 
             except requests.exceptions.Timeout:
                 logger.error(f"API 调用超时")
-                raise Exception(f"API调用超时（{self.config.API_TIMEOUT}秒）")
+                raise APIError(f"API调用超时（{self.http.read_timeout}秒）")
             except requests.exceptions.RequestException as e:
                 logger.error(f"请求异常: {type(e).__name__}: {str(e)}")
                 raise
@@ -159,8 +138,110 @@ class BananaService:
                 logger.error(f"API 调用异常: {type(e).__name__}: {str(e)}")
                 raise
 
-        # 调用重试机制，失败时抛出异常
-        return self.retry_api_call(api_call)
+        # 先查结果缓存，未命中时调用API（重试机制失败时抛出异常）
+        cache_key = self._result_cache_key(prompt, aspect_ratio, image_size, None, use_cache)
+        return self._generate_with_cache(cache_key, output_path, api_call, image_size, cancel_token)
+
+    def _result_cache_key(self, prompt, aspect_ratio, image_size, reference_image_path, use_cache):
+        """计算结果缓存键（未启用缓存或请求要求跳过时返回None）"""
+        if not use_cache or self.result_cache is None:
+            return None
+        return self.result_cache.make_key(self.model_name, prompt, aspect_ratio, image_size, reference_image_path)
+
+    def _generate_with_cache(self, cache_key, output_path, api_call, latency_key, cancel_token=None):
+        """命中缓存时直接返回磁盘上的结果，否则调用API并写入缓存（latency_key 用于按请求类型统计对冲阈值）"""
+        if cache_key and self.result_cache.fetch(cache_key, output_path):
+            image_format, _ = self._verify_image_header(output_path)
+            target_format = self._target_format(output_path)
+            if image_format != target_format and self.config.IMAGE_CONVERT_MISMATCHED_FORMAT:
+                self._schedule_format_conversion(output_path, target_format)
+            return output_path
+
+        result = self.retry_api_call(lambda token: self.hedger.run(latency_key, api_call, token),
+                                     cancel_token=cancel_token)
+        if cache_key:
+            self.result_cache.store(cache_key, output_path)
+        return result
+
+    def _save_streamed_image(self, response, output_path, cancel_token=None):
+        """从流式响应中提取图片并保存，不在内存中缓冲整个响应体"""
+        # 每次请求写入独立的临时文件，对冲的两个请求互不干扰
+        temp_path = f"{output_path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            with open(temp_path, 'wb') as f:
+                decoder = InlineImageStreamDecoder(f)
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    decoder.feed(chunk)
+                    if decoder.done:
+                        break
+                decoder.finish()
+
+            if not decoder.done:
+                logger.error(f"响应结构: {decoder.snippet[:1000]}")
+                raise Exception("Gemini未返回图片数据")
+            logger.info(f"从响应中提取图片数据: {decoder.bytes_written} 字节, 类型: {decoder.mime_type}")
+
+            # 只校验文件头和尺寸，不解码像素
+            image_format, image_size = self._verify_image_header(temp_path)
+            target_format = self._target_format(output_path)
+
+            # 对冲请求中只有先完成的请求写入输出文件
+            if cancel_token is not None and not cancel_token.claim():
+                raise OperationCancelled('请求已取消，丢弃结果')
+
+            # 快速路径：直接使用模型返回的原始字节，不经过 PIL 解码再编码
+            os.replace(temp_path, output_path)
+            if image_format == target_format:
+                logger.info(f"图片已保存: {output_path}, 格式: {image_format}, 尺寸: {image_size}")
+            else:
+                logger.info(f"图片已保存: {output_path}, 返回格式 {image_format} 与目标格式 {target_format} 不一致")
+                if self.config.IMAGE_CONVERT_MISMATCHED_FORMAT:
+                    self._schedule_format_conversion(output_path, target_format)
+            return output_path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _verify_image_header(self, image_path):
+        """校验图片文件头和尺寸（Image.open 只读取文件头，不解码像素数据）"""
+        try:
+            with Image.open(image_path) as image:
+                image_format, image_size = image.format, image.size
+        except Exception as e:
+            raise Exception(f"Gemini返回的图片数据无效: {str(e)}")
+        if not image_size[0] or not image_size[1]:
+            raise Exception(f"Gemini返回的图片尺寸无效: {image_size}")
+        return image_format, image_size
+
+    def _target_format(self, output_path):
+        """根据输出文件扩展名确定目标图片格式"""
+        extension = os.path.splitext(output_path)[1].lower()
+        return Image.registered_extensions().get(extension, 'PNG')
+
+    def _schedule_format_conversion(self, image_path, target_format):
+        """在后台后处理线程中将图片转换为目标格式"""
+        source_mtime = os.stat(image_path).st_mtime_ns
+        self._postprocess_executor.submit(self._convert_image_format, image_path, target_format, source_mtime)
+        logger.info(f"已提交后台格式转换: {image_path} -> {target_format}")
+
+    def _convert_image_format(self, image_path, target_format, source_mtime):
+        """转换图片格式（原子替换，文件已被重新生成时跳过）"""
+        temp_path = f"{image_path}.convert"
+        try:
+            with Image.open(image_path) as image:
+                image.save(temp_path, format=target_format)
+            if os.stat(image_path).st_mtime_ns != source_mtime:
+                logger.info(f"图片已被重新生成，跳过格式转换: {image_path}")
+                return
+            os.replace(temp_path, image_path)
+            logger.info(f"后台格式转换完成: {image_path} -> {target_format}")
+        except Exception as e:
+            logger.error(f"后台格式转换失败: {image_path}, {str(e)}")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
     def _create_placeholder_image(self, output_path, prompt):
         """创建占位图片（当API不可用时）"""
@@ -199,19 +280,17 @@ class BananaService:
         img.save(output_path)
         logger.info(f"占位图片已创建: {output_path}")
 
-    def generate_style_template(self, style_description, output_path):
+    def generate_style_template(self, style_description, output_path, use_cache=True):
         """生成样式模板"""
         prompt_template = self.load_prompt('style_template.txt')
         full_prompt = prompt_template.format(style_description=style_description)
         # 使用配置的样式模板分辨率
         aspect_ratio = self.config.IMAGE_ASPECT_RATIO
         image_size = self.config.STYLE_TEMPLATE_IMAGE_SIZE
-        return self.generate_image(full_prompt, output_path, aspect_ratio=aspect_ratio, image_size=image_size)
-
-    def generate_ppt_page(self, page_content, style_reference, output_path):
-        """生成PPT页面（基于样式模板）"""
-        logger.info(f"生成PPT页面，样式参考: {style_reference}")
+        return self.generate_image(full_prompt, output_path, aspect_ratio=aspect_ratio, image_size=image_size, use_cache=use_cache)
 
+    def build_page_prompt(self, page_content, style_reference):
+        """构建PPT页面的完整提示词"""
         # 加载提示词模板
         prompt_template = self.load_prompt('page_generation.txt')
 
@@ -221,42 +300,44 @@ class BananaService:
         else:
             style_desc = "使用现代简约的设计风格"
 
-        full_prompt = prompt_template.format(
+        return prompt_template.format(
             page_content=page_content,
             style_reference=style_desc
         )
 
-        # 使用配置的PPT页面分辨率
+    def generate_ppt_page(self, page_content, style_reference, output_path, use_cache=True, image_size=None):
+        """生成PPT页面（基于样式模板）"""
+        logger.info(f"生成PPT页面，样式参考: {style_reference}")
+        full_prompt = self.build_page_prompt(page_content, style_reference)
+        return self.render_page_prompt(full_prompt, style_reference, output_path, use_cache=use_cache, image_size=image_size)
+
+    def render_page_prompt(self, prompt, style_reference, output_path, use_cache=True, image_size=None,
+                           cancel_token=None):
+        """用完整提示词生成PPT页面（image_size 为空时使用配置的PPT页面分辨率，cancel_token 取消时中断生成）"""
         aspect_ratio = self.config.IMAGE_ASPECT_RATIO
-        image_size = self.config.PPT_PAGE_IMAGE_SIZE
+        image_size = image_size or self.config.PPT_PAGE_IMAGE_SIZE
 
         # 如果有样式模板，将其作为参考图片传入
         if style_reference and os.path.exists(style_reference):
             logger.info(f"使用样式模板图片: {style_reference}")
-            return self.generate_image_with_reference(full_prompt, style_reference, output_path, aspect_ratio=aspect_ratio, image_size=image_size)
+            return self.generate_image_with_reference(prompt, style_reference, output_path, aspect_ratio=aspect_ratio, image_size=image_size, use_cache=use_cache, cancel_token=cancel_token)
         else:
             logger.warning("没有样式模板参考，直接生成")
-            return self.generate_image(full_prompt, output_path, aspect_ratio=aspect_ratio, image_size=image_size)
+            return self.generate_image(prompt, output_path, aspect_ratio=aspect_ratio, image_size=image_size, use_cache=use_cache, cancel_token=cancel_token)
 
-    def generate_image_with_reference(self, prompt, reference_image_path, output_path, aspect_ratio="16:9", image_size="2K"):
-        """使用参考图片生成新图片（图片编辑功能）"""
+    def generate_image_with_reference(self, prompt, reference_image_path, output_path, aspect_ratio="16:9", image_size="2K", use_cache=True, cancel_token=None):
+        """使用参考图片生成新图片（图片编辑功能，use_cache=False 时跳过结果缓存，cancel_token 取消时中断请求和重试）"""
         logger.info(f"开始生成图片（带参考图片）: {output_path}")
         logger.debug(f"提示词: {prompt[:100]}...")
         logger.info(f"参考图片: {reference_image_path}")
         logger.info(f"图片配置: 比例={aspect_ratio}, 尺寸={image_size}")
 
-        def api_call():
+        # 加载参考图片的base64编码（同一模板在所有页面和重试之间复用缓存）
+        reference_mime_type, img_base64 = self.reference_cache.get_encoded(reference_image_path, 'PNG')
+
+        def api_call(cancel_token=None):
             logger.info(f"调用Gemini {self.model_name} 生成图片（带参考）")
 
-            # 加载参考图片并转换为base64
-            reference_image = Image.open(reference_image_path)
-            logger.info(f"参考图片已加载: {reference_image.size}")
-            
-            # 将图片转换为base64
-            buffered = BytesIO()
-            reference_image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            
             # 构建API URL
             api_url = f"{self.api_base_url}/v1beta/models/{self.model_name}:streamGenerateContent"
 
@@ -286,7 +367,7 @@ class BananaService:
                             },
                             {
                                 "inlineData": {
-                                    "mimeType": "image/png",
+                                    "mimeType": reference_mime_type,
                                     "data": img_base64
                                 }
                             }
@@ -308,58 +389,29 @@ class BananaService:
             
             try:
                 # 发送请求
-                response = requests.post(
+                with self.http.stream_post(
                     api_url,
+                    endpoint=f"{self.model_name}:streamGenerateContent",
+                    cancel_token=cancel_token,
                     json=request_body,
                     headers=headers,
-                    params=params,
-                    timeout=self.config.API_TIMEOUT
-                )
-                
-                logger.info(f"API 返回，状态码: {response.status_code}")
-                
-                # 检查响应状态
-                if response.status_code != 200:
-                    logger.error(f"API 返回错误: {response.text}")
-                    raise Exception(f"API返回错误状态码 {response.status_code}: {response.text}")
-                
-                # 解析响应
-                response_data = response.json()
-                logger.debug(f"响应数据类型: {type(response_data)}")
-
-                # 响应可能是数组或对象
-                if isinstance(response_data, list):
-                    response_data = response_data[0] if response_data else {}
-
-                # 提取图片数据
-                image_data = None
-                if 'candidates' in response_data:
-                    for candidate in response_data['candidates']:
-                        if 'content' in candidate and 'parts' in candidate['content']:
-                            for part in candidate['content']['parts']:
-                                if 'inlineData' in part:
-                                    image_data = part['inlineData']['data']
-                                    logger.info("从响应中提取图片数据")
-                                    break
-                        if image_data:
-                            break
-
-                if not image_data:
-                    logger.error(f"响应结构: {json.dumps(response_data, ensure_ascii=False)[:1000]}")
-                    raise Exception("Gemini未返回图片数据")
-                
-                # 解码base64图片数据
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(BytesIO(image_bytes))
-                
-                # 保存图片
-                image.save(output_path)
-                logger.info(f"图片已保存: {output_path}")
-                return output_path
+                    params=params
+                ) as response:
+                    logger.info(f"API 返回，状态码: {response.status_code}")
+
+                    # 检查响应状态
+                    if response.status_code != 200:
+                        logger.error(f"API 返回错误: {response.text}")
+                        raise APIError(f"API返回错误状态码 {response.status_code}: {response.text}",
+                                       status_code=response.status_code,
+                                       retry_after=parse_retry_after(response.headers.get('Retry-After')))
+
+                    # 流式解析响应，图片数据边下载边解码写入文件
+                    return self._save_streamed_image(response, output_path, cancel_token)
                 
             except requests.exceptions.Timeout:
                 logger.error(f"API 调用超时")
-                raise Exception(f"API调用超时（{self.config.API_TIMEOUT}秒）")
+                raise APIError(f"API调用超时（{self.http.read_timeout}秒）")
             except requests.exceptions.RequestException as e:
                 logger.error(f"请求异常: {type(e).__name__}: {str(e)}")
                 raise
@@ -367,5 +419,6 @@ class BananaService:
                 logger.error(f"API 调用异常: {type(e).__name__}: {str(e)}")
                 raise
 
-        # 调用重试机制，失败时抛出异常
-        return self.retry_api_call(api_call)
+        # 先查结果缓存，未命中时调用API（重试机制失败时抛出异常）
+        cache_key = self._result_cache_key(prompt, aspect_ratio, image_size, reference_image_path, use_cache)
+        return self._generate_with_cache(cache_key, output_path, api_call, f'{image_size}+reference', cancel_token)
@@ -0,0 +1,128 @@
+"""协作式取消令牌"""
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class OperationCancelled(Exception):
+    """操作已被取消"""
+
+
+class _Race:
+    """竞速的一组令牌：只有第一个提交结果的令牌有效"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = []
+        self.winner = None
+
+
+class CancelToken:
+    """取消令牌
+
+    - cancel() 后 cancelled 为True，并执行通过 register 登记的回调（如中断进行中的HTTP响应）
+    - child() 创建子令牌，父令牌取消时子令牌一并取消
+    - 同一竞速组（race_with）中的令牌提交结果前调用 claim()，先提交者胜出，其余令牌被取消
+    - deadline 为操作的截止时间（time.monotonic），子令牌继承父令牌更早的截止时间；
+      到期不会自动取消，由等待方（如限流许可）通过 remaining() 限制等待时长
+    """
+
+    def __init__(self, parent=None, deadline=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._children = []
+        self._race = None
+        self.reason = None
+        if parent is not None and parent.deadline is not None:
+            deadline = parent.deadline if deadline is None else min(deadline, parent.deadline)
+        self.deadline = deadline
+        if parent is not None:
+            parent._add_child(self)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def _add_child(self, child):
+        with self._lock:
+            if not self._event.is_set():
+                self._children.append(child)
+                return
+        child.cancel(self.reason)
+
+    def child(self):
+        """创建子令牌"""
+        return CancelToken(parent=self)
+
+    def remaining(self):
+        """距截止时间的秒数（没有截止时间时为None）"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def race_with(self, other):
+        """将 other 加入本令牌所在的竞速组"""
+        if self._race is None:
+            self._race = _Race()
+            self._race.tokens.append(self)
+        with self._race.lock:
+            self._race.tokens.append(other)
+        other._race = self._race
+        return other
+
+    def cancel(self, reason=None):
+        """取消操作并中断登记的进行中请求"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+            children, self._children = self._children, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"执行取消回调失败: {str(e)}")
+        for child in children:
+            child.cancel(reason)
+
+    def register(self, callback):
+        """登记取消时执行的回调（已取消时立即执行）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def unregister(self, callback):
+        """移除登记的回调"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 OperationCancelled"""
+        if self._event.is_set():
+            raise OperationCancelled(self.reason or '操作已取消')
+
+    def wait(self, timeout=None):
+        """等待取消（返回是否已取消），可用于可中断的 sleep"""
+        return self._event.wait(timeout)
+
+    def claim(self):
+        """即将提交结果时调用，返回False表示已取消或竞速中其他请求已提交，调用方应丢弃结果"""
+        race = self._race
+        if race is None:
+            return not self.cancelled
+        with race.lock:
+            if self.cancelled or race.winner not in (None, self):
+                return False
+            race.winner = self
+            losers = [token for token in race.tokens if token is not self]
+        for token in losers:
+            token.cancel('竞速请求已由其他请求完成')
+        return True
@@ -0,0 +1,130 @@
+"""模型端点熔断器（关闭 / 打开 / 半开）"""
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """端点熔断中，请求未发出直接失败"""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f'模型服务暂时不可用（{endpoint} 已熔断），约 {retry_in:.0f} 秒后恢复探测')
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """单个模型端点的熔断器
+
+    - 关闭：正常放行，连续失败（5xx、超时、连接错误）达到阈值后打开
+    - 打开：所有请求立即失败，recovery_timeout 秒后进入半开
+    - 半开：只放行少量探测请求，探测成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, name, failure_threshold, recovery_timeout, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = max(1, half_open_probes)
+
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._open_count = 0
+        self._rejected_count = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求发出前调用，熔断中时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    self._rejected_count += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                logger.info(f"端点 {self.name} 熔断器进入半开状态，开始探测")
+
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._rejected_count += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self._probes_in_flight += 1
+
+    def cancel_call(self):
+        """已通过 before_call 但请求最终未发出"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_success(self):
+        """请求完成且端点可用"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logger.info(f"端点 {self.name} 探测成功，熔断器关闭")
+            self.state = CLOSED
+            self._failures = 0
+            self._probes_in_flight = 0
+
+    def record_failure(self):
+        """请求因端点故障失败"""
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self._open_count += 1
+                    logger.warning(f"端点 {self.name} 连续失败 {self._failures} 次，熔断 {self.recovery_timeout} 秒")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes_in_flight = 0
+
+    def snapshot(self):
+        """获取熔断器状态"""
+        with self._lock:
+            retry_in = 0.0
+            if self.state == OPEN:
+                retry_in = max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'retry_in_seconds': round(retry_in, 2),
+                'opened': self._open_count,
+                'rejected': self._rejected_count
+            }
+
+
+class CircuitBreakerRegistry:
+    """进程内共享的熔断器注册表（每个模型端点一个熔断器）"""
+
+    def __init__(self, config):
+        self.config = config
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        """获取（或创建）端点对应的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    endpoint,
+                    failure_threshold=self.config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                    recovery_timeout=self.config.CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+                    half_open_probes=self.config.CIRCUIT_BREAKER_HALF_OPEN_PROBES
+                )
+                self._breakers[endpoint] = breaker
+            return breaker
+
+    def snapshot(self):
+        """获取所有端点的熔断状态"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {endpoint: breaker.snapshot() for endpoint, breaker in breakers.items()}
@@ -0,0 +1,53 @@
+"""服务层组装（Web进程和独立执行者进程共用）"""
+import logging
+from database.models import Database
+from database.db_manager import DBManager
+from services.file_processor import FileProcessor
+from services.gemini_service import GeminiService
+from services.banana_service import BananaService
+from services.ppt_generator import PPTGenerator
+from services.outline_generator import OutlineGenerator
+from services.http_transport import HTTPTransport
+from services.retry import RetryEngine
+from services.image_derivatives import ImageDerivativeService
+from services.static_assets import StaticAssetService
+from services.deck_exporter import DeckExporter
+from services.export_artifacts import ExportArtifactService
+from services.job_queue import JobQueue
+from services.progress_store import ProgressStore
+from services.scheduler import FairShareScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """按配置创建数据库和全部服务，并在任务队列中注册所有后台任务类型
+
+    Web进程和执行者进程使用相同的组装方式，因此任意一方提交的任务都可以由另一方执行。
+    """
+
+    def __init__(self, config):
+        # 初始化数据库
+        self.db = Database(config.DATABASE_PATH, config.DATABASE_BUSY_TIMEOUT, config.DATABASE_JOURNAL_MODE)
+        self.db_manager = DBManager(self.db)
+        logger.info("数据库初始化完成")
+
+        # 初始化服务
+        self.file_processor = FileProcessor(config)
+        self.http_transport = HTTPTransport(config)  # 文本和图片服务共用连接池
+        self.retry_engine = RetryEngine(config)  # 文本和图片服务共用重试引擎
+        self.gemini_service = GeminiService(config, self.http_transport, self.retry_engine)
+        self.banana_service = BananaService(config, self.http_transport, self.retry_engine)
+        self.image_derivatives = ImageDerivativeService(config)
+        self.static_assets = StaticAssetService(config)  # 图片URL版本化和HTTP缓存
+        self.deck_exporter = DeckExporter(config, self.image_derivatives)
+        self.export_artifacts = ExportArtifactService(config, self.db_manager, self.deck_exporter)
+        self.job_queue = JobQueue(config, self.db_manager)  # 持久化后台任务队列
+        self.progress_store = ProgressStore(config, self.db_manager)  # 多进程共享的生成进度
+        # 图片生成名额：按优先级（重新生成单页 > 样式 > 批量页面）和工作区/项目公平分配
+        self.scheduler = FairShareScheduler(config.MAX_CONCURRENT_PAGE_GENERATIONS)
+        self.outline_generator = OutlineGenerator(self.db_manager, self.gemini_service, self.job_queue)
+        self.ppt_generator = PPTGenerator(config, self.db_manager, self.banana_service, self.job_queue,
+                                          self.progress_store, self.image_derivatives, self.export_artifacts,
+                                          self.scheduler)
+        logger.info("服务层初始化完成")
@@ -0,0 +1,364 @@
+"""PPTX和PDF整套导出（逐页流式生成）"""
+import io
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+from PIL import Image
+from services.zip_stream import ZipStream
+
+logger = logging.getLogger(__name__)
+
+PPTX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+PDF_MIMETYPE = 'application/pdf'
+
+# 16:9 幻灯片尺寸：PPTX 使用 EMU（1英寸 = 914400），PDF 使用 pt（1英寸 = 72）
+SLIDE_WIDTH_EMU, SLIDE_HEIGHT_EMU = 12192000, 6858000
+SLIDE_WIDTH_PT, SLIDE_HEIGHT_PT = 960, 540
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+NS_A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_P = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+PRESENTATION_NS = f'xmlns:a="{NS_A}" xmlns:r="{NS_R}" xmlns:p="{NS_P}"'
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+CT_PREFIX = 'application/vnd.openxmlformats-officedocument.presentationml'
+
+EMPTY_SHAPE_TREE = (
+    '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+    '<p:grpSpPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/>'
+    '<a:chOff x="0" y="0"/><a:chExt cx="0" cy="0"/></a:xfrm></p:grpSpPr>'
+)
+
+THEME_XML = XML_HEADER + (
+    f'<a:theme xmlns:a="{NS_A}" name="Office Theme"><a:themeElements>'
+    '<a:clrScheme name="Office">'
+    '<a:dk1><a:sysClr val="windowText" lastClr="000000"/></a:dk1>'
+    '<a:lt1><a:sysClr val="window" lastClr="FFFFFF"/></a:lt1>'
+    '<a:dk2><a:srgbClr val="44546A"/></a:dk2><a:lt2><a:srgbClr val="E7E6E6"/></a:lt2>'
+    '<a:accent1><a:srgbClr val="4472C4"/></a:accent1><a:accent2><a:srgbClr val="ED7D31"/></a:accent2>'
+    '<a:accent3><a:srgbClr val="A5A5A5"/></a:accent3><a:accent4><a:srgbClr val="FFC000"/></a:accent4>'
+    '<a:accent5><a:srgbClr val="5B9BD5"/></a:accent5><a:accent6><a:srgbClr val="70AD47"/></a:accent6>'
+    '<a:hlink><a:srgbClr val="0563C1"/></a:hlink><a:folHlink><a:srgbClr val="954F72"/></a:folHlink>'
+    '</a:clrScheme>'
+    '<a:fontScheme name="Office">'
+    '<a:majorFont><a:latin typeface="Calibri Light"/><a:ea typeface=""/><a:cs typeface=""/></a:majorFont>'
+    '<a:minorFont><a:latin typeface="Calibri"/><a:ea typeface=""/><a:cs typeface=""/></a:minorFont>'
+    '</a:fontScheme>'
+    '<a:fmtScheme name="Office">'
+    '<a:fillStyleLst>' + '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>' * 3 + '</a:fillStyleLst>'
+    '<a:lnStyleLst>' + '<a:ln w="6350"><a:solidFill><a:schemeClr val="phClr"/></a:solidFill></a:ln>' * 3
+    + '</a:lnStyleLst>'
+    '<a:effectStyleLst>' + '<a:effectStyle><a:effectLst/></a:effectStyle>' * 3 + '</a:effectStyleLst>'
+    '<a:bgFillStyleLst>' + '<a:solidFill><a:schemeClr val="phClr"/></a:solidFill>' * 3 + '</a:bgFillStyleLst>'
+    '</a:fmtScheme>'
+    '</a:themeElements></a:theme>'
+)
+
+
+def _relationships(relations):
+    """生成关系文件（relations 为 (Id, 类型, 目标) 列表）"""
+    items = ''.join(
+        f'<Relationship Id="{rel_id}" Type="{rel_type}" Target="{target}"/>'
+        for rel_id, rel_type, target in relations
+    )
+    return XML_HEADER + (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'{items}</Relationships>'
+    )
+
+
+def _pdf_text(text):
+    """PDF文本字符串（UTF-16BE 十六进制，支持中文标题）"""
+    return '<FEFF' + text.encode('utf-16-be').hex().upper() + '>'
+
+
+class DeckExporter:
+    """将PPT页面图片导出为PPTX或PDF
+
+    每页图片铺满一张16:9幻灯片，按页码排序，并写入标题元数据。两种格式都逐页生成：
+    PPTX 基于流式ZIP，PNG/JPEG原图直接写入不做转换；PDF 逐页嵌入JPEG（DCTDecode），
+    同一时间只有一页图片在内存中。轻量导出使用中等尺寸的衍生图代替原图。
+    需要转换为JPEG的页面按 路径 + 修改时间 + 大小 缓存在磁盘上，未变化的页面不重复编码。
+    """
+
+    def __init__(self, config, image_derivatives=None):
+        self.jpeg_quality = config.EXPORT_JPEG_QUALITY
+        self.image_derivatives = image_derivatives
+        self.page_cache_dir = os.path.join(config.EXPORT_ARTIFACT_DIR, 'pages')
+        os.makedirs(self.page_cache_dir, exist_ok=True)
+
+    def _source_path(self, image_path, lightweight):
+        """导出使用的图片文件（轻量导出时为中等尺寸衍生图）"""
+        if lightweight and self.image_derivatives and self.image_derivatives.is_supported(image_path):
+            try:
+                return self.image_derivatives.get(image_path, 'medium')
+            except Exception as e:
+                logger.warning(f"获取衍生图失败，使用原图导出: {image_path}, {str(e)}")
+        return image_path
+
+    def _cached_jpeg_path(self, path):
+        """页面JPEG编码结果在缓存目录中的路径"""
+        stat = os.stat(path)
+        source_key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.page_cache_dir,
+                            f'{source_key}-{stat.st_mtime_ns}-{stat.st_size}-q{self.jpeg_quality}.jpg')
+
+    def prepare_page(self, image_path):
+        """预先编码页面的JPEG（页面生成完成后调用，导出时直接复用）"""
+        self._encode_jpeg(image_path)
+
+    def _encode_jpeg(self, path):
+        """将图片转换为JPEG，返回 (数据, 宽, 高, 颜色空间)"""
+        with Image.open(path) as image:
+            if image.format == 'JPEG' and image.mode in ('RGB', 'L'):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                return data, image.width, image.height, 'DeviceRGB' if image.mode == 'RGB' else 'DeviceGray'
+
+        cached_path = self._cached_jpeg_path(path)
+        if os.path.exists(cached_path):
+            with Image.open(cached_path) as image:
+                width, height = image.size
+            with open(cached_path, 'rb') as f:
+                return f.read(), width, height, 'DeviceRGB'
+
+        with Image.open(path) as image:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=self.jpeg_quality)
+            data, width, height = buffer.getvalue(), image.width, image.height
+
+        # 原子写入缓存，并删除同一页面的旧编码结果
+        temp_path = f'{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, cached_path)
+        prefix = os.path.basename(cached_path).split('-', 1)[0] + '-'
+        for name in os.listdir(self.page_cache_dir):
+            if name.startswith(prefix) and name != os.path.basename(cached_path) and not name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.page_cache_dir, name))
+                except OSError:
+                    pass
+        return data, width, height, 'DeviceRGB'
+
+    # ==================== PPTX ====================
+
+    def pptx_archive(self, title, image_paths, lightweight=False):
+        """生成PPTX的流式ZIP归档（image_paths 按页码排序）"""
+        archive = ZipStream()
+        try:
+            media = [self._add_pptx_media(archive, index, path, lightweight)
+                     for index, path in enumerate(image_paths, start=1)]
+            self._add_pptx_parts(archive, title, media)
+        except Exception:
+            archive.close()
+            raise
+        return archive
+
+    def _add_pptx_media(self, archive, index, image_path, lightweight):
+        """添加一页的图片，返回媒体文件名"""
+        path = self._source_path(image_path, lightweight)
+        with Image.open(path) as image:
+            image_format = image.format
+        if image_format in ('PNG', 'JPEG'):
+            name = f'image{index}.{image_format.lower()}'
+            archive.add_file(path, f'ppt/media/{name}')
+        else:
+            # WebP等格式PowerPoint不一定支持，发送到该页时再转换为JPEG
+            name = f'image{index}.jpeg'
+            archive.add_lazy(lambda: self._encode_jpeg(path)[0], f'ppt/media/{name}')
+        return name
+
+    def _add_pptx_parts(self, archive, title, media):
+        """添加PPTX的XML部件（幻灯片、母版、版式、主题和文档属性）"""
+        slide_count = len(media)
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        slide_overrides = ''.join(
+            f'<Override PartName="/ppt/slides/slide{i}.xml" ContentType="{CT_PREFIX}.slide+xml"/>'
+            for i in range(1, slide_count + 1)
+        )
+        archive.add_bytes((XML_HEADER + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Default Extension="png" ContentType="image/png"/>'
+            '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+            f'<Override PartName="/ppt/presentation.xml" ContentType="{CT_PREFIX}.presentation.main+xml"/>'
+            f'<Override PartName="/ppt/slideMasters/slideMaster1.xml" ContentType="{CT_PREFIX}.slideMaster+xml"/>'
+            f'<Override PartName="/ppt/slideLayouts/slideLayout1.xml" ContentType="{CT_PREFIX}.slideLayout+xml"/>'
+            '<Override PartName="/ppt/theme/theme1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.theme+xml"/>'
+            f'<Override PartName="/ppt/presProps.xml" ContentType="{CT_PREFIX}.presProps+xml"/>'
+            f'<Override PartName="/ppt/viewProps.xml" ContentType="{CT_PREFIX}.viewProps+xml"/>'
+            f'<Override PartName="/ppt/tableStyles.xml" ContentType="{CT_PREFIX}.tableStyles+xml"/>'
+            '<Override PartName="/docProps/core.xml" '
+            'ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+            '<Override PartName="/docProps/app.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.extended-properties+xml"/>'
+            f'{slide_overrides}</Types>'
+        )).encode('utf-8'), '[Content_Types].xml')
+
+        archive.add_bytes(_relationships([
+            ('rId1', f'{REL_TYPE}/officeDocument', 'ppt/presentation.xml'),
+            ('rId2', 'http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties',
+             'docProps/core.xml'),
+            ('rId3', f'{REL_TYPE}/extended-properties', 'docProps/app.xml'),
+        ]).encode('utf-8'), '_rels/.rels')
+
+        archive.add_bytes((XML_HEADER + (
+            '<cp:coreProperties '
+            'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            f'<dc:title>{escape(title)}</dc:title><dc:creator>EasyAIPPT</dc:creator>'
+            f'<dcterms:created xsi:type="dcterms:W3CDTF">{now}</dcterms:created>'
+            f'<dcterms:modified xsi:type="dcterms:W3CDTF">{now}</dcterms:modified>'
+            '</cp:coreProperties>'
+        )).encode('utf-8'), 'docProps/core.xml')
+
+        archive.add_bytes((XML_HEADER + (
+            '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+            f'<Application>EasyAIPPT</Application><Slides>{slide_count}</Slides></Properties>'
+        )).encode('utf-8'), 'docProps/app.xml')
+
+        slide_ids = ''.join(
+            f'<p:sldId id="{255 + i}" r:id="rId{i + 1}"/>' for i in range(1, slide_count + 1)
+        )
+        archive.add_bytes((XML_HEADER + (
+            f'<p:presentation {PRESENTATION_NS}>'
+            '<p:sldMasterIdLst><p:sldMasterId id="2147483648" r:id="rId1"/></p:sldMasterIdLst>'
+            f'<p:sldIdLst>{slide_ids}</p:sldIdLst>'
+            f'<p:sldSz cx="{SLIDE_WIDTH_EMU}" cy="{SLIDE_HEIGHT_EMU}"/>'
+            '<p:notesSz cx="6858000" cy="9144000"/>'
+            '</p:presentation>'
+        )).encode('utf-8'), 'ppt/presentation.xml')
+
+        extra = slide_count + 2
+        archive.add_bytes(_relationships(
+            [('rId1', f'{REL_TYPE}/slideMaster', 'slideMasters/slideMaster1.xml')]
+            + [(f'rId{i + 1}', f'{REL_TYPE}/slide', f'slides/slide{i}.xml') for i in range(1, slide_count + 1)]
+            + [(f'rId{extra}', f'{REL_TYPE}/presProps', 'presProps.xml'),
+               (f'rId{extra + 1}', f'{REL_TYPE}/viewProps', 'viewProps.xml'),
+               (f'rId{extra + 2}', f'{REL_TYPE}/theme', 'theme/theme1.xml'),
+               (f'rId{extra + 3}', f'{REL_TYPE}/tableStyles', 'tableStyles.xml')]
+        ).encode('utf-8'), 'ppt/_rels/presentation.xml.rels')
+
+        archive.add_bytes((XML_HEADER + f'<p:presentationPr {PRESENTATION_NS}/>').encode('utf-8'),
+                          'ppt/presProps.xml')
+        archive.add_bytes((XML_HEADER + f'<p:viewPr {PRESENTATION_NS}/>').encode('utf-8'), 'ppt/viewProps.xml')
+        archive.add_bytes((XML_HEADER + (
+            f'<a:tblStyleLst xmlns:a="{NS_A}" def="{{5C22544A-7EE6-4342-B048-85BDC9FD1C3A}}"/>'
+        )).encode('utf-8'), 'ppt/tableStyles.xml')
+        archive.add_bytes(THEME_XML.encode('utf-8'), 'ppt/theme/theme1.xml')
+
+        archive.add_bytes((XML_HEADER + (
+            f'<p:sldMaster {PRESENTATION_NS}>'
+            f'<p:cSld><p:spTree>{EMPTY_SHAPE_TREE}</p:spTree></p:cSld>'
+            '<p:clrMap bg1="lt1" tx1="dk1" bg2="lt2" tx2="dk2" accent1="accent1" accent2="accent2" '
+            'accent3="accent3" accent4="accent4" accent5="accent5" accent6="accent6" '
+            'hlink="hlink" folHlink="folHlink"/>'
+            '<p:sldLayoutIdLst><p:sldLayoutId id="2147483649" r:id="rId1"/></p:sldLayoutIdLst>'
+            '</p:sldMaster>'
+        )).encode('utf-8'), 'ppt/slideMasters/slideMaster1.xml')
+        archive.add_bytes(_relationships([
+            ('rId1', f'{REL_TYPE}/slideLayout', '../slideLayouts/slideLayout1.xml'),
+            ('rId2', f'{REL_TYPE}/theme', '../theme/theme1.xml'),
+        ]).encode('utf-8'), 'ppt/slideMasters/_rels/slideMaster1.xml.rels')
+
+        archive.add_bytes((XML_HEADER + (
+            f'<p:sldLayout {PRESENTATION_NS} type="blank" preserve="1">'
+            f'<p:cSld name="Blank"><p:spTree>{EMPTY_SHAPE_TREE}</p:spTree></p:cSld>'
+            '<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr>'
+            '</p:sldLayout>'
+        )).encode('utf-8'), 'ppt/slideLayouts/slideLayout1.xml')
+        archive.add_bytes(_relationships([
+            ('rId1', f'{REL_TYPE}/slideMaster', '../slideMasters/slideMaster1.xml'),
+        ]).encode('utf-8'), 'ppt/slideLayouts/_rels/slideLayout1.xml.rels')
+
+        for index, name in enumerate(media, start=1):
+            archive.add_bytes((XML_HEADER + (
+                f'<p:sld {PRESENTATION_NS}><p:cSld><p:spTree>{EMPTY_SHAPE_TREE}'
+                '<p:pic><p:nvPicPr>'
+                f'<p:cNvPr id="2" name="Page {index}"/>'
+                '<p:cNvPicPr><a:picLocks noChangeAspect="1"/></p:cNvPicPr><p:nvPr/></p:nvPicPr>'
+                '<p:blipFill><a:blip r:embed="rId2"/><a:stretch><a:fillRect/></a:stretch></p:blipFill>'
+                '<p:spPr><a:xfrm><a:off x="0" y="0"/>'
+                f'<a:ext cx="{SLIDE_WIDTH_EMU}" cy="{SLIDE_HEIGHT_EMU}"/></a:xfrm>'
+                '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr>'
+                '</p:pic></p:spTree></p:cSld>'
+                '<p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sld>'
+            )).encode('utf-8'), f'ppt/slides/slide{index}.xml')
+            archive.add_bytes(_relationships([
+                ('rId1', f'{REL_TYPE}/slideLayout', '../slideLayouts/slideLayout1.xml'),
+                ('rId2', f'{REL_TYPE}/image', f'../media/{name}'),
+            ]).encode('utf-8'), f'ppt/slides/_rels/slide{index}.xml.rels')
+
+    # ==================== PDF ====================
+
+    def pdf_stream(self, title, image_paths, lightweight=False):
+        """逐页生成PDF内容（image_paths 按页码排序）
+
+        对象编号：1 目录，2 页面树，3 文档信息，之后每页依次为 页面、内容流、图片。
+        """
+        page_count = len(image_paths)
+        offsets = []
+        position = 0
+
+        def emit(data):
+            nonlocal position
+            position += len(data)
+            return data
+
+        def start_object():
+            offsets.append(position)
+            return len(offsets)
+
+        yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+        number = start_object()
+        yield emit(f'{number} 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n'.encode('latin-1'))
+
+        kids = ' '.join(f'{4 + 3 * i} 0 R' for i in range(page_count))
+        number = start_object()
+        yield emit(f'{number} 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {page_count} >>\nendobj\n'
+                   .encode('latin-1'))
+
+        created = datetime.now().strftime('D:%Y%m%d%H%M%S')
+        number = start_object()
+        yield emit(f'{number} 0 obj\n<< /Title {_pdf_text(title)} /Creator (EasyAIPPT) '
+                   f'/Producer (EasyAIPPT) /CreationDate ({created}) >>\nendobj\n'.encode('latin-1'))
+
+        for image_path in image_paths:
+            data, width, height, color_space = self._encode_jpeg(self._source_path(image_path, lightweight))
+
+            page_number = start_object()
+            yield emit(f'{page_number} 0 obj\n<< /Type /Page /Parent 2 0 R '
+                       f'/MediaBox [0 0 {SLIDE_WIDTH_PT} {SLIDE_HEIGHT_PT}] '
+                       f'/Resources << /XObject << /Im0 {page_number + 2} 0 R >> >> '
+                       f'/Contents {page_number + 1} 0 R >>\nendobj\n'.encode('latin-1'))
+
+            # 图片铺满整页
+            content = f'q {SLIDE_WIDTH_PT} 0 0 {SLIDE_HEIGHT_PT} 0 0 cm /Im0 Do Q'.encode('latin-1')
+            number = start_object()
+            yield emit(f'{number} 0 obj\n<< /Length {len(content)} >>\nstream\n'.encode('latin-1')
+                       + content + b'\nendstream\nendobj\n')
+
+            number = start_object()
+            yield emit(f'{number} 0 obj\n<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                       f'/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /DCTDecode '
+                       f'/Length {len(data)} >>\nstream\n'.encode('latin-1'))
+            yield emit(data)
+            yield emit(b'\nendstream\nendobj\n')
+
+        xref_position = position
+        xref = [f'xref\n0 {len(offsets) + 1}\n', '0000000000 65535 f \n']
+        xref.extend(f'{offset:010d} 00000 n \n' for offset in offsets)
+        yield ''.join(xref).encode('latin-1')
+        yield (f'trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R /Info 3 0 R >>\n'
+               f'startxref\n{xref_position}\n%%EOF\n').encode('latin-1')
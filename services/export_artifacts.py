@@ -0,0 +1,207 @@
+"""预先生成的导出文件（ZIP/PPTX/PDF）"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from services.zip_stream import ZipStream
+
+logger = logging.getLogger(__name__)
+
+# 导出文件种类 -> 文件名
+ARTIFACT_FILES = {
+    'zip': 'pages.zip',
+    'pptx': 'deck.pptx',
+    'pdf': 'deck.pdf',
+}
+MANIFEST_FILE = 'manifest.json'
+BUSY_PAGE_STATUSES = ('pending', 'generating')
+
+
+def export_pages(pages):
+    """参与导出的页面图片（按页码排序，只包含图片文件存在的页面）"""
+    return [
+        (page['page_number'], page['image_path'])
+        for page in sorted(pages, key=lambda p: p['page_number'])
+        if page['image_path'] and os.path.exists(page['image_path'])
+    ]
+
+
+class ExportArtifactService:
+    """页面完成后在后台重新组装项目的导出文件
+
+    每页完成或重新生成后立即预先编码该页（PDF所需的JPEG，按页缓存），并以防抖方式安排整套导出文件的组装，
+    连续完成的多页只组装一次；项目还有页面待生成时不组装，批量生成只在最后一页完成后组装一次。
+    组装是完整重建而不是在旧文件上拼接：ZIP中央目录、PDF交叉引用表和PPTX幻灯片列表都引用所有页面，
+    新文件要写到临时目录后整体替换（下载中的旧文件不受影响），拼接也要写出全部页面数据，
+    而耗CPU的JPEG编码已按页缓存，重建只是顺序复制。导出文件按页面集合指纹
+    （标题 + 每页的 页码/路径/修改时间/大小）存放在 <目录>/project_<id>/<指纹>/ 下，
+    页面变化后指纹改变，下载时找不到对应指纹的文件即退回流式导出。
+    """
+
+    def __init__(self, config, db_manager, deck_exporter):
+        self.enabled = config.EXPORT_ARTIFACT_ENABLED
+        self.root = config.EXPORT_ARTIFACT_DIR
+        self.debounce = config.EXPORT_ARTIFACT_DEBOUNCE
+        self.db_manager = db_manager
+        self.deck_exporter = deck_exporter
+        os.makedirs(self.root, exist_ok=True)
+
+        # 单线程执行页面预编码和组装，避免与页面生成争抢CPU和磁盘
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export-artifact')
+        self._lock = threading.Lock()
+        self._timers = {}  # project_id -> 防抖定时器
+        self._builds = 0
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+        logger.info(f"导出文件预生成服务初始化完成: {self.root}, 启用: {self.enabled}")
+
+    def fingerprint(self, project, pages):
+        """页面集合指纹（标题或任意一页变化时改变）"""
+        hasher = hashlib.sha256(project['title'].encode('utf-8'))
+        for page_number, image_path in pages:
+            stat = os.stat(image_path)
+            hasher.update(f'|{page_number}:{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}'
+                          .encode('utf-8'))
+        return hasher.hexdigest()[:32]
+
+    def _project_dir(self, project_id):
+        return os.path.join(self.root, f'project_{project_id}')
+
+    def page_ready(self, project_id, image_path):
+        """页面图片生成完成：预编码该页并安排组装"""
+        if not self.enabled:
+            return
+        self._executor.submit(self._prepare_page, image_path)
+        self.schedule(project_id)
+
+    def _prepare_page(self, image_path):
+        try:
+            self.deck_exporter.prepare_page(image_path)
+        except Exception as e:
+            logger.warning(f"预编码导出页面失败: {image_path}, {str(e)}")
+
+    def schedule(self, project_id):
+        """防抖安排组装（在最后一次调用 debounce 秒后执行）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self._timers.pop(project_id, None)
+            if timer:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, self._on_timer, args=(project_id,))
+            timer.daemon = True
+            self._timers[project_id] = timer
+            timer.start()
+
+    def _on_timer(self, project_id):
+        """防抖定时器到期，提交组装任务"""
+        with self._lock:
+            if self._timers.get(project_id) is threading.current_thread():
+                del self._timers[project_id]
+        self._executor.submit(self._build, project_id)
+
+    def _build(self, project_id):
+        """完整组装项目的全部导出文件（各页的PDF编码结果取自缓存）"""
+        try:
+            project = self.db_manager.get_ppt_project(project_id)
+            if not project:
+                return
+            all_pages = self.db_manager.get_ppt_pages(project_id)
+            if any(page['status'] in BUSY_PAGE_STATUSES for page in all_pages):
+                logger.info(f"项目 {project_id} 仍有页面待生成，暂不组装导出文件")
+                return
+            pages = export_pages(all_pages)
+            if not pages:
+                return
+
+            fingerprint = self.fingerprint(project, pages)
+            target_dir = os.path.join(self._project_dir(project_id), fingerprint)
+            if os.path.exists(os.path.join(target_dir, MANIFEST_FILE)):
+                return
+
+            logger.info(f"开始组装项目 {project_id} 的导出文件: {fingerprint}")
+            temp_dir = f'{target_dir}.{uuid.uuid4().hex}.tmp'
+            os.makedirs(temp_dir)
+            try:
+                image_paths = [image_path for _, image_path in pages]
+                archive = ZipStream()
+                for page_number, image_path in pages:
+                    archive.add_file(image_path, f'page_{page_number:03d}.png')
+                self._write(os.path.join(temp_dir, ARTIFACT_FILES['zip']), archive.generate())
+                self._write(os.path.join(temp_dir, ARTIFACT_FILES['pptx']),
+                            self.deck_exporter.pptx_archive(project['title'], image_paths).generate())
+                self._write(os.path.join(temp_dir, ARTIFACT_FILES['pdf']),
+                            self.deck_exporter.pdf_stream(project['title'], image_paths))
+                with open(os.path.join(temp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                    json.dump({'fingerprint': fingerprint, 'pages': [n for n, _ in pages],
+                               'files': ARTIFACT_FILES}, f, ensure_ascii=False)
+                os.replace(temp_dir, target_dir)
+            except Exception:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                raise
+
+            self._remove_stale(project_id, fingerprint)
+            with self._lock:
+                self._builds += 1
+            logger.info(f"项目 {project_id} 的导出文件组装完成: {fingerprint}")
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+            logger.error(f"组装项目 {project_id} 的导出文件失败: {str(e)}")
+
+    @staticmethod
+    def _write(path, chunks):
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def _remove_stale(self, project_id, fingerprint):
+        """删除项目旧指纹的导出文件"""
+        project_dir = self._project_dir(project_id)
+        for name in os.listdir(project_dir):
+            if name != fingerprint and not name.endswith('.tmp'):
+                shutil.rmtree(os.path.join(project_dir, name), ignore_errors=True)
+
+    def get(self, project, pages, kind):
+        """获取与当前页面一致的导出文件，返回 (路径, 指纹)；不存在时返回 (None, None) 并安排组装"""
+        if not self.enabled or not pages:
+            return None, None
+        try:
+            fingerprint = self.fingerprint(project, pages)
+        except OSError:
+            return None, None
+        target_dir = os.path.join(self._project_dir(project['id']), fingerprint)
+        if os.path.exists(os.path.join(target_dir, MANIFEST_FILE)):
+            with self._lock:
+                self._hits += 1
+            return os.path.join(target_dir, ARTIFACT_FILES[kind]), fingerprint
+
+        with self._lock:
+            self._misses += 1
+        self.schedule(project['id'])
+        return None, None
+
+    def remove(self, project_id):
+        """删除项目的全部导出文件"""
+        with self._lock:
+            timer = self._timers.pop(project_id, None)
+            if timer:
+                timer.cancel()
+        shutil.rmtree(self._project_dir(project_id), ignore_errors=True)
+
+    def get_stats(self):
+        """获取导出文件统计"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'builds': self._builds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'failures': self._failures,
+                'scheduled': len(self._timers)
+            }
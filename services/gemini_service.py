@@ -1,15 +1,19 @@
 """Gemini API调用服务"""
 import os
 import json
-import time
 import requests
+from services.http_transport import HTTPTransport
+from services.rate_limiter import parse_retry_after
+from services.retry import RetryEngine, APIError
 
 
 class GeminiService:
     """Gemini服务"""
 
-    def __init__(self, config):
+    def __init__(self, config, http_transport=None, retry_engine=None):
         self.config = config
+        self.http = http_transport or HTTPTransport(config)
+        self.retry_engine = retry_engine or RetryEngine(config)
         self.api_key = config.GEMINI_API_KEY
         self.api_base_url = config.GEMINI_API_BASE_URL
         self.model = config.GEMINI_MODEL
@@ -20,24 +24,9 @@ class GeminiService:
         with open(prompt_path, 'r', encoding='utf-8') as f:
             return f.read()
 
-    def retry_api_call(self, func, max_retries=None):
-        """API调用重试机制"""
-        if max_retries is None:
-            max_retries = self.config.MAX_API_RETRIES
-
-        for attempt in range(max_retries):
-            try:
-                print(f"[Gemini] 尝试第 {attempt + 1}/{max_retries} 次调用")
-                return func()
-            except Exception as e:
-                print(f"[Gemini] 第 {attempt + 1} 次调用失败: {str(e)}")
-                if attempt == max_retries - 1:
-                    print(f"[Gemini] 已达到最大重试次数，放弃")
-                    raise Exception(f'API调用失败，已重试{max_retries}次: {str(e)}')
-                # 指数退避
-                wait_time = self.config.RETRY_DELAY_BASE ** attempt
-                print(f"[Gemini] 等待 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
+    def retry_api_call(self, func, policy_name='outline'):
+        """API调用重试机制（按调用点策略分类错误、抖动退避并限制总时长）"""
+        return self.retry_engine.run(func, policy_name)
 
     def generate_outline(self, knowledge_text, user_prompt, expected_pages):
         """生成PPT大纲"""
@@ -54,14 +43,14 @@ class GeminiService:
         )
         print(f"[Gemini] 提示词长度: {len(full_prompt)} 字符")
 
-        def api_call():
+        def api_call(cancel_token=None):
             import requests
             import sys
             
             # 构建API URL
             api_url = f"{self.api_base_url}/v1beta/models/{self.model}:generateContent"
             print(f"[Gemini] API URL: {api_url}")
-            print(f"[Gemini] 调用 Gemini API，超时时间: {self.config.API_TIMEOUT}秒")
+            print(f"[Gemini] 调用 Gemini API，超时时间: {self.http.read_timeout}秒")
             sys.stdout.flush()  # 强制刷新输出
             
             # 构建请求体
@@ -91,12 +80,13 @@ class GeminiService:
             
             try:
                 # 发送请求
-                response = requests.post(
+                response = self.http.post(
                     api_url,
+                    endpoint=f"{self.model}:generateContent",
+                    cancel_token=cancel_token,
                     json=request_body,
                     headers=headers,
-                    params=params,
-                    timeout=self.config.API_TIMEOUT
+                    params=params
                 )
                 
                 print(f"[Gemini] API 返回，状态码: {response.status_code}")
@@ -104,7 +94,9 @@ class GeminiService:
                 # 检查响应状态
                 if response.status_code != 200:
                     print(f"[Gemini] API 返回错误: {response.text}")
-                    raise Exception(f"API返回错误状态码 {response.status_code}: {response.text}")
+                    raise APIError(f"API返回错误状态码 {response.status_code}: {response.text}",
+                                   status_code=response.status_code,
+                                   retry_after=parse_retry_after(response.headers.get('Retry-After')))
                 
                 # 解析响应
                 response_data = response.json()
@@ -126,7 +118,7 @@ class GeminiService:
                 
             except requests.exceptions.Timeout:
                 print(f"[Gemini] API 调用超时")
-                raise Exception(f"API调用超时（{self.config.API_TIMEOUT}秒）")
+                raise APIError(f"API调用超时（{self.http.read_timeout}秒）")
             except requests.exceptions.RequestException as e:
                 print(f"[Gemini] 请求异常: {type(e).__name__}: {str(e)}")
                 raise
@@ -169,14 +161,14 @@ class GeminiService:
 
     def generate_outline_with_custom_prompt(self, custom_prompt):
         """使用自定义提示词生成大纲"""
-        def api_call():
+        def api_call(cancel_token=None):
             import requests
             import sys
             
             # 构建API URL
             api_url = f"{self.api_base_url}/v1beta/models/{self.model}:generateContent"
             print(f"[Gemini] API URL: {api_url}")
-            print(f"[Gemini] 使用自定义提示词调用 Gemini API，超时时间: {self.config.API_TIMEOUT}秒")
+            print(f"[Gemini] 使用自定义提示词调用 Gemini API，超时时间: {self.http.read_timeout}秒")
             sys.stdout.flush()
             
             # 构建请求体
@@ -200,19 +192,22 @@ class GeminiService:
             
             try:
                 # 发送请求
-                response = requests.post(
+                response = self.http.post(
                     api_url,
+                    endpoint=f"{self.model}:generateContent",
+                    cancel_token=cancel_token,
                     json=request_body,
                     headers=headers,
-                    params=params,
-                    timeout=self.config.API_TIMEOUT
+                    params=params
                 )
                 
                 print(f"[Gemini] API 返回，状态码: {response.status_code}")
                 
                 if response.status_code != 200:
                     print(f"[Gemini] API 返回错误: {response.text}")
-                    raise Exception(f"API返回错误状态码 {response.status_code}: {response.text}")
+                    raise APIError(f"API返回错误状态码 {response.status_code}: {response.text}",
+                                   status_code=response.status_code,
+                                   retry_after=parse_retry_after(response.headers.get('Retry-After')))
                 
                 # 解析响应
                 response_data = response.json()
@@ -221,7 +216,7 @@ class GeminiService:
                 
             except requests.exceptions.Timeout:
                 print(f"[Gemini] API 调用超时")
-                raise Exception(f"API调用超时（{self.config.API_TIMEOUT}秒）")
+                raise APIError(f"API调用超时（{self.http.read_timeout}秒）")
             except Exception as e:
                 print(f"[Gemini] API 调用异常: {type(e).__name__}: {str(e)}")
                 raise
@@ -280,7 +275,7 @@ class GeminiService:
 }}
 """
 
-        def api_call():
+        def api_call(cancel_token=None):
             # 构建API URL
             api_url = f"{self.api_base_url}/v1beta/models/{self.model}:generateContent"
             
@@ -304,16 +299,19 @@ class GeminiService:
             params = {"key": self.api_key}
             
             # 发送请求
-            response = requests.post(
+            response = self.http.post(
                 api_url,
+                endpoint=f"{self.model}:generateContent",
+                cancel_token=cancel_token,
                 json=request_body,
                 headers=headers,
-                params=params,
-                timeout=self.config.API_TIMEOUT
+                params=params
             )
             
             if response.status_code != 200:
-                raise Exception(f"API返回错误状态码 {response.status_code}: {response.text}")
+                raise APIError(f"API返回错误状态码 {response.status_code}: {response.text}",
+                               status_code=response.status_code,
+                               retry_after=parse_retry_after(response.headers.get('Retry-After')))
             
             # 解析响应
             response_data = response.json()
@@ -0,0 +1,65 @@
+"""启动后恢复中断的页面生成"""
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationRecovery:
+    """在服务开始处理请求后，于后台恢复状态仍为 generating 但没有对应任务的项目
+
+    正常情况下中断的生成任务由任务队列在租约过期后继续执行；这里处理的是任务已结束
+    （如进入死信）或从未入队而项目状态仍停留在 generating 的项目。
+    启动延迟和每个项目之间的间隔都带随机抖动，多个进程同时启动时不会同时涌入；
+    提交任务按去重键去重，多个进程恢复同一项目也只会产生一个任务。
+    """
+
+    def __init__(self, config, db_manager, ppt_generator):
+        self.enabled = config.RECOVERY_ENABLED
+        self.delay = config.RECOVERY_DELAY
+        self.jitter = config.RECOVERY_JITTER
+        self.stagger = config.RECOVERY_STAGGER
+        self.db_manager = db_manager
+        self.ppt_generator = ppt_generator
+        self._timer = None
+
+    def start(self):
+        """延迟 RECOVERY_DELAY + 随机抖动 秒后在后台执行恢复"""
+        if not self.enabled:
+            return
+        delay = self.delay + random.uniform(0, self.jitter)
+        self._timer = threading.Timer(delay, self.run)
+        self._timer.name = 'generation-recovery'
+        self._timer.daemon = True
+        self._timer.start()
+        logger.info(f"将在 {delay:.1f} 秒后检查未完成的生成任务")
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+
+    def run(self):
+        """恢复所有没有未结束任务的 generating 项目，返回恢复的项目数"""
+        recovered = 0
+        try:
+            projects = self.db_manager.get_projects_by_status('generating')
+            logger.info(f"发现 {len(projects)} 个状态为generating的项目")
+            for index, project in enumerate(projects):
+                if index:
+                    time.sleep(random.uniform(0, self.stagger))
+                project_id = project['id']
+                try:
+                    if self.ppt_generator.has_active_generation(project_id):
+                        continue
+                    logger.info(f"发现中断的项目: {project_id} - {project['title']}")
+                    if self.ppt_generator.resume_generation(project_id):
+                        recovered += 1
+                except Exception as e:
+                    logger.error(f"恢复项目 {project_id} 的生成任务失败: {str(e)}")
+        except Exception as e:
+            logger.error(f"恢复生成任务失败: {str(e)}")
+        if recovered:
+            logger.info(f"已恢复 {recovered} 个项目的生成任务")
+        return recovered
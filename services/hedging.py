@@ -0,0 +1,166 @@
+"""图片生成请求对冲（降低长尾延迟）"""
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from services.cancellation import CancelToken
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """最近若干次成功调用的耗时统计"""
+
+    def __init__(self, window):
+        self._samples = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """记录一次成功调用的耗时"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, min_samples=1):
+        """返回耗时的百分位数，样本不足时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class RequestHedger:
+    """对冲请求：调用耗时超过近期耗时的百分位数时再发一个相同请求，先成功者胜出
+
+    - 按 key（如分辨率）分别统计耗时，样本数不足 min_samples 时不对冲
+    - 每次主请求积累 budget_ratio 个对冲额度，额度不足或对冲请求数达到上限时不对冲
+    - 胜出后取消另一个请求（已收到响应头的请求会立即中断连接，否则完成后丢弃结果）
+    """
+
+    def __init__(self, config):
+        self.enabled = config.IMAGE_HEDGE_ENABLED
+        self.percentile = config.IMAGE_HEDGE_PERCENTILE
+        self.min_samples = config.IMAGE_HEDGE_MIN_SAMPLES
+        self.min_delay = config.IMAGE_HEDGE_MIN_DELAY
+        self.budget_ratio = config.IMAGE_HEDGE_BUDGET_RATIO
+        self.max_in_flight = max(1, config.IMAGE_HEDGE_MAX_IN_FLIGHT)
+
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._hedge_slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._budget = 0.0
+        self._stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0}
+
+    def _tracker(self, key):
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = LatencyTracker(self.min_samples * 5)
+                self._trackers[key] = tracker
+            return tracker
+
+    def hedge_delay(self, key):
+        """发出对冲请求前的等待时间，样本不足时返回None"""
+        threshold = self._tracker(key).percentile(self.percentile, self.min_samples)
+        if threshold is None:
+            return None
+        return max(self.min_delay, threshold)
+
+    def _take_hedge_slot(self):
+        """消耗一个对冲额度和并发名额，不足时返回False"""
+        with self._lock:
+            if self._budget < 1:
+                self._stats['budget_denied'] += 1
+                return False
+            if not self._hedge_slots.acquire(blocking=False):
+                self._stats['budget_denied'] += 1
+                return False
+            self._budget -= 1
+            self._stats['hedged'] += 1
+            return True
+
+    def _start_attempt(self, key, attempt, token, is_hedge):
+        """在独立线程中执行一次请求，返回 Future"""
+        future = Future()
+
+        def runner():
+            started = time.monotonic()
+            try:
+                result = attempt(token)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                self._tracker(key).record(time.monotonic() - started)
+                future.set_result(result)
+            finally:
+                if is_hedge:
+                    self._hedge_slots.release()
+
+        name = 'image-hedge' if is_hedge else 'image-primary'
+        threading.Thread(target=runner, name=name, daemon=True).start()
+        return future
+
+    def run(self, key, attempt, cancel_token=None):
+        """执行 attempt(token)，必要时发出对冲请求，返回先成功的结果"""
+        if not self.enabled:
+            return attempt(cancel_token)
+
+        with self._lock:
+            self._stats['calls'] += 1
+            # 额度上限等于对冲并发上限，避免长时间空闲后集中对冲
+            self._budget = min(self.max_in_flight, self._budget + self.budget_ratio)
+
+        primary_token = CancelToken(parent=cancel_token)
+        primary = self._start_attempt(key, attempt, primary_token, False)
+        tokens = {primary: primary_token}
+
+        delay = self.hedge_delay(key)
+        if delay is not None:
+            done, _ = wait([primary], timeout=delay)
+            if not done and self._take_hedge_slot():
+                logger.info(f"图片请求超过 {delay:.1f} 秒（P{self.percentile:g}），发出对冲请求")
+                hedge_token = primary_token.race_with(CancelToken(parent=cancel_token))
+                tokens[self._start_attempt(key, attempt, hedge_token, True)] = hedge_token
+
+        errors = {}
+        pending = set(tokens)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[future] = e
+                    continue
+                for other, token in tokens.items():
+                    if other is not future:
+                        token.cancel('对冲请求已由其他请求完成')
+                if future is not primary:
+                    with self._lock:
+                        self._stats['hedge_wins'] += 1
+                    logger.info("对冲请求先于原请求完成")
+                return result
+
+        # 全部失败时优先抛出原请求的错误（决定是否重试）
+        raise errors.get(primary) or next(iter(errors.values()))
+
+    def get_stats(self):
+        """获取对冲统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            trackers = dict(self._trackers)
+        stats['enabled'] = self.enabled
+        stats['thresholds'] = {
+            key: {
+                'samples': len(tracker),
+                'hedge_after_seconds': self.hedge_delay(key)
+            }
+            for key, tracker in trackers.items()
+        }
+        return stats
@@ -0,0 +1,246 @@
+"""共享HTTP传输层（连接池 + 长连接复用）"""
+import socket
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from services.rate_limiter import RateLimiterRegistry, THROTTLE_STATUS_CODES, parse_retry_after
+from services.circuit_breaker import CircuitBreakerRegistry
+from services.cancellation import OperationCancelled
+
+logger = logging.getLogger(__name__)
+
+
+def _counting_pool_class(base_class, transport):
+    """创建会统计新建连接数、并将取出的连接绑定到当前请求取消令牌的连接池类"""
+
+    class CountingConnectionPool(base_class):
+        def _new_conn(self):
+            transport._record_new_connection(self.host)
+            return super()._new_conn()
+
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            transport._bind_connection(conn)
+            return conn
+
+    return CountingConnectionPool
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """统计连接创建次数的HTTPAdapter"""
+
+    def __init__(self, transport, **kwargs):
+        self._transport = transport
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self._transport),
+            'https': _counting_pool_class(HTTPSConnectionPool, self._transport),
+        }
+
+
+class HTTPTransport:
+    """GeminiService 和 BananaService 共用的HTTP传输层
+
+    所有请求共享一个 requests.Session，按主机维护 keep-alive 连接池，
+    避免每次调用都重新进行 TCP+TLS 握手。指定 endpoint 的请求会经过
+    该端点的熔断器和自适应限流器。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.connect_timeout = config.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = config.HTTP_READ_TIMEOUT
+        self.pool_connections = config.HTTP_POOL_CONNECTIONS
+        self.pool_maxsize = config.HTTP_POOL_MAXSIZE
+
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._new_connection_count = 0
+        self._host_requests = defaultdict(int)
+        self._host_connections = defaultdict(int)
+        self.rate_limiters = RateLimiterRegistry(config)
+        self.circuit_breakers = CircuitBreakerRegistry(config)
+        self._local = threading.local()  # 当前线程正在发送的请求的 (取消令牌, 已登记的中断回调)
+
+        self.session = requests.Session()
+        # pool_maxsize 即每个主机的连接上限，pool_block=True 时超出上限的请求会等待空闲连接
+        adapter = _CountingHTTPAdapter(
+            self,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=config.HTTP_POOL_BLOCK
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        logger.info(f"HTTPTransport初始化完成 - 每主机连接数上限: {self.pool_maxsize}, "
+                    f"超时: 连接{self.connect_timeout}秒/读取{self.read_timeout}秒")
+
+    def _record_new_connection(self, host):
+        """记录新建连接"""
+        with self._lock:
+            self._new_connection_count += 1
+            self._host_connections[host] += 1
+        logger.debug(f"新建HTTP连接: {host}")
+
+    def _send(self, url, **kwargs):
+        """通过共享Session发送POST请求（默认使用配置的连接/读取超时）"""
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        host = urlparse(url).hostname
+        with self._lock:
+            self._request_count += 1
+            self._host_requests[host] += 1
+        return self.session.post(url, **kwargs)
+
+    def _acquire(self, endpoint, cancel_token=None):
+        """通过端点熔断器并获取限流许可，未指定端点时不做限制
+
+        等待限流许可的时长不超过 cancel_token 的剩余时限（重试总时限），超时抛出 RateLimitTimeout；
+        令牌被取消时立即抛出 OperationCancelled。
+        """
+        if not endpoint:
+            return None, None
+        breaker = self.circuit_breakers.get(endpoint)
+        breaker.before_call()  # 熔断中直接抛出 CircuitOpenError，不占用限流名额
+        limiter = self.rate_limiters.get(endpoint)
+        try:
+            limiter.acquire(timeout=cancel_token.remaining() if cancel_token is not None else None,
+                            cancel_token=cancel_token)
+        except Exception:
+            breaker.cancel_call()
+            raise
+        return breaker, limiter
+
+    def _report(self, limiter, response):
+        """根据响应状态调整限流器（429/503 时退避并遵守 Retry-After）"""
+        if limiter is None:
+            return
+        if response.status_code in THROTTLE_STATUS_CODES:
+            limiter.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+        elif response.status_code < 400:
+            limiter.on_success()
+
+    @staticmethod
+    def _record_outcome(breaker, response, error, cancel_token=None):
+        """根据请求结果更新熔断器：5xx、超时和连接错误计为端点故障，主动取消的请求不计入"""
+        if breaker is None:
+            return
+        if cancel_token is not None and cancel_token.cancelled:
+            breaker.cancel_call()
+            return
+        endpoint_failed = (
+            isinstance(error, (requests.exceptions.Timeout,
+                               requests.exceptions.ConnectionError,
+                               requests.exceptions.ChunkedEncodingError))
+            or (response is not None and response.status_code >= 500)
+        )
+        if endpoint_failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def post(self, url, endpoint=None, cancel_token=None, **kwargs):
+        """发送POST请求并读取完整响应（指定 endpoint 时经过该端点的熔断器和限流器）
+
+        cancel_token 被取消或到达截止时间时不再等待限流许可。
+        """
+        breaker, limiter = self._acquire(endpoint, cancel_token)
+        response = None
+        error = None
+        try:
+            response = self._send(url, **kwargs)
+            self._report(limiter, response)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record_outcome(breaker, response, error)
+            if limiter:
+                limiter.release()
+
+    def _bind_connection(self, conn):
+        """请求从连接池取得连接时，将连接绑定到该请求的取消令牌（等待响应头期间取消也能中断）"""
+        scope = getattr(self._local, 'cancel_scope', None)
+        if scope is None:
+            return
+        cancel_token, aborts = scope
+        abort = lambda: self._abort_connection(conn)
+        aborts.append(abort)
+        cancel_token.register(abort)
+
+    @staticmethod
+    def _abort_connection(conn):
+        """中断连接上进行中的请求（关闭底层socket的读写，阻塞中的读取会立即返回）"""
+        sock = getattr(conn, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @contextmanager
+    def stream_post(self, url, endpoint=None, cancel_token=None, **kwargs):
+        """发送流式POST请求，with 块结束（响应读取完毕）时关闭响应、记录熔断结果并释放限流许可
+
+        指定 cancel_token 时，令牌取消会中断请求（包括等待限流许可、等待响应头和读取响应）并抛出 OperationCancelled。
+        """
+        kwargs['stream'] = True
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        breaker, limiter = self._acquire(endpoint, cancel_token)
+        response = None
+        error = None
+        aborts = []
+        try:
+            self._local.cancel_scope = (cancel_token, aborts) if cancel_token is not None else None
+            try:
+                response = self._send(url, **kwargs)
+            finally:
+                self._local.cancel_scope = None
+            with response:
+                self._report(limiter, response)
+                yield response
+        except Exception as e:
+            error = e
+            if cancel_token is not None and cancel_token.cancelled and not isinstance(e, OperationCancelled):
+                raise OperationCancelled(cancel_token.reason or '请求已取消') from e
+            raise
+        finally:
+            for abort in aborts:
+                cancel_token.unregister(abort)
+            self._record_outcome(breaker, response, error, cancel_token)
+            if limiter:
+                limiter.release()
+
+    def get_stats(self):
+        """获取连接复用统计"""
+        with self._lock:
+            reused = max(0, self._request_count - self._new_connection_count)
+            return {
+                'requests': self._request_count,
+                'new_connections': self._new_connection_count,
+                'reused_connections': reused,
+                'reuse_ratio': round(reused / self._request_count, 3) if self._request_count else 0.0,
+                'hosts': {
+                    host: {
+                        'requests': count,
+                        'new_connections': self._host_connections.get(host, 0)
+                    }
+                    for host, count in self._host_requests.items()
+                },
+                'pool_maxsize': self.pool_maxsize,
+                'connect_timeout': self.connect_timeout,
+                'read_timeout': self.read_timeout
+            }
+
+    def close(self):
+        """关闭所有连接"""
+        self.session.close()
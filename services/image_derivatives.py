@@ -0,0 +1,153 @@
+"""图片衍生图服务（缩略图和中等尺寸WebP预览图）"""
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+# 衍生图规格：最大宽度（像素），高度按原图比例缩放
+VARIANTS = {
+    'thumb': 640,    # 页面/样式网格中的缩略图
+    'medium': 1600,  # 大图查看
+}
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+class ImageDerivativeService:
+    """生成并缓存原图的缩略图和中等尺寸预览图
+
+    衍生图按 原图路径 + 修改时间 + 大小 命名，原图被重新生成后自动使用新的衍生图，
+    并删除同一原图的旧衍生图。首次请求时同步生成（lazy），也可在原图生成完成后
+    提交到后台线程池预先生成（eager），同一衍生图的并发请求只生成一次。
+    """
+
+    def __init__(self, config):
+        self.cache_dir = config.IMAGE_DERIVATIVE_DIR
+        self.quality = config.IMAGE_DERIVATIVE_QUALITY
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # 当前环境的Pillow不支持WebP时退回JPEG
+        if features.check('webp'):
+            self.format, self.extension, self.mimetype = 'WEBP', '.webp', 'image/webp'
+        else:
+            self.format, self.extension, self.mimetype = 'JPEG', '.jpg', 'image/jpeg'
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, config.IMAGE_DERIVATIVE_WORKERS),
+            thread_name_prefix='image-derivative'
+        )
+        self._lock = threading.Lock()
+        self._pending = {}  # 衍生图路径 -> 生成中的 Future
+        self._hits = 0
+        self._generated = 0
+        self._failures = 0
+        logger.info(f"图片衍生图服务初始化完成: {self.cache_dir}, 格式: {self.format}")
+
+    @staticmethod
+    def is_supported(path):
+        """是否为可生成衍生图的图片文件"""
+        return path.lower().endswith(SOURCE_EXTENSIONS)
+
+    def derivative_path(self, source_path, variant):
+        """衍生图在缓存目录中的路径"""
+        stat = os.stat(source_path)
+        source_key = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()
+        return os.path.join(
+            self.cache_dir, source_key[:2], source_key,
+            f'{variant}-{stat.st_mtime_ns}-{stat.st_size}{self.extension}'
+        )
+
+    def get(self, source_path, variant):
+        """获取衍生图路径，不存在时生成（阻塞直到生成完成）"""
+        if variant not in VARIANTS:
+            raise ValueError(f'不支持的图片规格: {variant}')
+        target_path = self.derivative_path(source_path, variant)
+        if os.path.exists(target_path):
+            with self._lock:
+                self._hits += 1
+            return target_path
+        return self._submit(source_path, variant, target_path).result()
+
+    def schedule(self, source_path):
+        """在后台预先生成所有规格的衍生图"""
+        if not source_path or not self.is_supported(source_path) or not os.path.exists(source_path):
+            return
+        for variant in VARIANTS:
+            try:
+                target_path = self.derivative_path(source_path, variant)
+            except OSError:
+                return
+            if not os.path.exists(target_path):
+                self._submit(source_path, variant, target_path)
+
+    def _submit(self, source_path, variant, target_path):
+        """提交生成任务（同一衍生图已在生成时复用同一个 Future）"""
+        with self._lock:
+            future = self._pending.get(target_path)
+            if future is None:
+                future = Future()
+                self._pending[target_path] = future
+                self._executor.submit(self._run, future, source_path, variant, target_path)
+            return future
+
+    def _run(self, future, source_path, variant, target_path):
+        try:
+            self._render(source_path, variant, target_path)
+            self._remove_stale(target_path, variant)
+            with self._lock:
+                self._generated += 1
+            future.set_result(target_path)
+        except Exception as e:
+            logger.error(f"生成衍生图失败: {source_path} ({variant}), {str(e)}")
+            with self._lock:
+                self._failures += 1
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending.pop(target_path, None)
+
+    def _render(self, source_path, variant, target_path):
+        """缩放原图并以WebP保存（原子替换）"""
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f"{target_path}.{threading.get_ident()}.tmp"
+        try:
+            with Image.open(source_path) as image:
+                max_width = VARIANTS[variant]
+                # draft 让JPEG在解码时直接按比例缩小，reducing_gap 先用快速缩小再精细重采样
+                image.draft('RGB', (max_width, max_width))
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+                if self.format == 'JPEG' and image.mode == 'RGBA':
+                    image = image.convert('RGB')
+                image.thumbnail((max_width, max_width * 4), Image.Resampling.LANCZOS, reducing_gap=2.0)
+                image.save(temp_path, format=self.format, quality=self.quality)
+            os.replace(temp_path, target_path)
+            logger.info(f"衍生图已生成: {target_path}")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _remove_stale(self, target_path, variant):
+        """删除同一原图同一规格的旧版本衍生图"""
+        directory = os.path.dirname(target_path)
+        current = os.path.basename(target_path)
+        for name in os.listdir(directory):
+            if name.startswith(f'{variant}-') and name != current and not name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def get_stats(self):
+        """获取衍生图统计"""
+        with self._lock:
+            return {
+                'format': self.format,
+                'hits': self._hits,
+                'generated': self._generated,
+                'failures': self._failures,
+                'pending': len(self._pending)
+            }
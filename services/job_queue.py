@@ -0,0 +1,231 @@
+"""基于SQLite的持久化后台任务队列"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import uuid
+from services.scheduler import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """持久化任务队列
+
+    任务保存在数据库的 jobs 表中，进程重启后不会丢失。执行者通过租约领取任务并定期续约（心跳），
+    执行者崩溃后租约过期，任务会被其他执行者重新领取；失败的任务按指数退避重新排队，
+    超过最大尝试次数后转入死信（dead）状态，不再执行。
+    """
+
+    def __init__(self, config, db_manager):
+        self.config = config
+        self.db_manager = db_manager
+        self.max_attempts = config.JOB_MAX_ATTEMPTS
+        self.retry_base_delay = config.JOB_RETRY_BASE_DELAY
+        self._handlers = {}  # 任务类型 -> (处理函数, 最大尝试次数, 优先级, 转入死信时的回调)
+        self._wakeup = threading.Condition()  # 本进程添加任务后立即唤醒空闲的执行线程
+
+    def register(self, job_type, handler, max_attempts=None, priority=PRIORITY_BATCH, on_dead=None):
+        """注册任务处理函数（handler 接收任务参数字典，priority 数值越小越先被领取）
+
+        on_dead(payload, error) 在任务失败且不再重试（转入死信）时调用，用于把业务状态标记为失败；
+        handler 抛出异常只表示本次尝试失败，任务仍可能重新排队。
+        """
+        self._handlers[job_type] = (handler, max_attempts or self.max_attempts, priority, on_dead)
+
+    @property
+    def job_types(self):
+        """已注册的任务类型"""
+        return list(self._handlers)
+
+    def handler_for(self, job_type):
+        entry = self._handlers.get(job_type)
+        return entry[0] if entry else None
+
+    def dead_handler_for(self, job_type):
+        entry = self._handlers.get(job_type)
+        return entry[3] if entry else None
+
+    def enqueue(self, job_type, payload, dedupe_key=None, fair_key=None):
+        """添加任务，返回任务ID（相同去重键的任务未结束时返回已有任务的ID）
+
+        fair_key 为公平调度的分组（如工作区），同一优先级内正在执行任务少的分组优先领取。
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f'未注册的任务类型: {job_type}')
+        _, max_attempts, priority, _ = self._handlers[job_type]
+        job_id = self.db_manager.enqueue_job(
+            job_type, json.dumps(payload, ensure_ascii=False), dedupe_key=dedupe_key, max_attempts=max_attempts,
+            priority=priority, fair_key=fair_key
+        )
+        logger.info(f"任务已入队: id={job_id}, type={job_type}, dedupe_key={dedupe_key}")
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def wait_for_work(self, timeout):
+        """等待新任务通知或超时（超时后重新查询数据库，以领取其他进程添加的任务和过期租约）"""
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def wake_all(self):
+        """唤醒所有等待中的执行线程"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def retry_delay(self, attempts):
+        """第 attempts 次失败后的重试等待时间（指数退避，最长5分钟）"""
+        return min(self.retry_base_delay * (2 ** (attempts - 1)), 300)
+
+    def get_job(self, job_id):
+        """获取任务（参数和结果解析为字典）"""
+        job = self.db_manager.get_job(job_id)
+        if job:
+            job['payload'] = json.loads(job['payload'])
+            job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def get_stats(self):
+        """按任务类型统计各状态的任务数"""
+        stats = {}
+        for row in self.db_manager.get_job_counts():
+            stats.setdefault(row['job_type'], {})[row['status']] = row['count']
+        return stats
+
+
+class JobWorkerPool:
+    """固定数量的执行线程，从任务队列领取并执行任务
+
+    多个进程（包括其他机器上共享同一数据库的进程）可以同时运行执行线程，领取任务在写事务中完成，
+    同一任务不会被重复领取。job_types 指定只执行部分类型的任务，默认执行所有已注册的类型。
+    """
+
+    def __init__(self, config, job_queue, size=None, job_types=None):
+        self.job_queue = job_queue
+        self.db_manager = job_queue.db_manager
+        self.size = max(1, size or config.JOB_WORKERS)
+        self.job_types = list(job_types) if job_types else None
+        self.lease_seconds = config.JOB_LEASE_SECONDS
+        self.poll_interval = config.JOB_POLL_INTERVAL
+        # 执行者标识：主机名 + 进程号 + 随机后缀，用于区分不同进程和机器上的执行者
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self._stopped = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def start(self):
+        """启动执行线程"""
+        for index in range(self.size):
+            thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"任务执行线程已启动: {self.worker_id}, 线程数: {self.size}, "
+                    f"任务类型: {self.job_types or self.job_queue.job_types}")
+
+    def stop(self, timeout=None):
+        """停止领取新任务并等待执行中的任务结束（最多等待 timeout 秒），返回是否全部结束
+
+        超时未结束的任务在进程退出后租约过期，由其他执行者重新领取。
+        """
+        self._stopped.set()
+        self.job_queue.wake_all()
+        deadline = time.time() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.time()) if deadline is not None else None)
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _worker_loop(self):
+        owner = f'{self.worker_id}:{threading.current_thread().name}'
+        while not self._stopped.is_set():
+            dead_jobs = []
+            try:
+                job = self.db_manager.lease_job(owner, self.lease_seconds,
+                                                self.job_types or self.job_queue.job_types, dead_jobs)
+            except Exception as e:
+                logger.error(f"领取任务失败: {str(e)}")
+                job = None
+            # 执行者崩溃或失去租约且尝试次数用尽的任务在领取时转入死信
+            for dead_job in dead_jobs:
+                logger.error(f"任务租约过期且不再重试（死信）: id={dead_job['id']}, type={dead_job['job_type']}")
+                self._notify_dead(dead_job, dead_job['last_error'])
+            if not job:
+                self.job_queue.wait_for_work(self.poll_interval)
+                continue
+            self._run(job, owner)
+
+    def _run(self, job, owner):
+        """执行一个任务，执行期间定期续约"""
+        job_id, job_type = job['id'], job['job_type']
+        logger.info(f"开始执行任务: id={job_id}, type={job_type}, 第 {job['attempts']} 次尝试")
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, owner, heartbeat_stop),
+                                     name=f'job-heartbeat-{job_id}', daemon=True)
+        heartbeat.start()
+        with self._lock:
+            self._running += 1
+        try:
+            handler = self.job_queue.handler_for(job_type)
+            if handler is None:
+                raise ValueError(f'未注册的任务类型: {job_type}')
+            result = handler(json.loads(job['payload']))
+            heartbeat_stop.set()
+            self.db_manager.complete_job(job_id, owner, json.dumps(result, ensure_ascii=False)
+                                         if result is not None else None)
+            with self._lock:
+                self._completed += 1
+            logger.info(f"任务执行完成: id={job_id}, type={job_type}")
+        except Exception as e:
+            heartbeat_stop.set()
+            retry_at = None
+            if job['attempts'] < job['max_attempts']:
+                retry_at = time.time() + self.job_queue.retry_delay(job['attempts'])
+            status = self.db_manager.fail_job(job_id, owner, str(e), retry_at)
+            with self._lock:
+                self._failed += 1
+            if status == 'dead':
+                logger.error(f"任务执行失败且不再重试（死信）: id={job_id}, type={job_type}, error={str(e)}")
+                self._notify_dead(job, str(e))
+            else:
+                logger.warning(f"任务执行失败，稍后重试: id={job_id}, type={job_type}, error={str(e)}")
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+            with self._lock:
+                self._running -= 1
+
+    def _notify_dead(self, job, error):
+        """任务转入死信后调用注册的回调"""
+        on_dead = self.job_queue.dead_handler_for(job['job_type'])
+        if on_dead is None:
+            return
+        try:
+            on_dead(json.loads(job['payload']), error)
+        except Exception as e:
+            logger.error(f"处理死信任务失败: id={job['id']}, {str(e)}")
+
+    def _heartbeat(self, job_id, owner, stop_event):
+        """每隔租约时长的三分之一续约一次"""
+        while not stop_event.wait(self.lease_seconds / 3):
+            try:
+                if not self.db_manager.heartbeat_job(job_id, owner, self.lease_seconds):
+                    logger.warning(f"任务租约已失效: id={job_id}")
+                    return
+            except Exception as e:
+                logger.error(f"任务续约失败: id={job_id}, {str(e)}")
+
+    def get_stats(self):
+        """获取执行线程统计"""
+        with self._lock:
+            return {
+                'worker_id': self.worker_id,
+                'size': self.size,
+                'job_types': self.job_types or self.job_queue.job_types,
+                'running': self._running,
+                'completed': self._completed,
+                'failed': self._failed
+            }
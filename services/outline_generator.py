@@ -0,0 +1,78 @@
+"""PPT大纲生成（作为后台任务执行）"""
+import logging
+from services.scheduler import PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class OutlineGenerator:
+    """大纲生成器"""
+
+    def __init__(self, db_manager, gemini_service, job_queue):
+        self.db_manager = db_manager
+        self.gemini_service = gemini_service
+        self.job_queue = job_queue
+
+        # 文本接口调用已有重试，任务失败时由用户重新发起，不自动重试；用户在页面上等待结果，优先执行
+        self.job_queue.register('generate_outline', self._run_outline_job, max_attempts=1,
+                                priority=PRIORITY_INTERACTIVE)
+        logger.info("OutlineGenerator初始化完成")
+
+    def start_generation(self, project_id, custom_prompt=None):
+        """提交大纲生成任务，返回任务ID"""
+        project = self.db_manager.get_ppt_project(project_id)
+        return self.job_queue.enqueue(
+            'generate_outline',
+            {'project_id': project_id, 'custom_prompt': custom_prompt},
+            dedupe_key=f'outline:{project_id}',
+            fair_key=f"workspace:{project['workspace_id']}" if project else None
+        )
+
+    def _run_outline_job(self, payload):
+        """执行大纲生成任务"""
+        return self.generate_outline(payload['project_id'], payload.get('custom_prompt'))
+
+    def generate_outline(self, project_id, custom_prompt=None):
+        """生成并保存项目大纲"""
+        print(f"[大纲生成] 开始生成项目 {project_id} 的大纲")
+        project = self.db_manager.get_ppt_project(project_id)
+        if not project:
+            raise ValueError(f'PPT项目不存在: {project_id}')
+
+        print(f"[大纲生成] 获取知识库文本，工作区ID: {project['workspace_id']}")
+        # 获取知识库文本
+        knowledge_text = self.db_manager.get_workspace_knowledge_text(project['workspace_id'])
+        print(f"[大纲生成] 知识库文本长度: {len(knowledge_text)} 字符")
+
+        print(f"[大纲生成] 调用Gemini API生成大纲，期望页数: {project['expected_pages']}")
+        # 调用Gemini生成大纲
+        if custom_prompt:
+            print(f"[大纲生成] 使用自定义提示词")
+            outline_data = self.gemini_service.generate_outline_with_custom_prompt(custom_prompt)
+        else:
+            outline_data = self.gemini_service.generate_outline(
+                knowledge_text,
+                project['user_prompt'],
+                project['expected_pages']
+            )
+        print(f"[大纲生成] Gemini API返回成功，生成了 {len(outline_data.get('pages', []))} 页")
+
+        # 删除旧大纲
+        self.db_manager.delete_outline_pages(project_id)
+        print(f"[大纲生成] 已删除旧大纲")
+
+        # 保存新大纲
+        for page in outline_data['pages']:
+            self.db_manager.add_outline_page(
+                project_id,
+                page['page_number'],
+                page['title'],
+                page['content'],
+                page.get('image_prompt', '')
+            )
+        print(f"[大纲生成] 已保存新大纲到数据库")
+
+        # 更新项目状态
+        self.db_manager.update_ppt_project_status(project_id, 'outline_generated')
+        print(f"[大纲生成] 项目状态已更新为 outline_generated")
+        return outline_data
@@ -1,23 +1,191 @@
 """PPT生成流程控制"""
 import os
+import json
+import time
+import hashlib
 import logging
 import threading
-from typing import Generator, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Generator, Dict, Any, Optional, Tuple
+from services.circuit_breaker import CircuitOpenError
+from services.retry import classify_error, RETRYABLE
+from services.cancellation import CancelToken, OperationCancelled
+from services.scheduler import FairShareScheduler, PRIORITY_INTERACTIVE, PRIORITY_STYLES, PRIORITY_BATCH
+from services.result_cache import file_digest
 
 logger = logging.getLogger(__name__)
 
+STOPPED_STATUSES = ('paused', 'cancelled')  # 用户暂停或取消生成后的项目状态
+
+
+class GenerationControl:
+    """一次页面生成的暂停/取消控制
+
+    暂停：不再开始新的页面，进行中的页面继续完成；取消：同时中断进行中的请求和重试。
+    未开始或被中断的页面保持待生成状态，继续生成时重新生成。
+    """
+
+    def __init__(self):
+        self.token = CancelToken()
+        self.done = threading.Event()
+        self._paused = threading.Event()
+        self._lock = threading.Lock()
+        self.skipped = 0  # 因暂停或取消而未生成的页面数
+
+    @property
+    def stop_status(self):
+        """已请求的停止状态（cancelled/paused），未请求时为None"""
+        if self.token.cancelled:
+            return 'cancelled'
+        if self._paused.is_set():
+            return 'paused'
+        return None
+
+    def stop(self, status):
+        if status == 'cancelled':
+            self.token.cancel('生成已取消')
+        else:
+            self._paused.set()
+
+    def mark_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
 
 class PPTGenerator:
     """PPT生成器"""
 
-    def __init__(self, config, db_manager, banana_service):
+    def __init__(self, config, db_manager, banana_service, job_queue, progress_store, image_derivatives=None,
+                 export_artifacts=None, scheduler=None):
         self.config = config
         self.db_manager = db_manager
         self.banana_service = banana_service
-        self.generation_status = {}  # 存储生成状态
-        self.style_generation_status = {}  # 存储样式生成状态
+        self.job_queue = job_queue  # 持久化任务队列，样式和页面生成都作为后台任务执行
+        self.progress_store = progress_store  # 生成进度（多进程共享），键为 pages:<项目ID> 和 styles:<项目ID>
+        self.image_derivatives = image_derivatives  # 衍生图服务（可选），图片生成后预先生成缩略图
+        self.export_artifacts = export_artifacts  # 导出文件预生成服务（可选），页面完成后在后台重新组装导出文件
+        self._controls = {}  # project_id -> 本进程中正在执行的生成控制
+        self._controls_lock = threading.Lock()
+        self._style_digests = {}  # (路径, 修改时间, 大小) -> 样式图片内容摘要，计算页面输入指纹时使用
+        # 全局图片生成名额，限制所有项目同时进行的生成数，按优先级和工作区/项目公平分配
+        self.scheduler = scheduler or FairShareScheduler(config.MAX_CONCURRENT_PAGE_GENERATIONS)
+
+        # 注册后台任务处理函数（样式生成失败时由用户重新发起，不自动重试）
+        self.job_queue.register('generate_pages', self._run_pages_job, priority=PRIORITY_BATCH,
+                                on_dead=self._pages_job_dead)
+        self.job_queue.register('generate_styles', self._run_styles_job, max_attempts=1, priority=PRIORITY_STYLES,
+                                on_dead=self._styles_job_dead)
         logger.info("PPTGenerator初始化完成")
 
+    def _schedule_derivatives(self, image_path):
+        """在后台预先生成图片的缩略图和预览图"""
+        if self.image_derivatives and self.config.IMAGE_DERIVATIVE_EAGER:
+            self.image_derivatives.schedule(image_path)
+
+    def _page_completed(self, project_id, image_path):
+        """页面图片生成完成后的后台处理：衍生图和导出文件"""
+        self._schedule_derivatives(image_path)
+        if self.export_artifacts:
+            self.export_artifacts.page_ready(project_id, image_path)
+
+    @staticmethod
+    def pages_progress_key(project_id):
+        return f'pages:{project_id}'
+
+    @staticmethod
+    def styles_progress_key(project_id):
+        return f'styles:{project_id}'
+
+    @staticmethod
+    def fair_key(project):
+        """任务公平调度的分组（按工作区）"""
+        return f"workspace:{project['workspace_id']}" if project else None
+
+    def has_active_generation(self, project_id):
+        """项目是否有排队中或执行中的页面生成任务"""
+        return self.db_manager.has_active_job(f'pages:{project_id}')
+
+    def get_generation_status(self, project_id):
+        """获取页面生成状态，未开始时返回None"""
+        return self.progress_store.get(self.pages_progress_key(project_id))
+
+    def get_style_generation_status(self, project_id):
+        """获取样式生成状态，未开始时返回None"""
+        return self.progress_store.get(self.styles_progress_key(project_id))
+
+    def _update_generation_status(self, project_id, **fields):
+        """更新页面生成状态的部分字段（状态不存在时不修改）"""
+        def apply(status):
+            if status is None:
+                return None
+            status.update(fields)
+            return status
+        self.progress_store.update(self.pages_progress_key(project_id), apply, 'progress')
+
+    def _publish_page_event(self, project_id, page_number, status, image_path=None, image_size=None, error=None):
+        """推送单页状态变化事件（开始生成、完成、失败）"""
+        try:
+            self.progress_store.publish_event(self.pages_progress_key(project_id), 'page', {
+                'page_number': page_number,
+                'status': status,
+                'image_path': image_path,
+                'image_size': image_size,
+                'error_message': error
+            })
+        except Exception as e:
+            logger.warning(f"推送第 {page_number} 页状态事件失败: {str(e)}")
+
+    def pause_generation(self, project_id):
+        """暂停页面生成（进行中的页面完成后停止），项目不在生成中时返回False"""
+        return self._stop_generation(project_id, 'paused')
+
+    def cancel_generation(self, project_id):
+        """取消页面生成（中断进行中的请求和重试），项目不在生成中时返回False"""
+        return self._stop_generation(project_id, 'cancelled')
+
+    def is_stopping(self, project_id, project=None):
+        """项目已暂停或取消但生成任务还未结束"""
+        project = project or self.db_manager.get_ppt_project(project_id)
+        return bool(project) and project['status'] in STOPPED_STATUSES and self.has_active_generation(project_id)
+
+    def _stop_generation(self, project_id, status):
+        """持久化暂停/取消状态，执行生成任务的进程（可能是其他进程）轮询项目状态后停止"""
+        if not self.db_manager.transition_ppt_project_status(project_id, ('generating',), status):
+            return False
+        logger.info(f"项目 {project_id} 请求{'取消' if status == 'cancelled' else '暂停'}生成")
+
+        # 任务在本进程中执行时立即通知，不必等待下一次轮询
+        with self._controls_lock:
+            control = self._controls.get(project_id)
+        if control:
+            control.stop(status)
+
+        def mark_stopping(current):
+            if current is None or current.get('status') not in ('queued', 'generating'):
+                return None
+            current['status'] = 'cancelling' if status == 'cancelled' else 'pausing'
+            return current
+        self.progress_store.update(self.pages_progress_key(project_id), mark_stopping, 'progress')
+
+        # 没有未结束的任务时直接结束；否则由任务停止后写入最终状态
+        if not self.has_active_generation(project_id):
+            self._update_generation_status(project_id, status=status)
+        return True
+
+    def _watch_control(self, project_id, control):
+        """生成期间轮询项目状态，发现已暂停或取消时通知生成控制"""
+        while not control.done.wait(self.config.GENERATION_CONTROL_POLL_INTERVAL):
+            try:
+                project = self.db_manager.get_ppt_project(project_id)
+            except Exception as e:
+                logger.warning(f"查询项目 {project_id} 状态失败: {str(e)}")
+                continue
+            status = project['status'] if project else 'cancelled'
+            if status in STOPPED_STATUSES:
+                control.stop(status)
+                if status == 'cancelled':
+                    return
+
     def load_prompt(self, prompt_file):
         """加载提示词文件"""
         import os
@@ -25,17 +193,68 @@ class PPTGenerator:
         with open(prompt_path, 'r', encoding='utf-8') as f:
             return f.read()
 
-    def generate_style_templates(self, project_id, project, custom_prompt=''):
-        """生成3个样式模板"""
+    def start_style_generation(self, project_id, custom_prompt='', use_cache=True):
+        """提交样式模板生成任务，返回任务ID"""
+        project = self.db_manager.get_ppt_project(project_id)
+        self.progress_store.set(self.styles_progress_key(project_id), {
+            'current': 0,
+            'total': 3,
+            'status': 'queued',
+            'message': '排队中...'
+        })
+        return self.job_queue.enqueue(
+            'generate_styles',
+            {'project_id': project_id, 'custom_prompt': custom_prompt, 'use_cache': use_cache},
+            dedupe_key=f'styles:{project_id}',
+            fair_key=self.fair_key(project)
+        )
+
+    def _run_styles_job(self, payload):
+        """执行样式模板生成任务"""
+        project_id = payload['project_id']
+        project = self.db_manager.get_ppt_project(project_id)
+        if not project:
+            logger.warning(f"项目不存在，跳过样式生成任务: project_id={project_id}")
+            return None
+        styles = self.generate_style_templates(project_id, project, custom_prompt=payload.get('custom_prompt', ''),
+                                               use_cache=payload.get('use_cache', True))
+        return {'styles': len(styles)}
+
+    def _styles_job_dead(self, payload, error):
+        """样式生成任务失败且不再重试（包括执行者崩溃后租约过期）时标记样式生成失败，前端停止等待"""
+        def mark_failed(status):
+            if status is not None and status.get('status') in ('completed', 'failed'):
+                return None
+            status = status or {'current': 0, 'total': 3}
+            status['status'] = 'failed'
+            status['message'] = error
+            return status
+        self.progress_store.update(self.styles_progress_key(payload['project_id']), mark_failed)
+
+    def generate_style_templates(self, project_id, project, custom_prompt='', use_cache=True):
+        """并发生成3个样式模板，每个模板完成后立即入库，单个失败不影响其他模板"""
         logger.info(f"开始为项目 {project_id} 生成样式模板, custom_prompt={custom_prompt}")
 
-        # 初始化状态
-        self.style_generation_status[project_id] = {
+        style_descriptions = [
+            "现代简约风格，使用大量留白和几何图形",
+            "商务专业风格，使用深色背景和金色点缀",
+            "创意活泼风格，使用明亮色彩和动态元素"
+        ]
+        total = len(style_descriptions)
+
+        # 初始化状态（slots 记录每个样式的独立状态），每次变化后整体写入进度存储
+        progress_key = self.styles_progress_key(project_id)
+        status = {
             'current': 0,
-            'total': 3,
+            'total': total,
             'status': 'generating',
-            'message': '准备生成样式模板...'
+            'message': '准备生成样式模板...',
+            'slots': [
+                {'index': i, 'status': 'generating', 'image_path': None, 'error': None}
+                for i in range(total)
+            ]
         }
+        self.progress_store.set(progress_key, status)
 
         # 删除旧的样式模板
         self.db_manager.delete_style_templates(project_id)
@@ -52,45 +271,75 @@ class PPTGenerator:
         logger.info(f"创建输出目录: {output_dir}")
 
         styles = []
-        style_descriptions = [
-            "现代简约风格，使用大量留白和几何图形",
-            "商务专业风格，使用深色背景和金色点缀",
-            "创意活泼风格，使用明亮色彩和动态元素"
-        ]
-
-        for i, description in enumerate(style_descriptions):
-            # 如果有自定义提示词，追加到描述后面
-            final_description = description
-            if custom_prompt:
-                final_description = f"{description}。额外要求：{custom_prompt}"
-
-            logger.info(f"正在生成样式模板 {i+1}/3: {final_description}")
-            self.style_generation_status[project_id]['current'] = i + 1
-            self.style_generation_status[project_id]['message'] = f'正在生成样式 {i+1}/3...'
-
-            output_path = os.path.join(output_dir, f'style_{i}.png')
-            try:
-                self.banana_service.generate_style_template(final_description, output_path)
-                logger.info(f"样式模板 {i+1} 生成成功: {output_path}")
-
-                style_id = self.db_manager.add_style_template(project_id, i, output_path)
-                styles.append({
-                    'id': style_id,
-                    'template_index': i,
-                    'image_path': output_path
-                })
-            except Exception as e:
-                logger.error(f"生成样式模板 {i+1} 失败: {str(e)}")
-                self.style_generation_status[project_id]['status'] = 'failed'
-                self.style_generation_status[project_id]['message'] = f'生成样式 {i+1} 失败: {str(e)}'
-                raise Exception(f'生成样式模板{i}失败: {str(e)}')
-
-        self.style_generation_status[project_id]['status'] = 'completed'
-        self.style_generation_status[project_id]['message'] = '样式模板生成完成'
-        logger.info(f"项目 {project_id} 的所有样式模板生成完成")
+        with ThreadPoolExecutor(max_workers=total, thread_name_prefix=f'ppt{project_id}-style') as executor:
+            futures = {}
+            for i, description in enumerate(style_descriptions):
+                # 如果有自定义提示词，追加到描述后面
+                final_description = description
+                if custom_prompt:
+                    final_description = f"{description}。额外要求：{custom_prompt}"
+
+                logger.info(f"提交样式模板生成任务 {i+1}/{total}: {final_description}")
+                output_path = os.path.join(output_dir, f'style_{i}.png')
+                future = executor.submit(self._generate_style_template, project, final_description, output_path,
+                                         use_cache)
+                futures[future] = (i, output_path)
+
+            status['message'] = f'正在并行生成 {total} 个样式...'
+            self.progress_store.set(progress_key, status)
+
+            # 按完成顺序处理，完成一个就入库一个，前端轮询即可立即看到
+            for future in as_completed(futures):
+                i, output_path = futures[future]
+                slot = status['slots'][i]
+                try:
+                    future.result()
+                    style_id = self.db_manager.add_style_template(project_id, i, output_path)
+                    styles.append({
+                        'id': style_id,
+                        'template_index': i,
+                        'image_path': output_path
+                    })
+                    slot['status'] = 'completed'
+                    slot['image_path'] = output_path
+                    self._schedule_derivatives(output_path)
+                    logger.info(f"样式模板 {i+1} 生成成功: {output_path}")
+                except Exception as e:
+                    logger.error(f"生成样式模板 {i+1} 失败: {str(e)}")
+                    slot['status'] = 'failed'
+                    slot['error'] = str(e)
+
+                status['current'] += 1
+                status['message'] = f'已完成 {status["current"]}/{total} 个样式'
+                self.progress_store.set(progress_key, status)
+
+        styles.sort(key=lambda s: s['template_index'])
+        failed_slots = [slot for slot in status['slots'] if slot['status'] == 'failed']
+
+        if not styles:
+            status['status'] = 'failed'
+            status['message'] = f'所有样式生成失败: {failed_slots[0]["error"]}'
+            self.progress_store.set(progress_key, status)
+            logger.error(f"项目 {project_id} 的所有样式模板生成失败")
+            raise Exception(f'生成样式模板失败: {failed_slots[0]["error"]}')
+
+        status['status'] = 'completed'
+        if failed_slots:
+            failed_names = '、'.join(str(slot['index'] + 1) for slot in failed_slots)
+            status['message'] = f'样式模板生成完成，样式 {failed_names} 生成失败'
+            logger.warning(f"项目 {project_id} 的样式模板部分生成失败: {failed_names}")
+        else:
+            status['message'] = '样式模板生成完成'
+            logger.info(f"项目 {project_id} 的所有样式模板生成完成")
+        self.progress_store.set(progress_key, status)
         return styles
 
 
+    def _generate_style_template(self, project, description, output_path, use_cache=True):
+        """占用一个样式优先级的生成名额生成样式模板"""
+        with self.scheduler.slot(PRIORITY_STYLES, project['workspace_id'], project['id']):
+            return self.banana_service.generate_style_template(description, output_path, use_cache=use_cache)
+
     def build_page_prompts(self, outline_pages, selected_style):
         """构建所有页面的生成提示词"""
         # 加载提示词模板
@@ -123,13 +372,81 @@ class PPTGenerator:
 
         return prompts
 
-    def start_generation(self, project_id, custom_prompts=None):
-        """启动PPT页面生成（异步）"""
-        logger.info(f"启动PPT页面生成任务: project_id={project_id}")
-        # 在新线程中执行生成任务
-        thread = threading.Thread(target=self._generate_pages, args=(project_id, custom_prompts))
-        thread.daemon = True
-        thread.start()
+    @staticmethod
+    def page_content(page):
+        """根据大纲构建页面内容描述"""
+        page_content = f"标题: {page['title']}\n内容: {page['content']}"
+        if page.get('image_prompt'):
+            page_content += f"\n图片提示: {page['image_prompt']}"
+        return page_content
+
+    def _style_digest(self, style_ref):
+        """样式参考图片内容摘要（按修改时间缓存；没有样式参考时为空）"""
+        if not style_ref or not os.path.exists(style_ref):
+            return ''
+        stat = os.stat(style_ref)
+        memo_key = (os.path.abspath(style_ref), stat.st_mtime_ns, stat.st_size)
+        digest = self._style_digests.get(memo_key)
+        if digest is None:
+            digest = file_digest(style_ref)
+            self._style_digests[memo_key] = digest
+        return digest
+
+    def page_fingerprint(self, page, style_ref, image_size):
+        """页面输入指纹：由大纲生成的提示词、样式参考图片内容和分辨率的摘要
+
+        用户在生成时额外编辑的提示词不计入指纹，同步时大纲未变化的页面不会被覆盖。
+        """
+        payload = {
+            'prompt': self.banana_service.build_page_prompt(self.page_content(page), style_ref),
+            'style': self._style_digest(style_ref),
+            'image_size': image_size
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def page_image_size(self, project):
+        """项目当前的页面生成分辨率（草稿模式下使用最低分辨率）"""
+        if project.get('draft_mode'):
+            return self.config.DRAFT_PAGE_IMAGE_SIZE
+        return self.config.PPT_PAGE_IMAGE_SIZE
+
+    def is_draft_page(self, page):
+        """页面是否以低于最终分辨率的草稿分辨率生成（未记录分辨率的旧页面视为最终分辨率）"""
+        return bool(page.get('image_size')) and page['image_size'] != self.config.PPT_PAGE_IMAGE_SIZE
+
+    def start_generation(self, project_id, custom_prompts=None, use_cache=True, page_numbers=None, image_size=None):
+        """提交PPT页面生成任务，返回任务ID（同一项目已有未结束的生成任务时返回该任务）"""
+        logger.info(f"提交PPT页面生成任务: project_id={project_id}")
+        self.db_manager.update_ppt_project_status(project_id, 'generating')
+
+        def mark_queued(status):
+            if status and status.get('status') in ('queued', 'generating'):
+                return None
+            return {'current_page': 0, 'total_pages': 0, 'status': 'queued', 'error': None}
+        self.progress_store.update(self.pages_progress_key(project_id), mark_queued, 'progress')
+        return self.job_queue.enqueue(
+            'generate_pages',
+            {
+                'project_id': project_id,
+                'custom_prompts': custom_prompts,
+                'use_cache': use_cache,
+                'page_numbers': page_numbers,
+                'image_size': image_size
+            },
+            dedupe_key=f'pages:{project_id}',
+            fair_key=self.fair_key(self.db_manager.get_ppt_project(project_id))
+        )
+
+    def _run_pages_job(self, payload):
+        """执行PPT页面生成任务"""
+        self._generate_pages(
+            payload['project_id'],
+            custom_prompts=payload.get('custom_prompts'),
+            use_cache=payload.get('use_cache', True),
+            page_numbers=payload.get('page_numbers'),
+            image_size=payload.get('image_size')
+        )
 
     def resume_generation(self, project_id):
         """恢复未完成的生成任务"""
@@ -141,32 +458,106 @@ class PPTGenerator:
             logger.warning(f"项目不存在: project_id={project_id}")
             return False
 
-        # 只恢复状态为generating的项目
-        if project['status'] != 'generating':
+        # 只恢复生成中、已暂停或已取消的项目
+        if project['status'] not in ('generating',) + STOPPED_STATUSES:
             logger.info(f"项目状态不是generating，无需恢复: status={project['status']}")
             return False
 
         # 检查是否有未完成的页面
         pages = self.db_manager.get_ppt_pages(project_id)
-        incomplete_pages = [p for p in pages if p['status'] in ['pending', 'failed']]
+        incomplete_pages = [p for p in pages if p['status'] in ['pending', 'generating', 'failed', 'deferred']]
 
-        if not incomplete_pages:
+        if pages and not incomplete_pages:
             logger.info(f"所有页面已完成，更新项目状态")
             self.db_manager.update_ppt_project_status(project_id, 'completed')
             return False
 
         logger.info(f"发现 {len(incomplete_pages)} 个未完成页面，恢复生成任务")
-        # 启动生成任务
+        # 提交生成任务（已有未结束的生成任务时不会重复提交）
         self.start_generation(project_id)
         return True
 
-    def _generate_pages(self, project_id, custom_prompts=None):
-        """生成所有PPT页面"""
+    def sync_pages(self, project_id):
+        """只重新生成输入指纹变化（大纲、样式或分辨率改变）和未完成的页面，返回要重新生成的页码
+
+        已定稿为最终分辨率的页面在草稿模式下不会因分辨率不同而重新生成；
+        大纲中已删除的页面同时删除页面记录。
+        """
+        project = self.db_manager.get_ppt_project(project_id)
+        outline_pages = self.db_manager.get_outline_pages(project_id)
+        pages = {p['page_number']: p for p in self.db_manager.get_ppt_pages(project_id)}
+
+        # 删除大纲中已不存在的页面
+        outline_numbers = {page['page_number'] for page in outline_pages}
+        for page_number in set(pages) - outline_numbers:
+            self.db_manager.delete_ppt_page(project_id, page_number)
+
+        styles = self.db_manager.get_style_templates(project_id)
+        selected_style = None
+        if project['selected_style_index'] is not None:
+            selected_style = next(
+                (s for s in styles if s['template_index'] == project['selected_style_index']),
+                None
+            )
+        style_ref = selected_style['image_path'] if selected_style else ''
+        image_size = self.page_image_size(project)
+
+        changed = []
+        for page in outline_pages:
+            existing = pages.get(page['page_number'])
+            if not existing or existing['status'] != 'completed':
+                changed.append(page['page_number'])
+                continue
+            page_size = existing['image_size'] or self.config.PPT_PAGE_IMAGE_SIZE
+            expected_size = page_size if page_size == self.config.PPT_PAGE_IMAGE_SIZE else image_size
+            if existing['input_fingerprint'] is None:
+                # 记录指纹之前生成的页面：按提示词和分辨率判断
+                prompt = self.banana_service.build_page_prompt(self.page_content(page), style_ref)
+                unchanged = existing['prompt'] == prompt and page_size == expected_size
+            else:
+                unchanged = existing['input_fingerprint'] == self.page_fingerprint(page, style_ref, expected_size)
+            if not unchanged:
+                changed.append(page['page_number'])
+
+        logger.info(f"同步项目 {project_id}: {len(outline_pages)} 页中 {len(changed)} 页需要重新生成: {changed}")
+        if changed:
+            self.start_generation(project_id, page_numbers=changed, image_size=image_size)
+        return changed
+
+    def finalize_pages(self, project_id, page_numbers=None):
+        """以最终分辨率重新生成草稿页面（page_numbers 为空时定稿所有草稿页），返回要定稿的页码"""
+        pages = self.db_manager.get_ppt_pages(project_id)
+        draft_pages = [
+            p for p in pages
+            if p['status'] == 'completed' and self.is_draft_page(p)
+            and (page_numbers is None or p['page_number'] in page_numbers)
+        ]
+        if not draft_pages:
+            return []
+
+        # 沿用草稿使用的完整提示词，只提高分辨率
+        custom_prompts = [
+            {'page_number': p['page_number'], 'prompt': p['prompt']}
+            for p in draft_pages if p['prompt']
+        ]
+        numbers = [p['page_number'] for p in draft_pages]
+        logger.info(f"定稿项目 {project_id} 的 {len(numbers)} 个草稿页: {numbers}")
+        self.start_generation(project_id, custom_prompts, page_numbers=numbers,
+                              image_size=self.config.PPT_PAGE_IMAGE_SIZE)
+        return numbers
+
+    def _generate_pages(self, project_id, custom_prompts=None, use_cache=True, page_numbers=None, image_size=None):
+        """生成PPT页面（page_numbers 为空时生成所有未完成的页面，image_size 为空时按项目草稿模式决定）"""
         try:
             # 获取项目信息
             project = self.db_manager.get_ppt_project(project_id)
             if not project:
                 return
+            if project['status'] in STOPPED_STATUSES:
+                # 任务开始前已被暂停或取消
+                logger.info(f"项目 {project_id} 已{'取消' if project['status'] == 'cancelled' else '暂停'}，不再生成")
+                self._update_generation_status(project_id, status=project['status'])
+                return
 
             # 获取大纲
             outline_pages = self.db_manager.get_outline_pages(project_id)
@@ -203,18 +594,47 @@ class PPTGenerator:
                 existing_pages = self.db_manager.get_ppt_pages(project_id)
             else:
                 logger.info(f"恢复生成，已有 {len(existing_pages)} 条页面记录")
-
-            # 更新项目状态
-            self.db_manager.update_ppt_project_status(project_id, 'generating')
+                # 大纲中新增的页面补充页面记录
+                existing_numbers = {p['page_number'] for p in existing_pages}
+                missing_pages = [p for p in outline_pages if p['page_number'] not in existing_numbers]
+                if missing_pages:
+                    for page in missing_pages:
+                        self.db_manager.add_ppt_page(project_id, page['page_number'])
+                    existing_pages = self.db_manager.get_ppt_pages(project_id)
+
+            # 筛选需要生成的页面，保持页码顺序：指定页码时重新生成这些页面，否则跳过已完成的页面
+            pending_pages = []
+            for page in outline_pages:
+                if page_numbers is not None:
+                    if page['page_number'] in page_numbers:
+                        pending_pages.append(page)
+                    continue
+                existing_page = next((p for p in existing_pages if p['page_number'] == page['page_number']), None)
+                if existing_page and existing_page['status'] == 'completed':
+                    logger.info(f"第 {page['page_number']} 页已完成，跳过")
+                    continue
+                pending_pages.append(page)
+            pending_numbers = {page['page_number'] for page in pending_pages}
+            image_size = image_size or self.page_image_size(project)
+
+            # 项目状态已由 start_generation 设为 generating；开始检查之后被暂停或取消时不能覆盖，直接停止
+            if not self.db_manager.transition_ppt_project_status(project_id, ('generating',), 'generating'):
+                project = self.db_manager.get_ppt_project(project_id)
+                status = project['status'] if project else 'cancelled'
+                logger.info(f"项目 {project_id} 状态已变为 {status}，不再生成")
+                if status in STOPPED_STATUSES:
+                    self._update_generation_status(project_id, status=status)
+                return
 
             # 初始化生成状态
-            completed_count = len([p for p in existing_pages if p['status'] == 'completed'])
-            self.generation_status[project_id] = {
+            completed_count = len([p for p in existing_pages
+                                   if p['status'] == 'completed' and p['page_number'] not in pending_numbers])
+            self.progress_store.set(self.pages_progress_key(project_id), {
                 'current_page': completed_count,
                 'total_pages': len(outline_pages),
                 'status': 'generating',
                 'error': None
-            }
+            }, 'progress')
             logger.info(f"生成状态初始化: 已完成 {completed_count}/{len(outline_pages)} 页")
 
             # 构建自定义提示词字典（如果提供）
@@ -223,120 +643,243 @@ class PPTGenerator:
                 for prompt_data in custom_prompts:
                     custom_prompts_dict[prompt_data['page_number']] = prompt_data['prompt']
 
-            # 逐页生成
-            for page in outline_pages:
-                # 检查该页是否已完成
-                existing_page = next((p for p in existing_pages if p['page_number'] == page['page_number']), None)
-                if existing_page and existing_page['status'] == 'completed':
-                    logger.info(f"第 {page['page_number']} 页已完成，跳过")
-                    continue
-
-                try:
-                    logger.info(f"开始生成第 {page['page_number']} 页")
-                    # 更新页面状态为生成中
-                    self.db_manager.update_ppt_page_status(project_id, page['page_number'], 'generating')
-
-                    # 输出路径
-                    output_path = os.path.join(output_dir, f'page_{page["page_number"]:03d}.png')
-
-                    # 使用自定义提示词或默认方式生成
-                    if page['page_number'] in custom_prompts_dict:
-                        # 使用自定义提示词（用户已经编辑过的完整提示词）
-                        prompt = custom_prompts_dict[page['page_number']]
-                        logger.info(f"使用自定义提示词生成第 {page['page_number']} 页")
-                        # 自定义提示词情况下，也需要传入样式模板图片
-                        style_ref = selected_style['image_path'] if selected_style else ''
-                        # 使用配置的PPT页面分辨率
-                        aspect_ratio = self.config.IMAGE_ASPECT_RATIO
-                        image_size = self.config.PPT_PAGE_IMAGE_SIZE
-                        # 注意：自定义提示词时，直接用提示词生成，但仍传入样式图片作为参考
-                        if style_ref:
-                            self.banana_service.generate_image_with_reference(prompt, style_ref, output_path, aspect_ratio=aspect_ratio, image_size=image_size)
-                        else:
-                            self.banana_service.generate_image(prompt, output_path, aspect_ratio=aspect_ratio, image_size=image_size)
-                    else:
-                        # 构建默认页面内容
-                        page_content = f"标题: {page['title']}\n内容: {page['content']}"
-                        if page.get('image_prompt'):
-                            page_content += f"\n图片提示: {page['image_prompt']}"
-
-                        # 获取样式模板图片路径
-                        style_ref = selected_style['image_path'] if selected_style else ''
-
-                        # 调用 banana_service 生成图片（会将样式模板图作为参考图片传入API）
-                        self.banana_service.generate_ppt_page(page_content, style_ref, output_path)
-
-                    image_path = output_path
-
-                    # 更新页面状态和路径
-                    self.db_manager.update_ppt_page(
-                        project_id,
-                        page['page_number'],
-                        image_path,
-                        'completed'
-                    )
-
-                    # 更新生成状态
-                    self.generation_status[project_id]['current_page'] += 1
-                    logger.info(f"第 {page['page_number']} 页生成完成")
-
-                except Exception as e:
-                    logger.error(f"生成第 {page['page_number']} 页失败: {str(e)}")
-                    # 更新页面状态为失败
-                    self.db_manager.update_ppt_page(
-                        project_id,
-                        page['page_number'],
-                        '',
-                        'failed',
-                        str(e)
-                    )
-                    # 继续生成下一页
-                    continue
+            # 并发生成：单个项目最多同时生成 PAGE_GENERATION_CONCURRENCY 页，
+            # 所有项目共享 MAX_CONCURRENT_PAGE_GENERATIONS 个全局名额
+            concurrency = max(1, min(self.config.PAGE_GENERATION_CONCURRENCY, len(pending_pages) or 1))
+            logger.info(f"项目 {project_id} 待生成 {len(pending_pages)} 页，分辨率: {image_size}，并发数: {concurrency}")
+
+            # 暂停/取消控制：每页开始前、每次重试前检查，取消时中断进行中的请求
+            control = GenerationControl()
+            with self._controls_lock:
+                self._controls[project_id] = control
+            threading.Thread(target=self._watch_control, args=(project_id, control),
+                             name=f'ppt{project_id}-control', daemon=True).start()
+            try:
+                with ThreadPoolExecutor(max_workers=concurrency,
+                                        thread_name_prefix=f'ppt{project_id}-page') as executor:
+                    futures = [
+                        executor.submit(
+                            self._generate_single_page,
+                            project_id, page, output_dir, selected_style, custom_prompts_dict, use_cache,
+                            image_size, control, project['workspace_id']
+                        )
+                        for page in pending_pages
+                    ]
+                    for future in futures:
+                        future.result()
+            finally:
+                control.done.set()
+                with self._controls_lock:
+                    if self._controls.get(project_id) is control:
+                        del self._controls[project_id]
+
+            # 有页面因暂停或取消未生成：保留暂停/取消状态，继续生成时从这些页面开始
+            if control.skipped and control.stop_status:
+                self._update_generation_status(project_id, status=control.stop_status)
+                logger.info(f"项目 {project_id} 生成已{'取消' if control.stop_status == 'cancelled' else '暂停'}，"
+                            f"{control.skipped} 页未生成")
+                return
 
-            # 所有页面生成完成
-            self.generation_status[project_id]['status'] = 'completed'
+            # 所有页面生成完成（完成前恰好被暂停或取消时同样视为完成）
+            self._update_generation_status(project_id, status='completed')
             self.db_manager.update_ppt_project_status(project_id, 'completed')
             logger.info(f"项目 {project_id} 所有页面生成完成")
 
         except Exception as e:
-            logger.error(f"生成PPT页面失败: {str(e)}")
-            if project_id in self.generation_status:
-                self.generation_status[project_id]['status'] = 'failed'
-                self.generation_status[project_id]['error'] = str(e)
-            self.db_manager.update_ppt_project_status(project_id, 'failed')
-
-    def get_generation_progress(self, project_id) -> Generator[Dict[str, Any], None, None]:
-        """获取生成进度（生成器，用于SSE）"""
-        # 等待生成任务启动
-        max_wait = 30  # 最多等待30秒
-        wait_count = 0
-        while project_id not in self.generation_status and wait_count < max_wait:
-            import time
-            time.sleep(1)
-            wait_count += 1
-
-        if project_id not in self.generation_status:
-            yield {'error': '生成任务未启动'}
+            if classify_error(e) != RETRYABLE:
+                # 重试也无法恢复（如本地文件错误），直接标记失败，任务正常结束不再重新排队
+                logger.error(f"生成PPT页面失败（不可重试）: {str(e)}")
+                self._mark_generation_failed(project_id, str(e))
+                return
+            # 可重试的错误：项目保持排队状态，由任务队列重新排队，任务进入死信时才标记失败
+            logger.warning(f"生成PPT页面失败，等待任务队列重试: {str(e)}")
+            self._update_generation_status(project_id, status='queued', error=str(e))
+            raise
+
+    def _mark_generation_failed(self, project_id, error):
+        """将页面生成标记为失败"""
+        self._update_generation_status(project_id, status='failed', error=error)
+        self.db_manager.update_ppt_project_status(project_id, 'failed')
+
+    def _pages_job_dead(self, payload, error):
+        """页面生成任务重试次数用尽（转入死信）后标记项目失败"""
+        self._mark_generation_failed(payload['project_id'], error)
+
+    def _generate_single_page(self, project_id, page, output_dir, selected_style, custom_prompts_dict,
+                              use_cache=True, image_size=None, control=None, workspace_id=None):
+        """生成单个页面（在线程池中执行，失败时记录状态而不抛出异常）"""
+        control = control or GenerationControl()
+        if control.stop_status:
+            control.mark_skipped()
             return
+        try:
+            # 按批量生成优先级排队等待全局名额，与其他项目和工作区轮流获得名额
+            ticket = self.scheduler.acquire(PRIORITY_BATCH, workspace_id, project_id, control.token)
+        except OperationCancelled:
+            control.mark_skipped()
+            return
+        try:
+            # 等待全局名额期间可能已被暂停或取消
+            if control.stop_status:
+                control.mark_skipped()
+                return
+            try:
+                logger.info(f"开始生成第 {page['page_number']} 页")
+                # 更新页面状态为生成中
+                self.db_manager.update_ppt_page_status(project_id, page['page_number'], 'generating')
+                self._publish_page_event(project_id, page['page_number'], 'generating')
+
+                # 输出路径
+                output_path = os.path.join(output_dir, f'page_{page["page_number"]:03d}.png')
+
+                # 样式模板图片作为参考图片传入API
+                style_ref = selected_style['image_path'] if selected_style else ''
+
+                if page['page_number'] in custom_prompts_dict:
+                    # 使用自定义提示词（用户已经编辑过的完整提示词）
+                    prompt = custom_prompts_dict[page['page_number']]
+                    logger.info(f"使用自定义提示词生成第 {page['page_number']} 页")
+                else:
+                    # 构建默认页面内容
+                    prompt = self.banana_service.build_page_prompt(self.page_content(page), style_ref)
+                # 按开始生成时的输入计算指纹，生成期间大纲被修改时下次同步会重新生成
+                fingerprint = self.page_fingerprint(page, style_ref, image_size or self.config.PPT_PAGE_IMAGE_SIZE)
+
+                self.banana_service.render_page_prompt(prompt, style_ref, output_path, use_cache=use_cache,
+                                                       image_size=image_size, cancel_token=control.token)
+
+                image_path = output_path
+
+                # 更新页面状态和路径，记录生成分辨率和提示词（定稿时沿用）
+                self.db_manager.update_ppt_page(
+                    project_id,
+                    page['page_number'],
+                    image_path,
+                    'completed',
+                    image_size=image_size or self.config.PPT_PAGE_IMAGE_SIZE,
+                    prompt=prompt,
+                    input_fingerprint=fingerprint
+                )
 
-        # 持续推送进度
-        while True:
-            status = self.generation_status[project_id]
-            yield {
-                'current_page': status['current_page'],
-                'total_pages': status['total_pages'],
-                'status': status['status'],
-                'error': status['error']
-            }
-
-            # 如果已完成或失败，结束推送
-            if status['status'] in ['completed', 'failed']:
-                break
+                self._page_completed(project_id, image_path)
+                self._publish_page_event(project_id, page['page_number'], 'completed', image_path,
+                                         image_size or self.config.PPT_PAGE_IMAGE_SIZE)
+
+                # 更新生成状态
+                def increment(status):
+                    if status is None:
+                        return None
+                    status['current_page'] += 1
+                    return status
+                self.progress_store.update(self.pages_progress_key(project_id), increment, 'progress')
+                logger.info(f"第 {page['page_number']} 页生成完成")
+
+            except OperationCancelled:
+                self._page_cancelled(project_id, page['page_number'], control)
+            except CircuitOpenError as e:
+                logger.warning(f"第 {page['page_number']} 页暂缓生成: {str(e)}")
+                # 模型服务熔断中，标记为待重试（继续生成时会重新生成）
+                self._page_failed(project_id, page['page_number'], 'deferred', str(e))
+            except Exception as e:
+                if control.token.cancelled:
+                    # 取消导致的请求中断不算失败
+                    self._page_cancelled(project_id, page['page_number'], control)
+                    return
+                logger.error(f"生成第 {page['page_number']} 页失败: {str(e)}")
+                # 更新页面状态为失败
+                self._page_failed(project_id, page['page_number'], 'failed', str(e))
+        finally:
+            self.scheduler.release(ticket)
+
+    def _page_with_image(self, project_id, page_number):
+        """页面已有可用图片（如定稿中的草稿页）时返回页面记录，否则返回None"""
+        page = next((p for p in self.db_manager.get_ppt_pages(project_id) if p['page_number'] == page_number), None)
+        if page and page['image_path'] and os.path.exists(page['image_path']):
+            return page
+        return None
+
+    def _page_failed(self, project_id, page_number, status, error):
+        """页面生成失败或暂缓（status 为 failed/deferred）
+
+        已有可用图片的页面（如定稿失败的草稿页）保留原图片、分辨率和提示词，仍为已完成并记录错误；
+        否则标记为 status，继续生成时重新生成。
+        """
+        page = self._page_with_image(project_id, page_number)
+        if page:
+            logger.warning(f"第 {page_number} 页重新生成失败，保留原图片: {page['image_path']}")
+            self.db_manager.update_ppt_page(project_id, page_number, page['image_path'], 'completed', error,
+                                            image_size=page['image_size'])
+            self._publish_page_event(project_id, page_number, 'completed', page['image_path'], page['image_size'],
+                                     error=error)
+        else:
+            self.db_manager.update_ppt_page(project_id, page_number, '', status, error)
+            self._publish_page_event(project_id, page_number, status, error=error)
+
+    def _page_cancelled(self, project_id, page_number, control):
+        """页面生成被取消：已有图片的页面恢复为已完成（如定稿中的草稿页），否则恢复为待生成"""
+        logger.info(f"第 {page_number} 页生成已取消")
+        page = self._page_with_image(project_id, page_number)
+        if page:
+            self.db_manager.update_ppt_page_status(project_id, page_number, 'completed')
+            self._publish_page_event(project_id, page_number, 'completed', page['image_path'], page.get('image_size'))
+        else:
+            self.db_manager.update_ppt_page_status(project_id, page_number, 'pending')
+            self._publish_page_event(project_id, page_number, 'pending')
+        control.mark_skipped()
+
+    def stream_generation_events(self, project_id, last_event_id=None,
+                                 heartbeat=15) -> Generator[Optional[Tuple[int, str, Dict[str, Any]]], None, None]:
+        """推送生成进度事件（生成器，用于SSE），产出 (事件ID, 事件类型, 数据)，空闲 heartbeat 秒时产出None
+
+        事件类型为 progress（整体进度）和 page（单页开始生成、完成、失败或被取消）。
+        last_event_id 为空时先推送当前整体进度，否则从该事件之后继续推送（断线重连），整体进度结束后停止。
+        """
+        key = self.pages_progress_key(project_id)
+        store = self.progress_store
+        finished = ('completed', 'failed') + STOPPED_STATUSES
+
+        if last_event_id is None:
+            # 等待生成任务启动（最多等待30秒）
+            deadline = time.time() + 30
+            while True:
+                token = store.change_token(key)
+                cursor = store.latest_event_id(key)
+                status = store.get(key)
+                if status is not None:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0 or not store.wait_for_change(key, token, remaining):
+                    yield None, 'progress', {'error': '生成任务未启动'}
+                    return
+            yield cursor, 'progress', status
+            if status['status'] in finished:
+                return
+        else:
+            cursor = last_event_id
 
-            import time
-            time.sleep(2)  # 每2秒推送一次
+        while True:
+            token = store.change_token(key)
+            events = store.events_since(key, cursor)
+            for event_id, event_type, data in events:
+                cursor = event_id
+                yield event_id, event_type, data
+                if event_type == 'progress' and data.get('status') in finished:
+                    return
+            if events:
+                continue
+
+            # 重连时生成已经结束且没有新事件：推送最终进度后结束
+            status = store.get(key)
+            if status is None:
+                yield None, 'progress', {'error': '生成进度已过期'}
+                return
+            if status['status'] in finished:
+                yield cursor, 'progress', status
+                return
+            if not store.wait_for_change(key, token, heartbeat):
+                yield None
 
-    def regenerate_single_page(self, project_id, page_number, custom_prompt=''):
+    def regenerate_single_page(self, project_id, page_number, custom_prompt='', use_cache=True):
         """重新生成单页"""
         try:
             # 获取项目信息
@@ -370,43 +913,55 @@ class PPTGenerator:
             output_path = os.path.join(output_dir, f'page_{page_number:03d}.png')
 
             # 构建页面内容描述
-            page_content = f"标题: {page['title']}\n内容: {page['content']}"
-            if page['image_prompt']:
-                page_content += f"\n图片提示: {page['image_prompt']}"
+            page_content = self.page_content(page)
 
             # 如果有自定义提示词，追加到内容后面
             if custom_prompt:
                 page_content += f"\n额外要求: {custom_prompt}"
 
-            # 生成图片
+            # 生成图片（按项目草稿模式决定分辨率）
             style_ref = selected_style['image_path'] if selected_style else ''
-            self.banana_service.generate_ppt_page(page_content, style_ref, output_path)
+            image_size = self.page_image_size(project)
+            prompt = self.banana_service.build_page_prompt(page_content, style_ref)
+            fingerprint = self.page_fingerprint(page, style_ref, image_size)
+            # 用户在等待结果，优先于样式生成和批量页面生成获得名额
+            with self.scheduler.slot(PRIORITY_INTERACTIVE, project['workspace_id'], project_id):
+                self.banana_service.render_page_prompt(prompt, style_ref, output_path,
+                                                       use_cache=use_cache, image_size=image_size)
 
             # 更新页面状态
             self.db_manager.update_ppt_page(
                 project_id,
                 page_number,
                 output_path,
-                'completed'
+                'completed',
+                image_size=image_size,
+                prompt=prompt,
+                input_fingerprint=fingerprint
             )
+            self._page_completed(project_id, output_path)
+            self._publish_page_event(project_id, page_number, 'completed', output_path, image_size)
 
             return {
                 'page_number': page_number,
                 'image_path': output_path,
-                'status': 'completed'
+                'status': 'completed',
+                'image_size': image_size
             }
 
         except Exception as e:
             # 增加重试次数
             self.db_manager.increment_page_retry_count(project_id, page_number)
 
-            # 更新页面状态
+            # 更新页面状态（模型服务熔断中时标记为待重试）
             self.db_manager.update_ppt_page(
                 project_id,
                 page_number,
                 '',
-                'failed',
+                'deferred' if isinstance(e, CircuitOpenError) else 'failed',
                 str(e)
             )
+            self._publish_page_event(project_id, page_number,
+                                     'deferred' if isinstance(e, CircuitOpenError) else 'failed', error=str(e))
 
             raise Exception(f'重新生成页面失败: {str(e)}')
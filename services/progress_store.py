@@ -0,0 +1,231 @@
+"""生成进度存储（保存在数据库中，多个进程共享）"""
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 60  # 清理过期进度记录的最短间隔（秒）
+CHANNEL_IDLE_SECONDS = 60  # 没有等待者的订阅键保留的时间（秒），期间重新等待不必重新建立变更标记
+
+
+class _Channel:
+    """一个进度键的变更通知（所有键共用同一把锁）"""
+
+    def __init__(self, lock, sequence):
+        self.changed = threading.Condition(lock)
+        self.sequence = sequence  # 最近一次变更的序号
+        self.waiters = 0
+        self.marker = None  # 监视线程上次看到的数据库变更标记（最新事件ID, 版本号）
+        self.idle_since = time.time()
+
+
+class ProgressStore:
+    """按键保存生成进度和进度事件，支持过期清理和变更订阅
+
+    进度保存在数据库的 progress 表中，Web进程和执行者进程看到的是同一份进度，进程重启后也不会丢失；
+    每条记录在最后一次更新 PROGRESS_TTL 秒后过期并被清理，内存中不保留进度。
+    进度事件（progress_events 表）按ID递增，订阅者记住已收到的最后一个事件ID，断线重连后从该ID继续。
+
+    变更通知按键区分：本进程内的写入只唤醒等待该键的订阅者；其他进程的写入由一个共享的监视线程发现：
+    有等待者时每隔 PROGRESS_POLL_INTERVAL 秒查询一次所有被等待键的最新事件ID和版本号，
+    只唤醒标记变化的键的等待者。等待中的订阅者不查询数据库，其他项目的进度写入也不会唤醒它，
+    空闲连接几乎没有开销。
+    """
+
+    def __init__(self, config, db_manager):
+        self.db_manager = db_manager
+        self.ttl = config.PROGRESS_TTL
+        self.poll_interval = config.PROGRESS_POLL_INTERVAL
+        self._changed_lock = threading.Lock()
+        self._channels = {}  # 进度键 -> _Channel（有等待者或最近有等待者的键）
+        self._sequence = 0  # 全局变更序号，任意键变更时加1，作为各键变更序号的来源
+        self._waiters = 0  # 正在等待变更的线程数
+        self._watcher = None
+        self._last_purge = 0
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._events = 0
+        self._purged = 0
+
+    def get(self, key):
+        """获取进度数据，不存在或已过期时返回None"""
+        entry = self.get_entry(key)
+        return entry[1] if entry else None
+
+    def get_entry(self, key):
+        """获取 (版本号, 进度数据)，不存在或已过期时返回None"""
+        row = self.db_manager.get_progress(key)
+        return (row['version'], json.loads(row['data'])) if row else None
+
+    def set(self, key, data, event_type=None):
+        """写入进度数据，返回新版本号（指定 event_type 时同时记录一条进度事件）"""
+        return self.update(key, lambda current: data, event_type)[0]
+
+    def update(self, key, mutate, event_type=None):
+        """读取并修改进度数据（多个线程或进程同时修改时不会丢失更新）
+
+        mutate 接收当前数据（不存在时为None），可以原地修改后返回，返回None表示不修改。
+        指定 event_type 时同时记录一条以新数据为内容的进度事件。
+        返回 (版本号, 新数据)，未修改时返回None。
+        """
+        def apply(raw):
+            data = mutate(json.loads(raw) if raw is not None else None)
+            return json.dumps(data, ensure_ascii=False) if data is not None else None
+
+        row = self.db_manager.update_progress(key, apply, self.ttl, event_type)
+        if row is None:
+            return None
+        self._published(key, event=event_type is not None)
+        return row['version'], json.loads(row['data'])
+
+    def publish_event(self, key, event_type, data):
+        """记录一条进度事件，返回事件ID"""
+        event_id = self.db_manager.add_progress_event(key, event_type, json.dumps(data, ensure_ascii=False))
+        self._published(key, event=True)
+        return event_id
+
+    def events_since(self, key, after_id, limit=100):
+        """获取事件ID大于 after_id 的进度事件，返回 [(事件ID, 事件类型, 数据)]"""
+        return [
+            (row['id'], row['event_type'], json.loads(row['data']))
+            for row in self.db_manager.get_progress_events(key, after_id, limit)
+        ]
+
+    def latest_event_id(self, key):
+        """最新的进度事件ID（没有事件时为0）"""
+        return self.db_manager.get_latest_progress_event_id(key)
+
+    def delete(self, key):
+        """删除进度数据"""
+        self.db_manager.delete_progress(key)
+        self._published(key)
+
+    def _published(self, key, event=False):
+        """本进程写入后唤醒该键的等待者，并定期清理过期记录"""
+        self._notify(key)
+
+        now = time.time()
+        with self._lock:
+            self._writes += 1
+            if event:
+                self._events += 1
+            purge = now - self._last_purge >= PURGE_INTERVAL
+            if purge:
+                self._last_purge = now
+        if purge:
+            try:
+                count = self.db_manager.purge_expired_progress(self.ttl)
+                with self._lock:
+                    self._purged += count
+                if count:
+                    logger.info(f"已清理 {count} 条过期的生成进度")
+            except Exception as e:
+                logger.warning(f"清理过期的生成进度失败: {str(e)}")
+
+    def _notify(self, key):
+        with self._changed_lock:
+            self._sequence += 1
+            channel = self._channels.get(key)
+            if channel is not None:
+                channel.sequence = self._sequence
+                channel.changed.notify_all()
+
+    def change_token(self, key):
+        """键 key 当前的变更序号，配合 wait_for_change 使用（先取序号再读取数据，避免漏掉两者之间的变更）"""
+        with self._changed_lock:
+            channel = self._channels.get(key)
+            return channel.sequence if channel is not None else self._sequence
+
+    def wait_for_change(self, key, token, timeout):
+        """等待键 key 在序号 token 之后的变更，有变更返回True，超时返回False"""
+        with self._changed_lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                # 新建的通知从当前全局序号开始：取序号之后有任何写入时序号已不同，立即返回由调用方重新读取
+                channel = self._channels[key] = _Channel(self._changed_lock, self._sequence)
+            if channel.sequence != token:
+                return True
+            channel.waiters += 1
+            self._waiters += 1
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name='progress-watcher', daemon=True)
+                self._watcher.start()
+            try:
+                return channel.changed.wait_for(lambda: channel.sequence != token, timeout)
+            finally:
+                channel.waiters -= 1
+                self._waiters -= 1
+                if not channel.waiters:
+                    channel.idle_since = time.time()
+
+    def _watch(self):
+        """监视其他进程写入的进度（没有等待者时退出，有新的等待者时重新启动）
+
+        只查询有等待者的键；某个键第一次被查询时没有可比较的标记，唤醒一次它的等待者重新读取，
+        以免漏掉等待者读取数据之后、第一次查询之前其他进程的写入。
+        """
+        while True:
+            with self._changed_lock:
+                if not self._waiters:
+                    self._watcher = None
+                    return
+                now = time.time()
+                for key, channel in list(self._channels.items()):
+                    if not channel.waiters and now - channel.idle_since > CHANNEL_IDLE_SECONDS:
+                        del self._channels[key]
+                keys = [key for key, channel in self._channels.items() if channel.waiters]
+            try:
+                markers = self.db_manager.get_progress_markers(keys)
+            except Exception as e:
+                logger.warning(f"查询进度变更失败: {str(e)}")
+                markers = {}
+            for key, marker in markers.items():
+                with self._changed_lock:
+                    channel = self._channels.get(key)
+                    if channel is None or channel.marker == marker:
+                        continue
+                    channel.marker = marker
+                self._notify(key)
+            time.sleep(self.poll_interval)
+
+    def wait(self, key, version=0, timeout=None):
+        """等待进度版本号不同于 version（version=0 时等待进度出现），返回 (版本号, 进度数据)，超时返回None"""
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            token = self.change_token(key)
+            entry = self.get_entry(key)
+            if entry and entry[0] != version:
+                return entry
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+            self.wait_for_change(key, token, remaining)
+
+    def subscribe(self, key, version=0, timeout=None):
+        """订阅进度变化（生成器），每次变化产出 (版本号, 进度数据)，timeout 秒内没有变化时结束"""
+        while True:
+            entry = self.wait(key, version, timeout)
+            if entry is None:
+                return
+            version = entry[0]
+            yield entry
+
+    def get_stats(self):
+        """获取进度存储统计"""
+        with self._lock:
+            stats = {
+                'ttl': self.ttl,
+                'writes': self._writes,
+                'events': self._events,
+                'purged': self._purged
+            }
+        with self._changed_lock:
+            stats['waiters'] = self._waiters
+            stats['watched_keys'] = len(self._channels)
+        stats['entries'] = self.db_manager.count_progress()
+        return stats
@@ -0,0 +1,176 @@
+"""自适应限流器（令牌桶 + AIMD并发控制）"""
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from services.cancellation import OperationCancelled
+
+logger = logging.getLogger(__name__)
+
+# 表示上游限流/过载的状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或HTTP日期），无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitTimeout(Exception):
+    """等待限流许可超时"""
+
+
+class AdaptiveRateLimiter:
+    """单个模型端点的限流器
+
+    - 令牌桶控制请求速率，允许短时突发
+    - AIMD 调整并发上限和速率：成功时线性增加，遇到 429/503 时减半
+    - 上游返回 Retry-After 时，在该时间之前暂停发放许可
+    """
+
+    def __init__(self, name, requests_per_minute, burst, max_concurrency, min_concurrency=1):
+        self.name = name
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate / 10
+        self.rate = self.max_rate
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency_limit = float(self.max_concurrency)
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._throttle_count = 0
+        self._request_count = 0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def acquire(self, timeout=None, cancel_token=None):
+        """获取一个请求许可（阻塞直到有可用令牌和并发名额）
+
+        timeout 秒内未获得许可时抛出 RateLimitTimeout；等待期间 cancel_token 被取消时立即抛出 OperationCancelled。
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        wake = None
+        if cancel_token is not None:
+            def wake():
+                with self._cond:
+                    self._cond.notify_all()
+            cancel_token.register(wake)
+        try:
+            self._acquire(deadline, cancel_token)
+        finally:
+            if wake is not None:
+                cancel_token.unregister(wake)
+
+    def _acquire(self, deadline, cancel_token):
+        with self._cond:
+            while True:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise OperationCancelled(cancel_token.reason or '请求已取消')
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._in_flight >= int(self.concurrency_limit):
+                    wait = 1.0  # 等待其他请求释放名额
+                elif self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    self._request_count += 1
+                    return
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise RateLimitTimeout(f'等待限流许可超时: {self.name}')
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+
+    def release(self):
+        """释放请求许可"""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    def on_success(self):
+        """请求成功：线性增加并发上限和速率"""
+        with self._cond:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        """遇到限流：并发上限和速率减半，并遵守 Retry-After"""
+        with self._cond:
+            self._throttle_count += 1
+            self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"端点 {self.name} 被限流，并发上限降为 {int(self.concurrency_limit)}，"
+                       f"速率降为 {self.rate * 60:.1f} 次/分钟"
+                       + (f"，{retry_after:.1f} 秒后恢复" if retry_after else ''))
+
+    def snapshot(self):
+        """获取当前限流状态"""
+        with self._cond:
+            now = time.monotonic()
+            return {
+                'requests_per_minute': round(self.rate * 60, 2),
+                'max_requests_per_minute': round(self.max_rate * 60, 2),
+                'concurrency_limit': int(self.concurrency_limit),
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'blocked_seconds': round(max(0.0, self._blocked_until - now), 2),
+                'requests': self._request_count,
+                'throttled': self._throttle_count
+            }
+
+
+class RateLimiterRegistry:
+    """进程内共享的限流器注册表（每个模型端点一个限流器）"""
+
+    def __init__(self, config):
+        self.config = config
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        """获取（或创建）端点对应的限流器"""
+        with self._lock:
+            limiter = self._limiters.get(endpoint)
+            if limiter is None:
+                limiter = AdaptiveRateLimiter(
+                    endpoint,
+                    requests_per_minute=self.config.RATE_LIMIT_REQUESTS_PER_MINUTE,
+                    burst=self.config.RATE_LIMIT_BURST,
+                    max_concurrency=self.config.RATE_LIMIT_MAX_CONCURRENCY
+                )
+                self._limiters[endpoint] = limiter
+            return limiter
+
+    def snapshot(self):
+        """获取所有端点的限流状态"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {endpoint: limiter.snapshot() for endpoint, limiter in limiters.items()}
@@ -0,0 +1,108 @@
+"""参考图片编码缓存"""
+import os
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 目标编码格式对应的MIME类型
+FORMAT_MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+}
+
+
+class ReferenceImageCache:
+    """参考图片base64编码结果的LRU缓存
+
+    以 路径 + 修改时间 + 文件大小 + 目标编码 作为键，同一个样式模板在整个PPT
+    的所有页面和所有重试中只需编码一次。缓存总大小受 max_bytes 限制。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (mime_type, base64字符串)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}  # 同一个键只允许一个线程编码
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_encoded(self, image_path, target_format='PNG'):
+        """获取图片的 (mime_type, base64字符串)，未命中时编码并缓存"""
+        target_format = target_format.upper()
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, target_format)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry
+                self._misses += 1
+
+            entry = self._encode(image_path, target_format)
+            self._store(key, entry)
+
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return entry
+
+    def _encode(self, image_path, target_format):
+        """编码图片：源文件已是目标格式时直接读取原始字节，否则转换格式"""
+        with Image.open(image_path) as image:
+            logger.info(f"编码参考图片: {image_path}, 尺寸: {image.size}, 格式: {image.format}")
+            if image.format == target_format:
+                with open(image_path, 'rb') as f:
+                    raw_bytes = f.read()
+            else:
+                buffered = BytesIO()
+                if target_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.save(buffered, format=target_format)
+                raw_bytes = buffered.getvalue()
+
+        mime_type = FORMAT_MIME_TYPES.get(target_format, f'image/{target_format.lower()}')
+        return mime_type, base64.b64encode(raw_bytes).decode('ascii')
+
+    def _store(self, key, entry):
+        """写入缓存并按LRU淘汰超出内存上限的条目"""
+        size = len(entry[1])
+        if size > self.max_bytes:
+            logger.warning(f"参考图片编码结果过大（{size} 字节），不写入缓存")
+            return
+
+        with self._lock:
+            # 同一文件的旧版本（修改时间不同）不会再被使用，直接移除
+            for stale_key in [k for k in self._entries if k[0] == key[0] and k[3] == key[3]]:
+                self._total_bytes -= len(self._entries.pop(stale_key)[1])
+
+            self._entries[key] = entry
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted[1])
+                self._evictions += 1
+
+    def get_stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions
+            }
@@ -0,0 +1,169 @@
+"""图片生成结果缓存（内容寻址的磁盘缓存）"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(file_path):
+    """计算文件内容的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImageResultCache:
+    """以生成参数哈希为键的图片结果缓存
+
+    键由 模型、提示词、参考图片内容、宽高比、分辨率 共同决定，相同请求直接从磁盘
+    返回上次的结果。缓存总大小超过 max_bytes 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._reference_digests = {}  # (路径, 修改时间, 大小) -> 内容摘要
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+        logger.info(f"图片结果缓存初始化完成: {self.cache_dir}, 已用 {self._total_bytes} 字节")
+
+    def make_key(self, model, prompt, aspect_ratio, image_size, reference_path=None):
+        """根据生成参数计算缓存键"""
+        payload = {
+            'model': model,
+            'prompt': prompt,
+            'aspect_ratio': aspect_ratio,
+            'image_size': image_size,
+            'reference': self._reference_digest(reference_path) if reference_path else None
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _reference_digest(self, reference_path):
+        """参考图片内容摘要（按修改时间缓存，避免重复读取文件）"""
+        stat = os.stat(reference_path)
+        memo_key = (os.path.abspath(reference_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._reference_digests.get(memo_key)
+        if digest is None:
+            digest = file_digest(reference_path)
+            with self._lock:
+                self._reference_digests[memo_key] = digest
+        return digest
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, output_path):
+        """命中时将缓存结果复制到输出路径并返回True"""
+        entry_path = self._entry_path(key)
+        if not os.path.exists(entry_path):
+            with self._lock:
+                self._misses += 1
+            return False
+
+        try:
+            self._materialize(entry_path, output_path)
+            os.utime(entry_path)  # 更新最近使用时间
+        except OSError as e:
+            logger.warning(f"读取图片缓存失败: {entry_path}, {str(e)}")
+            with self._lock:
+                self._misses += 1
+            return False
+
+        with self._lock:
+            self._hits += 1
+        logger.info(f"命中图片缓存: {key[:12]} -> {output_path}")
+        return True
+
+    def store(self, key, source_path):
+        """将生成结果写入缓存"""
+        entry_path = self._entry_path(key)
+        if os.path.exists(entry_path):
+            return
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            self._materialize(source_path, entry_path)
+            size = os.path.getsize(entry_path)
+        except OSError as e:
+            logger.warning(f"写入图片缓存失败: {entry_path}, {str(e)}")
+            return
+
+        with self._lock:
+            self._stores += 1
+            self._total_bytes += size
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _materialize(self, source_path, target_path):
+        """原子地将文件放到目标位置（优先硬链接，失败时复制）"""
+        temp_path = f"{target_path}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                os.link(source_path, temp_path)
+            except OSError:
+                shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _scan(self):
+        """列出所有缓存文件 (路径, 大小, 修改时间)"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """按最近使用时间淘汰缓存，直到总大小低于上限"""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._total_bytes = total
+            self._evictions += evicted
+        if evicted:
+            logger.info(f"图片缓存淘汰 {evicted} 个文件，当前占用 {total} 字节")
+
+    def get_stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
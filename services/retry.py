@@ -0,0 +1,190 @@
+"""API调用重试引擎（错误分类 + 抖动退避 + 总时限）"""
+import json
+import time
+import random
+import logging
+import threading
+from collections import defaultdict
+import requests
+from services.rate_limiter import RateLimitTimeout
+from services.circuit_breaker import CircuitOpenError
+from services.cancellation import CancelToken, OperationCancelled
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+# 可重试的HTTP状态码（超时、限流、服务端临时错误）
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class APIError(Exception):
+    """上游API调用错误（status_code 为空表示超时等未拿到响应的情况）"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RetryError(Exception):
+    """重试结束仍失败（last_error 为最后一次的异常）"""
+
+    def __init__(self, message, last_error, attempts, category):
+        super().__init__(message)
+        self.last_error = last_error
+        self.attempts = attempts
+        self.category = category
+
+
+class RetryPolicy:
+    """单个调用点的重试策略"""
+
+    def __init__(self, name, max_attempts, base_delay, max_delay, deadline, max_parse_retries=0):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline  # 单次操作（含所有重试和等待）的总时限（秒）
+        self.max_parse_retries = max_parse_retries  # 响应解析失败时最多重试次数
+
+
+def classify_error(error):
+    """将异常分为可重试和不可重试两类"""
+    if isinstance(error, APIError):
+        if error.status_code is None:
+            return RETRYABLE
+        if error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500:
+            return RETRYABLE
+        return FATAL
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, RateLimitTimeout)):
+        return RETRYABLE
+    if isinstance(error, requests.exceptions.RequestException):
+        return FATAL
+    if isinstance(error, (json.JSONDecodeError, ValueError)):
+        return 'parse'
+    if isinstance(error, (OSError, KeyError, IndexError, TypeError)):
+        # 本地文件错误或响应结构与预期不符，重试也无法恢复
+        return FATAL
+    return RETRYABLE
+
+
+class RetryEngine:
+    """GeminiService 和 BananaService 共用的重试引擎"""
+
+    def __init__(self, config):
+        self.config = config
+        self.policies = {
+            'image': RetryPolicy(
+                'image',
+                max_attempts=config.MAX_API_RETRIES,
+                base_delay=config.RETRY_DELAY_BASE,
+                max_delay=config.RETRY_MAX_DELAY,
+                deadline=config.IMAGE_RETRY_DEADLINE
+            ),
+            'outline': RetryPolicy(
+                'outline',
+                max_attempts=config.OUTLINE_MAX_RETRIES,
+                base_delay=config.RETRY_DELAY_BASE,
+                max_delay=config.RETRY_MAX_DELAY,
+                deadline=config.OUTLINE_RETRY_DEADLINE,
+                max_parse_retries=1
+            ),
+        }
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(float))
+
+    def get_policy(self, name):
+        """获取调用点的重试策略"""
+        return self.policies[name]
+
+    def _record(self, policy_name, **increments):
+        with self._lock:
+            stats = self._stats[policy_name]
+            for key, value in increments.items():
+                stats[key] += value
+
+    def _backoff(self, policy, attempt, error):
+        """计算带抖动的退避时间，并遵守上游返回的 Retry-After"""
+        ceiling = min(policy.max_delay, policy.base_delay * (2 ** attempt))
+        delay = random.uniform(ceiling / 2, ceiling)
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after:
+            delay = max(delay, min(retry_after, policy.max_delay))
+        return delay
+
+    def run(self, func, policy_name='image', cancel_token=None):
+        """按策略执行 func(token)，失败时根据错误类型决定是否重试（cancel_token 取消后不再重试，退避等待立即结束）
+
+        func 收到的令牌是 cancel_token 的子令牌，截止时间为策略总时限，调用方用它限制等待限流许可等阻塞操作。
+        """
+        policy = self.get_policy(policy_name)
+        started = time.monotonic()
+        call_token = CancelToken(parent=cancel_token, deadline=started + policy.deadline)
+        parse_failures = 0
+        self._record(policy.name, calls=1)
+
+        for attempt in range(policy.max_attempts):
+            if cancel_token is not None and cancel_token.cancelled:
+                self._record(policy.name, cancelled=1)
+                cancel_token.raise_if_cancelled()
+            attempt_started = time.monotonic()
+            self._record(policy.name, attempts=1)
+            try:
+                logger.debug(f"[{policy.name}] API调用尝试 {attempt + 1}/{policy.max_attempts}")
+                result = func(call_token)
+                self._record(policy.name, successes=1)
+                return result
+            except OperationCancelled:
+                self._record(policy.name, cancelled=1)
+                raise
+            except CircuitOpenError as e:
+                # 端点熔断中：不再等待重试，原样抛出让调用方标记为稍后重试
+                self._record(policy.name, circuit_open=1)
+                logger.warning(f"[{policy.name}] {str(e)}，放弃重试")
+                raise
+            except Exception as e:
+                now = time.monotonic()
+                self._record(policy.name, wasted_seconds=now - attempt_started)
+                category = classify_error(e)
+                if category == 'parse':
+                    parse_failures += 1
+                    category = RETRYABLE if parse_failures <= policy.max_parse_retries else FATAL
+                self._record(policy.name, **{f'{category}_errors': 1})
+                logger.warning(f"[{policy.name}] API调用失败 (尝试 {attempt + 1}/{policy.max_attempts}, {category}): {str(e)}")
+
+                if category == FATAL:
+                    self._record(policy.name, fatal_failures=1)
+                    raise RetryError(f'API调用失败（不可重试）: {str(e)}', e, attempt + 1, category) from e
+
+                if attempt == policy.max_attempts - 1:
+                    self._record(policy.name, exhausted=1)
+                    logger.error(f'[{policy.name}] API调用失败，已重试{policy.max_attempts}次: {str(e)}')
+                    raise RetryError(f'API调用失败，已重试{policy.max_attempts}次: {str(e)}', e, attempt + 1, category) from e
+
+                delay = self._backoff(policy, attempt, e)
+                elapsed = now - started
+                if elapsed + delay > policy.deadline:
+                    self._record(policy.name, deadline_exceeded=1)
+                    logger.error(f'[{policy.name}] API调用失败，超过总时限{policy.deadline}秒: {str(e)}')
+                    raise RetryError(
+                        f'API调用失败，超过总时限{policy.deadline}秒（已尝试{attempt + 1}次）: {str(e)}',
+                        e, attempt + 1, category
+                    ) from e
+
+                logger.info(f"[{policy.name}] 等待 {delay:.1f} 秒后重试...")
+                self._record(policy.name, retries=1, wasted_seconds=delay)
+                if cancel_token is not None:
+                    cancel_token.wait(delay)
+                else:
+                    time.sleep(delay)
+
+    def get_stats(self):
+        """获取各调用点的重试统计"""
+        with self._lock:
+            return {
+                name: {key: round(value, 2) if key == 'wasted_seconds' else int(value)
+                       for key, value in stats.items()}
+                for name, stats in self._stats.items()
+            }
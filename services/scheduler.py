@@ -0,0 +1,153 @@
+"""按优先级和公平份额分配图片生成名额"""
+import time
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from services.cancellation import OperationCancelled
+
+logger = logging.getLogger(__name__)
+
+# 优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0  # 用户等待结果的操作（重新生成单页、大纲生成）
+PRIORITY_STYLES = 1  # 样式模板生成
+PRIORITY_BATCH = 2  # 批量页面生成
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_STYLES: 'styles',
+    PRIORITY_BATCH: 'batch',
+}
+
+
+class _Ticket:
+    """一个等待中的名额请求"""
+
+    def __init__(self, priority, workspace_id, project_id, sequence):
+        self.priority = priority
+        self.workspace = workspace_id
+        self.project = (workspace_id, project_id)
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+
+
+class FairShareScheduler:
+    """图片生成名额调度器（替代固定的全局信号量）
+
+    同时进行的图片生成数不超过 capacity。有空闲名额时按以下顺序选择等待者：
+    1. 优先级：重新生成单页 > 样式生成 > 批量页面生成
+    2. 同一优先级内，正在占用名额最少的工作区优先，相同时最久未获得名额的工作区优先（轮转）
+    3. 同一工作区内按同样的规则在项目之间轮转，同一项目内先到先得
+
+    因此一个60页的大项目不会挡住其他项目和工作区，用户重新生成单页时也不必排在批量生成后面。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._in_use = 0
+        self._sequence = 0
+        self._grants = 0  # 已分配的名额数，记录各工作区和项目最近一次获得名额的先后
+        self._workspace_active = defaultdict(int)
+        self._project_active = defaultdict(int)
+        self._workspace_served = {}  # 工作区 -> 最近一次获得名额时的分配序号
+        self._project_served = {}
+        self._granted = defaultdict(int)
+        self._wait_seconds = defaultdict(float)
+        self._cancelled = 0
+
+    def _rank(self, ticket):
+        return (
+            ticket.priority,
+            self._workspace_active.get(ticket.workspace, 0),
+            self._workspace_served.get(ticket.workspace, 0),
+            self._project_active.get(ticket.project, 0),
+            self._project_served.get(ticket.project, 0),
+            ticket.sequence,
+        )
+
+    def _next(self):
+        return min(self._waiting, key=self._rank) if self._waiting else None
+
+    def acquire(self, priority=PRIORITY_BATCH, workspace_id=None, project_id=None, cancel_token=None):
+        """等待并占用一个名额，返回名额凭证（交给 release 释放）；cancel_token 取消时抛出 OperationCancelled"""
+        with self._cond:
+            self._sequence += 1
+            ticket = _Ticket(priority, workspace_id, project_id, self._sequence)
+            self._waiting.append(ticket)
+
+        wake = None
+        if cancel_token is not None:
+            def wake():
+                with self._cond:
+                    self._cond.notify_all()
+            cancel_token.register(wake)
+        try:
+            with self._cond:
+                while True:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        self._waiting.remove(ticket)
+                        self._cancelled += 1
+                        self._cond.notify_all()
+                        raise OperationCancelled(cancel_token.reason or '操作已取消')
+                    if self._in_use < self.capacity and self._next() is ticket:
+                        break
+                    self._cond.wait()
+
+                self._waiting.remove(ticket)
+                self._in_use += 1
+                self._workspace_active[ticket.workspace] += 1
+                self._project_active[ticket.project] += 1
+                self._grants += 1
+                self._workspace_served[ticket.workspace] = self._grants
+                self._project_served[ticket.project] = self._grants
+                self._granted[priority] += 1
+                self._wait_seconds[priority] += time.monotonic() - ticket.enqueued_at
+                # 还有空闲名额时让下一个等待者检查自己是否可以获得名额
+                self._cond.notify_all()
+                return ticket
+        finally:
+            if wake is not None:
+                cancel_token.unregister(wake)
+
+    def release(self, ticket):
+        """释放名额"""
+        with self._cond:
+            self._in_use -= 1
+            for counts, key in ((self._workspace_active, ticket.workspace), (self._project_active, ticket.project)):
+                counts[key] -= 1
+                if not counts[key]:
+                    del counts[key]
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_BATCH, workspace_id=None, project_id=None, cancel_token=None):
+        """占用一个名额执行 with 块"""
+        ticket = self.acquire(priority, workspace_id, project_id, cancel_token)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def get_stats(self):
+        """获取调度统计（各优先级已分配的名额数和平均等待时间）"""
+        with self._cond:
+            waiting = defaultdict(int)
+            for ticket in self._waiting:
+                waiting[PRIORITY_NAMES.get(ticket.priority, ticket.priority)] += 1
+            return {
+                'capacity': self.capacity,
+                'in_use': self._in_use,
+                'waiting': dict(waiting),
+                'active_workspaces': len(self._workspace_active),
+                'active_projects': len(self._project_active),
+                'cancelled': self._cancelled,
+                'priorities': {
+                    PRIORITY_NAMES.get(priority, priority): {
+                        'granted': count,
+                        'avg_wait_seconds': round(self._wait_seconds[priority] / count, 3)
+                    }
+                    for priority, count in self._granted.items()
+                }
+            }
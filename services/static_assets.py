@@ -0,0 +1,96 @@
+"""生成图片和上传文件的HTTP缓存（内容哈希版本化URL、ETag、长期缓存）"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+from flask import request, send_file
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # 版本化URL的缓存时间（1年）
+
+
+class StaticAssetService:
+    """为 /generated 和 /uploads 下的文件生成带内容哈希的URL并返回可缓存的响应
+
+    API返回的图片URL带 ?v=<内容哈希>，页面被重新生成后哈希改变、URL随之改变，
+    因此带当前哈希的请求可以标记为 immutable 长期缓存；不带版本或版本已过期的请求
+    返回 no-cache，浏览器每次用 If-None-Match 重新验证。ETag 使用内容哈希，
+    条件请求（304）和 Range 请求（206）由 send_file 处理。
+    """
+
+    def __init__(self, config, max_entries=4096):
+        self.roots = {
+            'generated': os.path.abspath(config.GENERATED_FOLDER),
+            'uploads': os.path.abspath(config.UPLOAD_FOLDER),
+        }
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hashes = OrderedDict()  # (路径, 修改时间, 大小) -> 内容哈希，按最近使用排序
+
+    def content_hash(self, path):
+        """计算文件内容哈希（按修改时间和大小缓存，文件不变时不重复读取）"""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+                return digest
+
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()[:16]
+
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def url_for(self, path):
+        """将文件系统路径转换为带内容哈希的访问URL，文件不存在或不在可访问目录下时返回None"""
+        if not path:
+            return None
+        abs_path = os.path.abspath(path)
+        for prefix, root in self.roots.items():
+            if abs_path.startswith(root + os.sep):
+                try:
+                    digest = self.content_hash(abs_path)
+                except OSError:
+                    return None
+                relative = os.path.relpath(abs_path, root).replace(os.sep, '/')
+                return f'/{prefix}/{quote(relative)}?v={digest}'
+        return None
+
+    def add_urls(self, items, key='image_path'):
+        """为查询结果中的每条记录添加 image_url 字段"""
+        for item in items:
+            item['image_url'] = self.url_for(item.get(key))
+        return items
+
+    def send(self, path, served_path=None, mimetype=None, etag_suffix=''):
+        """返回带ETag和缓存头的文件响应
+
+        path 为原文件（用于计算版本），served_path 为实际返回的文件（如衍生图），默认为原文件。
+        """
+        digest = self.content_hash(path)
+        response = send_file(
+            served_path or path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=f'{digest}{etag_suffix}',
+            max_age=None
+        )
+        if request.args.get('v') == digest:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
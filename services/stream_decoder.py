@@ -0,0 +1,123 @@
+"""streamGenerateContent 图片响应的流式解码"""
+import re
+import base64
+
+INLINE_DATA_MARKER = b'"inlineData"'
+DATA_FIELD_PATTERN = re.compile(rb'"data"\s*:\s*"')
+MIME_FIELD_PATTERN = re.compile(rb'"mimeType"\s*:\s*"([^"]*)"')
+
+
+class InlineImageStreamDecoder:
+    """从响应字节流中增量提取第一个 inlineData 图片并直接解码写入文件
+
+    不缓冲整个响应体：只保留跨分块边界所需的少量字节，base64 数据按 4 字节
+    对齐分段解码后立即写入输出文件，因此内存占用与图片大小无关。
+    """
+
+    MAX_HEADER_BYTES = 4096  # inlineData 与 data 字段之间允许的最大字节数
+    SNIPPET_BYTES = 2000  # 保留的响应开头字节数（用于错误日志）
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.mime_type = None
+        self.bytes_written = 0
+        self.found = False  # 是否已找到图片数据
+        self.done = False  # 图片数据是否已完整写入
+        self._state = 'search'
+        self._pending = b''
+        self._base64_remainder = b''
+        self._snippet = bytearray()
+
+    @property
+    def snippet(self):
+        """响应开头的内容（用于定位未返回图片时的问题）"""
+        return self._snippet.decode('utf-8', errors='replace')
+
+    def feed(self, chunk):
+        """处理一个响应分块"""
+        if len(self._snippet) < self.SNIPPET_BYTES:
+            self._snippet += chunk[:self.SNIPPET_BYTES - len(self._snippet)]
+
+        data = self._pending + chunk
+        self._pending = b''
+
+        while data and not self.done:
+            if self._state == 'search':
+                index = data.find(INLINE_DATA_MARKER)
+                if index < 0:
+                    # 保留可能被分块截断的标记前缀
+                    self._pending = data[-(len(INLINE_DATA_MARKER) - 1):]
+                    return
+                data = data[index + len(INLINE_DATA_MARKER):]
+                self._state = 'header'
+
+            elif self._state == 'header':
+                match = DATA_FIELD_PATTERN.search(data)
+                if not match:
+                    if len(data) > self.MAX_HEADER_BYTES:
+                        raise ValueError('响应格式错误：inlineData 中没有 data 字段')
+                    self._pending = data
+                    return
+                mime_match = MIME_FIELD_PATTERN.search(data, 0, match.start())
+                if mime_match:
+                    self._set_mime_type(mime_match)
+                data = data[match.end():]
+                self.found = True
+                self._state = 'data'
+
+            elif self._state == 'data':
+                end = data.find(b'"')
+                payload = data if end < 0 else data[:end]
+                if end < 0 and payload.endswith(b'\\'):
+                    # 转义符被分块截断，留到下一块处理
+                    self._pending = payload[-1:]
+                    payload = payload[:-1]
+                self._write_base64(payload)
+                if end < 0:
+                    return
+                self._flush_base64()
+                data = data[end + 1:]
+                self._state = 'trailer'
+
+            elif self._state == 'trailer':
+                # mimeType 也可能出现在 data 字段之后
+                if self.mime_type is None:
+                    buffered = data[:self.MAX_HEADER_BYTES]
+                    mime_match = MIME_FIELD_PATTERN.search(buffered)
+                    if mime_match:
+                        self._set_mime_type(mime_match)
+                    elif b'}' not in buffered and len(buffered) < self.MAX_HEADER_BYTES:
+                        self._pending = buffered
+                        return
+                self.done = True
+
+    def finish(self):
+        """响应读取结束后调用，返回是否成功提取到完整图片"""
+        if self._state == 'trailer':
+            self.done = True
+        return self.done
+
+    def _set_mime_type(self, match):
+        """记录图片MIME类型（处理JSON转义的斜杠）"""
+        self.mime_type = match.group(1).decode('ascii', errors='replace').replace('\\/', '/')
+
+    def _write_base64(self, payload):
+        """按4字节对齐解码base64并写入文件"""
+        if b'\\' in payload:
+            payload = payload.replace(b'\\/', b'/')
+        buffered = self._base64_remainder + payload
+        aligned = len(buffered) - len(buffered) % 4
+        if aligned:
+            decoded = base64.b64decode(buffered[:aligned])
+            self.output_file.write(decoded)
+            self.bytes_written += len(decoded)
+        self._base64_remainder = buffered[aligned:]
+
+    def _flush_base64(self):
+        """写入剩余的base64数据"""
+        if self._base64_remainder:
+            padded = self._base64_remainder + b'=' * (-len(self._base64_remainder) % 4)
+            decoded = base64.b64decode(padded)
+            self.output_file.write(decoded)
+            self.bytes_written += len(decoded)
+            self._base64_remainder = b''
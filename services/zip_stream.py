@@ -0,0 +1,212 @@
+"""流式ZIP打包（不压缩，边读边发送）"""
+import os
+import time
+import struct
+import zlib
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+CHUNK_SIZE = 1024 * 1024  # 每次读取和发送的字节数
+ZIP32_LIMIT = 0xFFFFFFFF  # 不使用ZIP64时单个文件和整个归档的大小上限
+
+FLAG_UTF8 = 0x800  # 文件名使用UTF-8编码
+VERSION = 20  # 2.0
+CRC_CACHE_ENTRIES = 4096  # 缓存CRC的文件数
+
+
+class _CRCCache:
+    """文件CRC的LRU缓存（键为 路径 + 修改时间 + 大小），同一页面图片在多次导出中只计算一次CRC"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            crc = self._entries.get(key)
+            if crc is not None:
+                self._entries.move_to_end(key)
+            return crc
+
+    def store(self, key, crc):
+        with self._lock:
+            self._entries[key] = crc
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_crc_cache = _CRCCache(CRC_CACHE_ENTRIES)
+
+
+def attachment_headers(filename):
+    """下载文件的 Content-Disposition（非ASCII文件名按 RFC 5987 编码）"""
+    filename = ''.join(ch for ch in filename if ch.isprintable())
+    fallback = filename.encode('ascii', 'ignore').decode('ascii').replace('"', '').replace('\\', '').strip()
+    if fallback == filename:
+        return {'Content-Disposition': f'attachment; filename="{filename}"'}
+    return {
+        'Content-Disposition': f'attachment; filename="{fallback or "download"}"; '
+                               f"filename*=UTF-8''{quote(filename, safe='')}"
+    }
+
+
+def _dos_datetime(timestamp):
+    """转换为ZIP使用的DOS日期和时间"""
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return dos_date, dos_time
+
+
+class ZipStream:
+    """以存储方式（不压缩）流式生成ZIP归档
+
+    添加磁盘文件时只记录大小和修改时间，归档总大小可以在发送前算出（Content-Length）；
+    文件在发送到该条目时才打开，同时打开的文件最多一个，不会在第一个字节发出前读取所有文件。
+    每个文件的CRC和大小在发送本地文件头之前确定并直接写在文件头中，不使用数据描述符
+    （PowerPoint拒绝打开带数据描述符的存储方式条目）：磁盘文件的CRC按 路径 + 修改时间 + 大小 缓存
+    （同一进程中预先组装导出文件时已计算），未命中时在发送该条目前读一遍计算，紧接着的发送读取命中系统页缓存。
+    页面在添加后被重新生成（原子替换）时，大小不变则发送新内容，大小改变则无法满足已发送的总大小，发送失败。
+    PNG/JPEG本身已压缩，不再压缩可以节省CPU且几乎不增加体积。
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        # (数据来源, 归档内文件名, 大小, CRC, DOS日期, DOS时间)
+        # 数据来源为磁盘文件路径、bytes 或返回 bytes 的函数（发送到该文件时才调用，大小和CRC未知为None）
+        self._entries = []
+        self._file = None  # 正在发送的磁盘文件
+
+    def add_file(self, path, arcname):
+        """添加磁盘文件（发送到该文件时才打开）"""
+        stat = os.stat(path)
+        if stat.st_size > ZIP32_LIMIT:
+            raise ValueError(f'文件过大，无法打包: {arcname}')
+        dos_date, dos_time = _dos_datetime(stat.st_mtime)
+        self._entries.append((_DiskFile(path), arcname.encode('utf-8'), stat.st_size, None, dos_date, dos_time))
+
+    def add_bytes(self, data, arcname):
+        """添加内存中的数据"""
+        dos_date, dos_time = _dos_datetime(time.time())
+        self._entries.append((data, arcname.encode('utf-8'), len(data), zlib.crc32(data), dos_date, dos_time))
+
+    def add_lazy(self, producer, arcname):
+        """添加发送时才生成的数据（如需要转换格式的图片），此时归档总大小无法预先算出"""
+        dos_date, dos_time = _dos_datetime(time.time())
+        self._entries.append((producer, arcname.encode('utf-8'), None, None, dos_date, dos_time))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def content_length(self):
+        """归档总字节数（包含发送时才生成的数据时返回None）"""
+        total = 22  # 中央目录结束记录
+        for _, name, size, *_ in self._entries:
+            if size is None:
+                return None
+            total += 30 + len(name) + size  # 本地文件头 + 数据
+            total += 46 + len(name)  # 中央目录记录
+        if total > ZIP32_LIMIT:
+            raise ValueError('归档过大，无法打包')
+        return total
+
+    def close(self):
+        """关闭正在发送的文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_file(self, f, size, arcname):
+        """按块读取文件的 size 字节"""
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(self.chunk_size, remaining))
+            if not chunk:
+                raise IOError(f'文件在打包过程中被截断: {arcname}')
+            remaining -= len(chunk)
+            yield chunk
+
+    def _open_file(self, source, size, name):
+        """打开磁盘文件并确定CRC，返回 (文件对象, CRC, 修改时间)"""
+        arcname = name.decode('utf-8')
+        f = open(source.path, 'rb')
+        try:
+            stat = os.fstat(f.fileno())
+            if stat.st_size != size:
+                raise IOError(f'文件在打包过程中被替换: {arcname}')
+            key = (os.path.abspath(source.path), stat.st_mtime_ns, stat.st_size)
+            crc = _crc_cache.get(key)
+            if crc is None:
+                crc = 0
+                for chunk in self._read_file(f, size, arcname):
+                    crc = zlib.crc32(chunk, crc)
+                f.seek(0)
+                _crc_cache.store(key, crc)
+        except Exception:
+            f.close()
+            raise
+        return f, crc, stat.st_mtime
+
+    def _read_chunks(self, source, size, crc, name):
+        """按块读取一个文件的数据（与文件头中的CRC不一致说明文件被原地修改）"""
+        if isinstance(source, bytes):
+            for start in range(0, len(source), self.chunk_size):
+                yield source[start:start + self.chunk_size]
+            return
+
+        actual = 0
+        for chunk in self._read_file(source, size, name.decode('utf-8')):
+            actual = zlib.crc32(chunk, actual)
+            yield chunk
+        if actual != crc:
+            raise IOError(f'文件在打包过程中被修改: {name.decode("utf-8")}')
+
+    def generate(self):
+        """逐块生成归档内容（生成器结束或被关闭时关闭正在发送的文件）"""
+        flags = FLAG_UTF8
+        central_directory = []
+        offset = 0
+        try:
+            for source, name, size, crc, dos_date, dos_time in self._entries:
+                if isinstance(source, _DiskFile):
+                    source, crc, mtime = self._open_file(source, size, name)
+                    self._file = source
+                    dos_date, dos_time = _dos_datetime(mtime)
+                elif callable(source):
+                    # 发送到该文件时才生成数据，数据完整在内存中，写文件头前算出大小和CRC
+                    source = source()
+                    if len(source) > ZIP32_LIMIT:
+                        raise ValueError(f'文件过大，无法打包: {name.decode("utf-8")}')
+                    size, crc = len(source), zlib.crc32(source)
+
+                header = struct.pack('<4s5H3L2H', b'PK\x03\x04', VERSION, flags, 0, dos_time, dos_date,
+                                     crc, size, size, len(name), 0)
+                yield header + name
+                yield from self._read_chunks(source, size, crc, name)
+                self.close()
+
+                central_directory.append(
+                    struct.pack('<4s6H3L5H2L', b'PK\x01\x02', VERSION, VERSION, flags, 0, dos_time, dos_date,
+                                crc, size, size, len(name), 0, 0, 0, 0, 0, offset) + name
+                )
+                offset += len(header) + len(name) + size
+                if offset > ZIP32_LIMIT:
+                    raise ValueError('归档过大，无法打包')
+
+            directory = b''.join(central_directory)
+            yield directory
+            yield struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(central_directory), len(central_directory),
+                              len(directory), offset, 0)
+        finally:
+            self.close()
+
+
+class _DiskFile:
+    """ZIP条目的磁盘文件来源（发送时才打开）"""
+
+    def __init__(self, path):
+        self.path = path
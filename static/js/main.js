@@ -52,6 +52,20 @@ async function apiRequestSilent(url, options = {}) {
     return data.data;
 }
 
+// 等待后台任务结束（轮询任务状态），成功时返回任务结果，失败时抛出错误
+async function waitForJob(jobId, interval = 1500) {
+    while (true) {
+        const job = await apiRequestSilent(`/api/jobs/${jobId}`);
+        if (job.status === 'completed') {
+            return job.result;
+        }
+        if (job.status === 'dead') {
+            throw new Error(job.last_error || '任务执行失败');
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // 显示错误消息（Toast版本）
 function showError(message) {
     showErrorToast(message);
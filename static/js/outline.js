@@ -93,10 +93,11 @@ async function confirmGenerateOutline(event) {
     showLoading('loading');
 
     try {
-        await apiRequest(`/api/ppt/${projectId}/outline/generate`, {
+        const { job_id } = await apiRequest(`/api/ppt/${projectId}/outline/generate`, {
             method: 'POST',
             body: JSON.stringify({ custom_prompt: customPrompt })
         });
+        await waitForJob(job_id);
         showSuccess('大纲生成成功');
         await loadOutline(projectId);
     } catch (error) {
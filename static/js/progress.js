@@ -9,6 +9,10 @@ async function loadProjectInfo(projectId) {
         const project = await apiRequest(`/api/ppt/${projectId}`);
         currentProject = project;
         document.getElementById('ppt-title').textContent = project.title;
+        const draftToggle = document.getElementById('draft-mode-toggle');
+        if (draftToggle) {
+            draftToggle.checked = Boolean(project.draft_mode);
+        }
     } catch (error) {
         console.error('加载项目信息失败:', error);
     }
@@ -43,13 +47,14 @@ function displayStyles(styles) {
 
     grid.innerHTML = styles.map(style => {
         // 转换文件路径为URL路径
-        const imageUrl = convertPathToUrl(style.image_path);
+        const imageUrl = style.image_url || convertPathToUrl(style.image_path);
         const isSelected = selectedIndex === style.template_index;
 
         return `
             <div class="card ${isSelected ? 'card-selected' : ''}" data-style-index="${style.template_index}">
-                <img src="${imageUrl}"
+                <img src="${variantUrl(imageUrl, 'thumb')}"
                      alt="样式 ${style.template_index + 1}"
+                     loading="lazy"
                      style="width: 100%; height: auto; cursor: pointer;"
                      onclick="viewStyleImage('${imageUrl}', ${style.template_index})"
                      title="点击查看大图">
@@ -71,7 +76,7 @@ function viewStyleImage(imageUrl, styleIndex) {
     const title = document.getElementById('style-image-title');
 
     if (modal && img && title) {
-        img.src = imageUrl;
+        img.src = variantUrl(imageUrl, 'medium');
         title.textContent = `样式 ${styleIndex + 1}`;
         showModal('style-image-modal');
     }
@@ -88,6 +93,11 @@ function convertPathToUrl(filePath) {
     return '/' + filePath.replace(/^\.\//, '').replace(/\\/g, '/');
 }
 
+// 获取图片指定规格的URL（thumb：网格缩略图，medium：大图预览）
+function variantUrl(imageUrl, variant) {
+    return `${imageUrl}${imageUrl.includes('?') ? '&' : '?'}variant=${variant}`;
+}
+
 // 生成样式模板
 async function generateStyles() {
     // 弹出对话框让用户输入自定义提示词
@@ -97,8 +107,9 @@ async function generateStyles() {
     if (customPrompt === null) return;
 
     try {
-        // 启动生成任务
-        const body = customPrompt.trim() ? { custom_prompt: customPrompt.trim() } : {};
+        // 启动生成任务（每次点击都是重新生成，跳过图片结果缓存，否则默认提示词总是返回同样的缓存图片）
+        const body = { bypass_cache: true };
+        if (customPrompt.trim()) body.custom_prompt = customPrompt.trim();
         await apiRequest(`/api/ppt/${projectId}/styles/generate`, {
             method: 'POST',
             body: JSON.stringify(body)
@@ -175,7 +186,12 @@ async function pollStyleProgress() {
 
             // 检查状态
             if (status.status === 'completed') {
-                showSuccess('样式模板生成完成！');
+                const failedSlots = (status.slots || []).filter(slot => slot.status === 'failed');
+                if (failedSlots.length > 0) {
+                    showAlert(`${status.message}\n\n可点击"生成样式模板"按钮重新生成`, '部分样式生成失败');
+                } else {
+                    showSuccess('样式模板生成完成！');
+                }
                 hideStyleProgress();
                 await loadStyles(projectId); // 完成时正常加载
                 return;
@@ -249,38 +265,74 @@ async function loadPages(projectId, silent = false) {
         displayPages(pages);
 
         // 检查是否有未完成的页面
-        const hasIncomplete = pages.some(p => p.status === 'pending' || p.status === 'failed');
+        const hasIncomplete = pages.some(p => ['pending', 'failed', 'deferred'].includes(p.status));
         const hasCompleted = pages.some(p => p.status === 'completed');
 
-        // 如果有已完成的页面但还有未完成的，显示"继续生成"按钮
-        if (hasIncomplete && hasCompleted) {
+        // 如果有已完成的页面但还有未完成的，或生成已暂停/取消，显示"继续生成"按钮
+        const stopped = currentProject && ['paused', 'cancelled'].includes(currentProject.status);
+        if (hasIncomplete && (hasCompleted || stopped)) {
             document.getElementById('resume-btn').style.display = 'inline-block';
             document.getElementById('generate-btn').style.display = 'none';
         }
+
+        // 有草稿页面时显示"全部定稿"按钮
+        const hasDraft = pages.some(p => p.status === 'completed' && p.is_draft);
+        document.getElementById('finalize-btn').style.display = hasDraft ? 'inline-block' : 'none';
     } catch (error) {
         console.error('加载PPT页面失败:', error);
     }
 }
 
+// 当前显示的页面（按页码），收到单页事件时只更新对应的卡片
+let currentPages = {};
+
 // 显示PPT页面
 function displayPages(pages) {
     const grid = document.getElementById('pages-grid');
     if (!grid) return;
 
+    currentPages = {};
+    pages.forEach(page => { currentPages[page.page_number] = page; });
+
     if (pages.length === 0) {
         grid.innerHTML = '<p class="text-muted">选择样式后点击"开始生成"按钮</p>';
         return;
     }
 
-    grid.innerHTML = pages.map(page => {
-        // 转换文件路径为URL路径
-        const imageUrl = page.image_path ? convertPathToUrl(page.image_path) : null;
-        return `
-            <div class="card">
-                <div class="mb-sm text-muted text-sm">第 ${page.page_number} 页</div>
+    grid.innerHTML = pages.map(renderPageCard).join('');
+
+    // 检查是否全部完成
+    const allCompleted = pages.every(p => p.status === 'completed');
+    if (allCompleted) {
+        enableDownloads();
+    }
+}
+
+// 更新单个页面卡片（SSE单页事件）
+function updatePageCard(update) {
+    const page = { ...(currentPages[update.page_number] || {}), ...update };
+    currentPages[page.page_number] = page;
+
+    const card = document.querySelector(`#pages-grid [data-page-number="${page.page_number}"]`);
+    if (card) {
+        card.outerHTML = renderPageCard(page);
+    } else {
+        // 页面记录刚创建（首次生成），重新加载整个列表
+        loadPages(projectId, true);
+    }
+}
+
+// 生成单个页面卡片的HTML
+function renderPageCard(page) {
+    // 转换文件路径为URL路径
+    const imageUrl = page.image_url || (page.image_path ? convertPathToUrl(page.image_path) : null);
+    return `
+            <div class="card" data-page-number="${page.page_number}">
+                <div class="mb-sm text-muted text-sm">第 ${page.page_number} 页${page.is_draft ? `（草稿 ${page.image_size}）` : ''}</div>
                 ${imageUrl ?
-                    `<img src="${imageUrl}"
+                    `<img src="${variantUrl(imageUrl, 'thumb')}"
                           alt="第 ${page.page_number} 页"
+                          loading="lazy"
                           style="width: 100%; height: auto; cursor: pointer;"
                           onclick="viewPageImage('${imageUrl}', ${page.page_number})"
                           title="点击查看大图">` :
@@ -291,9 +343,12 @@ function displayPages(pages) {
                 ${page.status === 'completed' ?
                     `<div class="mt-sm">
                         <button class="btn btn-sm" onclick="regeneratePage(${page.page_number})">重新生成</button>
+                        ${page.is_draft ?
+                            `<button class="btn btn-sm" onclick="finalizePages([${page.page_number}])">定稿</button>` : ''
+                        }
                     </div>` : ''
                 }
-                ${page.status === 'failed' ?
+                ${page.status === 'failed' || page.status === 'deferred' ?
                     `<div class="mt-sm">
                         <p class="text-muted text-sm">错误: ${page.error_message}</p>
                         <button class="btn btn-sm" onclick="regeneratePage(${page.page_number})">重试</button>
@@ -301,13 +356,6 @@ function displayPages(pages) {
                 }
             </div>
         `;
-    }).join('');
-
-    // 检查是否全部完成
-    const allCompleted = pages.every(p => p.status === 'completed');
-    if (allCompleted) {
-        document.getElementById('download-btn').disabled = false;
-    }
 }
 
 // 查看PPT页面大图
@@ -317,7 +365,7 @@ function viewPageImage(imageUrl, pageNumber) {
     const title = document.getElementById('page-image-title');
 
     if (modal && img && title) {
-        img.src = imageUrl;
+        img.src = variantUrl(imageUrl, 'medium');
         title.textContent = `第 ${pageNumber} 页`;
         showModal('page-image-modal');
     }
@@ -334,7 +382,8 @@ function getPageStatusText(status) {
         'pending': '等待生成',
         'generating': '生成中...',
         'completed': '已完成',
-        'failed': '生成失败'
+        'failed': '生成失败',
+        'deferred': '服务暂不可用，待重试'
     };
     return statusMap[status] || status;
 }
@@ -414,11 +463,16 @@ async function startGeneration() {
     await showGeneratePrompt();
 }
 
-// 监听生成进度（SSE）
+// 监听生成进度（SSE，连接中断时浏览器自动重连并从最后收到的事件继续）
 function listenProgress() {
     const eventSource = new EventSource(`/api/ppt/${projectId}/pages/status`);
 
-    eventSource.onmessage = (event) => {
+    // 单页开始生成、完成或失败时只更新该页卡片
+    eventSource.addEventListener('page', (event) => {
+        updatePageCard(JSON.parse(event.data));
+    });
+
+    eventSource.addEventListener('progress', (event) => {
         const data = JSON.parse(event.data);
 
         if (data.error) {
@@ -427,31 +481,56 @@ function listenProgress() {
             return;
         }
 
+        // 任务排队中，等待执行
+        if (data.status === 'queued') {
+            document.getElementById('progress-text').textContent = '排队中...';
+            return;
+        }
+
+        // 已请求暂停/取消，等待进行中的页面结束
+        if (data.status === 'pausing' || data.status === 'cancelling') {
+            document.getElementById('progress-text').textContent =
+                data.status === 'pausing' ? '正在暂停，等待进行中的页面完成...' : '正在取消...';
+            return;
+        }
+
+        // 已暂停或取消：关闭连接，显示"继续生成"按钮
+        if (data.status === 'paused' || data.status === 'cancelled') {
+            eventSource.close();
+            if (currentProject) {
+                currentProject.status = data.status;
+            }
+            document.getElementById('progress-text').textContent =
+                data.status === 'paused' ? '生成已暂停' : '生成已取消';
+            loadPages(projectId, true);
+            return;
+        }
+
         // 更新进度条
         const progress = (data.current_page / data.total_pages) * 100;
         document.getElementById('progress-bar').style.width = progress + '%';
         document.getElementById('progress-text').textContent =
             `正在生成第 ${data.current_page} / ${data.total_pages} 页`;
 
-        // 刷新页面显示（静默模式，避免网络波动时弹窗）
-        loadPages(projectId, true);
-
-        // 如果完成或失败，关闭连接
+        // 如果完成或失败，关闭连接并刷新页面列表（更新继续生成、定稿等按钮）
         if (data.status === 'completed' || data.status === 'failed') {
             eventSource.close();
+            loadPages(projectId, true);
             document.getElementById('progress-text').textContent =
                 data.status === 'completed' ? '生成完成！' : '生成失败';
 
             if (data.status === 'completed') {
                 showSuccess('PPT生成完成！');
-                document.getElementById('download-btn').disabled = false;
+                enableDownloads();
             }
         }
-    };
+    });
 
     eventSource.onerror = (error) => {
-        console.error('SSE连接错误:', error);
-        eventSource.close();
+        // 连接中断时浏览器会自动重连，只有连接被关闭时才停止
+        if (eventSource.readyState === EventSource.CLOSED) {
+            console.error('SSE连接错误:', error);
+        }
     };
 }
 
@@ -464,7 +543,11 @@ async function regeneratePage(pageNumber) {
     if (customPrompt === null) return;
 
     try {
-        const body = customPrompt.trim() ? { custom_prompt: customPrompt.trim() } : {};
+        // 用户主动重新生成时需要新的结果，跳过图片结果缓存
+        const body = { bypass_cache: true };
+        if (customPrompt.trim()) {
+            body.custom_prompt = customPrompt.trim();
+        }
         await apiRequest(`/api/ppt/${projectId}/pages/${pageNumber}/regenerate`, {
             method: 'POST',
             body: JSON.stringify(body)
@@ -485,6 +568,9 @@ async function resumeGeneration() {
         await apiRequest(`/api/ppt/${projectId}/pages/resume`, {
             method: 'POST'
         });
+        if (currentProject) {
+            currentProject.status = 'generating';
+        }
 
         // 显示进度区域
         document.getElementById('progress-section').classList.remove('hidden');
@@ -497,7 +583,102 @@ async function resumeGeneration() {
     }
 }
 
+// 暂停生成（进行中的页面完成后停止）
+async function pauseGeneration() {
+    try {
+        await apiRequest(`/api/ppt/${projectId}/pages/pause`, { method: 'POST' });
+    } catch (error) {
+        showError('暂停失败: ' + error.message);
+    }
+}
+
+// 取消生成（中断进行中的页面）
+async function cancelGeneration() {
+    const confirmed = await showConfirm('取消生成？进行中的页面将被中断，之后可以继续生成未完成的页面。', '取消生成');
+    if (!confirmed) return;
+
+    try {
+        await apiRequest(`/api/ppt/${projectId}/pages/cancel`, { method: 'POST' });
+    } catch (error) {
+        showError('取消失败: ' + error.message);
+    }
+}
+
+// 切换草稿模式
+async function toggleDraftMode(enabled) {
+    try {
+        await apiRequest(`/api/ppt/${projectId}/draft-mode`, {
+            method: 'POST',
+            body: JSON.stringify({ enabled })
+        });
+        if (currentProject) {
+            currentProject.draft_mode = enabled ? 1 : 0;
+        }
+        showSuccess(enabled ? '已开启草稿模式，页面将以低分辨率快速生成' : '已关闭草稿模式');
+    } catch (error) {
+        document.getElementById('draft-mode-toggle').checked = !enabled;
+        showError('切换草稿模式失败: ' + error.message);
+    }
+}
+
+// 定稿：以最终分辨率重新生成草稿页面（不传页码时定稿所有草稿页）
+async function finalizePages(pageNumbers = null) {
+    const message = pageNumbers
+        ? `以最终分辨率重新生成第 ${pageNumbers.join('、')} 页？`
+        : '以最终分辨率重新生成所有草稿页面？';
+    const confirmed = await showConfirm(message, '定稿');
+    if (!confirmed) return;
+
+    try {
+        const body = pageNumbers ? { page_numbers: pageNumbers } : {};
+        await apiRequest(`/api/ppt/${projectId}/pages/finalize`, {
+            method: 'POST',
+            body: JSON.stringify(body)
+        });
+
+        // 显示进度区域并监听进度
+        document.getElementById('progress-section').classList.remove('hidden');
+        document.getElementById('finalize-btn').style.display = 'none';
+        listenProgress();
+    } catch (error) {
+        showError('定稿失败: ' + error.message);
+    }
+}
+
+// 同步：只重新生成大纲、样式或分辨率变化的页面
+async function syncPages() {
+    try {
+        const result = await apiRequest(`/api/ppt/${projectId}/pages/sync`, {
+            method: 'POST'
+        });
+        if (!result.page_numbers.length) {
+            showSuccess('所有页面都是最新的');
+            return;
+        }
+        showSuccess(`正在重新生成第 ${result.page_numbers.join('、')} 页`);
+
+        // 显示进度区域并监听进度
+        document.getElementById('progress-section').classList.remove('hidden');
+        listenProgress();
+    } catch (error) {
+        showError('同步失败: ' + error.message);
+    }
+}
+
 // 下载PPT
 function downloadPPT() {
     window.location.href = `/api/ppt/${projectId}/pages/download`;
 }
+
+// 启用下载和导出按钮
+function enableDownloads() {
+    ['download-btn', 'export-pptx-btn', 'export-pdf-btn'].forEach(id => {
+        document.getElementById(id).disabled = false;
+    });
+}
+
+// 导出PPTX或PDF（勾选轻量导出时使用较小尺寸的图片）
+function exportDeck(format) {
+    const lightweight = document.getElementById('lightweight-export-toggle').checked;
+    window.location.href = `/api/ppt/${projectId}/export/${format}${lightweight ? '?lightweight=1' : ''}`;
+}
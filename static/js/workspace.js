@@ -306,7 +306,9 @@ function getStatusText(status) {
         'style_selected': '样式已选择',
         'generating': '生成中',
         'completed': '已完成',
-        'failed': '失败'
+        'failed': '失败',
+        'paused': '已暂停',
+        'cancelled': '已取消'
     };
     return statusMap[status] || status;
 }
@@ -315,7 +317,7 @@ function getStatusText(status) {
 function getProjectButtons(project) {
     if (project.status === 'draft') {
         return `<a href="/outline/${project.id}" class="btn">编辑大纲</a>`;
-    } else if (project.status === 'outline_generated' || project.status === 'style_selected' || project.status === 'generating' || project.status === 'completed') {
+    } else if (project.status === 'outline_generated' || project.status === 'style_selected' || project.status === 'generating' || project.status === 'paused' || project.status === 'cancelled' || project.status === 'completed') {
         return `<a href="/ppt/${project.id}" class="btn">查看PPT</a>`;
     }
     return '';
@@ -0,0 +1,32 @@
+"""测试公共配置"""
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config  # noqa: E402
+from database.models import Database  # noqa: E402
+from database.db_manager import DBManager  # noqa: E402
+
+
+@pytest.fixture
+def config(tmp_path):
+    """文件和数据库都放在临时目录中的配置"""
+    class TestConfig(Config):
+        DATABASE_PATH = str(tmp_path / 'test.db')
+        GENERATED_FOLDER = str(tmp_path / 'generated')
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        IMAGE_RESULT_CACHE_ENABLED = False
+        IMAGE_RESULT_CACHE_DIR = str(tmp_path / 'cache' / 'images')
+        IMAGE_DERIVATIVE_DIR = str(tmp_path / 'cache' / 'derivatives')
+        EXPORT_ARTIFACT_DIR = str(tmp_path / 'cache' / 'exports')
+        EXPORT_ARTIFACT_ENABLED = False
+        IMAGE_DERIVATIVE_EAGER = False
+    return TestConfig
+
+
+@pytest.fixture
+def db_manager(config):
+    return DBManager(Database(config.DATABASE_PATH))
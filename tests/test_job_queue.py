@@ -0,0 +1,124 @@
+"""任务租约：同一任务只会被一个执行者领取，租约过期后可被重新领取"""
+import json
+import time
+import threading
+from services.job_queue import JobQueue, JobWorkerPool
+from services.scheduler import PRIORITY_INTERACTIVE, PRIORITY_BATCH
+
+
+def enqueue(db_manager, count=1, **kwargs):
+    return [db_manager.enqueue_job('generate_pages', json.dumps({'index': i}), **kwargs) for i in range(count)]
+
+
+def test_lease_is_exclusive(db_manager):
+    job_id, = enqueue(db_manager)
+    job = db_manager.lease_job('worker-a', 60)
+    assert job['id'] == job_id
+    assert job['lease_owner'] == 'worker-a'
+    assert job['attempts'] == 1
+    assert db_manager.lease_job('worker-b', 60) is None
+
+
+def test_concurrent_leases_never_share_a_job(db_manager):
+    job_ids = enqueue(db_manager, 30)
+    leased = []
+    lock = threading.Lock()
+    start = threading.Barrier(6)
+
+    def worker(name):
+        start.wait()
+        while True:
+            job = db_manager.lease_job(name, 60)
+            if job is None:
+                return
+            with lock:
+                leased.append(job['id'])
+
+    threads = [threading.Thread(target=worker, args=(f'worker-{i}',)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(leased) == sorted(job_ids)
+
+
+def test_expired_lease_is_reclaimed(db_manager):
+    job_id, = enqueue(db_manager, max_attempts=3)
+    db_manager.lease_job('worker-a', 0.05)
+    assert db_manager.lease_job('worker-b', 60) is None
+
+    time.sleep(0.1)
+    job = db_manager.lease_job('worker-b', 60)
+    assert job['id'] == job_id
+    assert job['lease_owner'] == 'worker-b'
+    assert job['attempts'] == 2
+
+    # 原执行者的租约已失效，不能再续约或提交结果
+    assert not db_manager.heartbeat_job(job_id, 'worker-a', 60)
+    assert not db_manager.complete_job(job_id, 'worker-a')
+    assert db_manager.complete_job(job_id, 'worker-b')
+    assert db_manager.get_job(job_id)['status'] == 'completed'
+
+
+def test_heartbeat_keeps_lease(db_manager):
+    enqueue(db_manager)
+    job = db_manager.lease_job('worker-a', 0.2)
+    for _ in range(3):
+        time.sleep(0.1)
+        assert db_manager.heartbeat_job(job['id'], 'worker-a', 0.2)
+        assert db_manager.lease_job('worker-b', 60) is None
+
+
+def test_expired_lease_after_last_attempt_goes_dead(db_manager):
+    job_id, = enqueue(db_manager, max_attempts=1)
+    db_manager.lease_job('worker-a', 0.05)
+    time.sleep(0.1)
+    assert db_manager.lease_job('worker-b', 60) is None
+    assert db_manager.get_job(job_id)['status'] == 'dead'
+
+
+def test_failed_job_waits_for_retry_time(db_manager):
+    job_id, = enqueue(db_manager, max_attempts=3)
+    db_manager.lease_job('worker-a', 60)
+    assert db_manager.fail_job(job_id, 'worker-a', 'boom', time.time() + 0.1) == 'queued'
+    assert db_manager.lease_job('worker-b', 60) is None
+    time.sleep(0.15)
+    assert db_manager.lease_job('worker-b', 60)['id'] == job_id
+
+
+def test_lease_order_by_priority(db_manager):
+    batch, = enqueue(db_manager, priority=PRIORITY_BATCH)
+    interactive, = enqueue(db_manager, priority=PRIORITY_INTERACTIVE)
+    assert db_manager.lease_job('worker-a', 60)['id'] == interactive
+    assert db_manager.lease_job('worker-a', 60)['id'] == batch
+
+
+def test_expired_lease_dead_jobs_are_reported(db_manager):
+    job_id, = enqueue(db_manager, max_attempts=1)
+    db_manager.lease_job('worker-a', 0.05)
+    time.sleep(0.1)
+    dead_jobs = []
+    assert db_manager.lease_job('worker-b', 60, dead_jobs=dead_jobs) is None
+    assert [(job['id'], job['status']) for job in dead_jobs] == [(job_id, 'dead')]
+    assert dead_jobs[0]['last_error']
+
+
+def test_worker_calls_on_dead_after_lost_lease(config, db_manager):
+    """执行者崩溃后租约过期的任务转入死信时同样调用 on_dead"""
+    queue = JobQueue(config, db_manager)
+    dead = []
+    queue.register('generate_pages', lambda payload: None, max_attempts=1,
+                   on_dead=lambda payload, error: dead.append((payload, error)))
+    enqueue(db_manager, max_attempts=1)
+    db_manager.lease_job('crashed-worker', 0.05)
+    time.sleep(0.1)
+
+    pool = JobWorkerPool(config, queue, size=1)
+    pool.start()
+    try:
+        deadline = time.time() + 5
+        while not dead and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        pool.stop(5)
+    assert [payload for payload, _ in dead] == [{'index': 0}]
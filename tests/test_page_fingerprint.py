@@ -0,0 +1,88 @@
+"""页面输入指纹：只有影响生成结果的输入变化时才改变，同步时只重新生成变化的页面"""
+import os
+import pytest
+from services.container import ServiceContainer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGE = {'page_number': 1, 'title': '市场分析', 'content': '- 规模\n- 增速', 'image_prompt': '柱状图'}
+
+
+@pytest.fixture
+def services(config, monkeypatch):
+    monkeypatch.chdir(ROOT)  # 提示词模板按相对路径加载
+    return ServiceContainer(config)
+
+
+@pytest.fixture
+def generator(services):
+    return services.ppt_generator
+
+
+@pytest.fixture
+def style_ref(tmp_path):
+    path = tmp_path / 'style.png'
+    path.write_bytes(b'style image v1')
+    return str(path)
+
+
+def test_same_input_same_fingerprint(generator, style_ref):
+    first = generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+    assert first == generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+    # 页码不影响生成结果
+    assert first == generator.page_fingerprint(dict(PAGE, page_number=7), style_ref, '2K')
+
+
+@pytest.mark.parametrize('field, value', [
+    ('title', '竞争分析'),
+    ('content', '- 规模\n- 增速\n- 份额'),
+    ('image_prompt', '饼图'),
+])
+def test_outline_change_detected(generator, style_ref, field, value):
+    before = generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+    assert before != generator.page_fingerprint(dict(PAGE, **{field: value}), style_ref, '2K')
+
+
+def test_image_size_change_detected(generator, style_ref):
+    assert (generator.page_fingerprint(dict(PAGE), style_ref, '1K')
+            != generator.page_fingerprint(dict(PAGE), style_ref, '4K'))
+
+
+def test_style_image_content_change_detected(generator, style_ref):
+    before = generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+    with open(style_ref, 'wb') as f:
+        f.write(b'style image v2')
+    os.utime(style_ref, ns=(1, 1))
+    assert before != generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+    assert before != generator.page_fingerprint(dict(PAGE), '', '2K')
+
+
+def test_style_image_touched_without_change(generator, style_ref):
+    before = generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+    os.utime(style_ref, ns=(1, 1))
+    assert before == generator.page_fingerprint(dict(PAGE), style_ref, '2K')
+
+
+def test_sync_regenerates_only_changed_pages(services, generator, monkeypatch):
+    db_manager = services.db_manager
+    workspace_id = db_manager.create_workspace('w')
+    project_id = db_manager.create_ppt_project(workspace_id, 'deck', 'prompt', 3)
+    image_size = generator.page_image_size(db_manager.get_ppt_project(project_id))
+    for page_number in (1, 2, 3):
+        db_manager.add_outline_page(project_id, page_number, f'标题{page_number}', f'内容{page_number}')
+        db_manager.add_ppt_page(project_id, page_number)
+    for page in db_manager.get_outline_pages(project_id):
+        db_manager.update_ppt_page(project_id, page['page_number'], f'page_{page["page_number"]}.png',
+                                   'completed', image_size=image_size,
+                                   input_fingerprint=generator.page_fingerprint(page, '', image_size))
+
+    started = []
+    monkeypatch.setattr(generator, 'start_generation',
+                        lambda project_id, page_numbers=None, image_size=None: started.append(page_numbers))
+
+    assert generator.sync_pages(project_id) == []
+    assert started == []
+
+    db_manager.update_outline_page(project_id, 2, '标题2', '修改后的内容')
+    assert generator.sync_pages(project_id) == [2]
+    assert started == [[2]]
@@ -0,0 +1,139 @@
+"""页面并发生成：单个项目的并发数和全局名额上限，按页码顺序开始，单页失败不影响其他页面"""
+import os
+import time
+import threading
+import pytest
+from services.container import ServiceContainer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeRenderer:
+    """代替图片生成接口：记录同时进行的调用数和开始顺序，并写出图片文件"""
+
+    def __init__(self, delay=0.05, fail_pages=()):
+        self.delay = delay
+        self.fail_pages = set(fail_pages)
+        self.lock = threading.Lock()
+        self.active = {}  # 项目目录 -> 进行中的调用数
+        self.max_active = {}
+        self.total_active = 0
+        self.max_total = 0
+        self.started = {}  # 项目目录 -> 页码开始顺序
+
+    def __call__(self, prompt, style_ref, output_path, use_cache=True, image_size=None, cancel_token=None):
+        project = os.path.dirname(os.path.dirname(output_path))
+        page_number = int(os.path.basename(output_path)[5:8])
+        with self.lock:
+            self.started.setdefault(project, []).append(page_number)
+            self.active[project] = self.active.get(project, 0) + 1
+            self.max_active[project] = max(self.max_active.get(project, 0), self.active[project])
+            self.total_active += 1
+            self.max_total = max(self.max_total, self.total_active)
+        try:
+            time.sleep(self.delay)
+            if page_number in self.fail_pages:
+                raise RuntimeError('生成失败')
+            with open(output_path, 'wb') as f:
+                f.write(b'png')
+            return output_path
+        finally:
+            with self.lock:
+                self.active[project] -= 1
+                self.total_active -= 1
+
+
+@pytest.fixture
+def make_services(config, monkeypatch):
+    monkeypatch.chdir(ROOT)  # 提示词模板按相对路径加载
+
+    def make(page_concurrency, global_limit, renderer):
+        class PoolConfig(config):
+            PAGE_GENERATION_CONCURRENCY = page_concurrency
+            MAX_CONCURRENT_PAGE_GENERATIONS = global_limit
+        services = ServiceContainer(PoolConfig)
+        monkeypatch.setattr(services.banana_service, 'render_page_prompt', renderer)
+        return services
+    return make
+
+
+def create_project(db_manager, pages):
+    workspace_id = db_manager.create_workspace('w')
+    project_id = db_manager.create_ppt_project(workspace_id, 'deck', 'prompt', pages)
+    for page_number in range(1, pages + 1):
+        db_manager.add_outline_page(project_id, page_number, f'标题{page_number}', f'内容{page_number}')
+    db_manager.update_ppt_project_status(project_id, 'generating')
+    return project_id
+
+
+def page_statuses(db_manager, project_id):
+    return {p['page_number']: p['status'] for p in db_manager.get_ppt_pages(project_id)}
+
+
+def test_per_project_concurrency(make_services):
+    renderer = FakeRenderer()
+    services = make_services(3, 10, renderer)
+    db_manager = services.db_manager
+    project_id = create_project(db_manager, 8)
+
+    services.ppt_generator._generate_pages(project_id)
+
+    assert list(renderer.max_active.values()) == [3]
+    assert set(page_statuses(db_manager, project_id).values()) == {'completed'}
+    assert db_manager.get_ppt_project(project_id)['status'] == 'completed'
+    status = services.ppt_generator.get_generation_status(project_id)
+    assert (status['status'], status['current_page'], status['total_pages']) == ('completed', 8, 8)
+
+
+def test_global_limit_across_projects(make_services):
+    renderer = FakeRenderer()
+    services = make_services(3, 4, renderer)
+    project_ids = [create_project(services.db_manager, 6) for _ in range(3)]
+
+    threads = [threading.Thread(target=services.ppt_generator._generate_pages, args=(project_id,))
+               for project_id in project_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert renderer.max_total == 4
+    assert max(renderer.max_active.values()) <= 3
+    for project_id in project_ids:
+        assert set(page_statuses(services.db_manager, project_id).values()) == {'completed'}
+
+
+def test_pages_start_in_page_order(make_services):
+    renderer = FakeRenderer(delay=0.01)
+    services = make_services(1, 4, renderer)
+    project_id = create_project(services.db_manager, 5)
+
+    services.ppt_generator._generate_pages(project_id)
+
+    assert list(renderer.started.values()) == [[1, 2, 3, 4, 5]]
+
+
+def test_failed_page_does_not_stop_others(make_services):
+    renderer = FakeRenderer(fail_pages={2})
+    services = make_services(2, 4, renderer)
+    project_id = create_project(services.db_manager, 4)
+
+    services.ppt_generator._generate_pages(project_id)
+
+    assert page_statuses(services.db_manager, project_id) == {
+        1: 'completed', 2: 'failed', 3: 'completed', 4: 'completed'
+    }
+
+
+def test_only_incomplete_pages_are_generated(make_services):
+    renderer = FakeRenderer(delay=0.01)
+    services = make_services(2, 4, renderer)
+    project_id = create_project(services.db_manager, 4)
+    services.ppt_generator._generate_pages(project_id)
+
+    services.db_manager.update_ppt_page_status(project_id, 3, 'failed')
+    services.db_manager.update_ppt_project_status(project_id, 'generating')  # 与 start_generation 相同
+    renderer.started.clear()
+    services.ppt_generator._generate_pages(project_id)
+
+    assert list(renderer.started.values()) == [[3]]
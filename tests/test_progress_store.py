@@ -0,0 +1,77 @@
+"""进度变更通知：只唤醒等待该键的订阅者，其他进程的写入由监视线程按键发现"""
+import time
+import threading
+import pytest
+from services.progress_store import ProgressStore
+
+
+@pytest.fixture
+def store_config(config):
+    class StoreConfig(config):
+        PROGRESS_POLL_INTERVAL = 0.05
+    return StoreConfig
+
+
+def wait_in_thread(store, key, timeout):
+    """在后台线程中等待 key 的变更，返回 (线程, 结果列表)"""
+    token = store.change_token(key)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(store.wait_for_change(key, token, timeout)))
+    thread.start()
+    time.sleep(0.1)  # 等待线程进入等待状态
+    return thread, result
+
+
+def prime(store, *keys):
+    """监视线程第一次查询某个键的标记时会唤醒一次它的等待者，之后只有标记变化才唤醒"""
+    for key in keys:
+        thread, _ = wait_in_thread(store, key, 1)
+        thread.join()
+
+
+def test_local_write_wakes_only_its_key(store_config, db_manager):
+    store = ProgressStore(store_config, db_manager)
+    prime(store, 'pages:1', 'pages:2')
+    thread_a, woken_a = wait_in_thread(store, 'pages:1', 1.5)
+    thread_b, woken_b = wait_in_thread(store, 'pages:2', 0.5)
+
+    started = time.time()
+    store.set('pages:1', {'status': 'generating'}, 'progress')
+    thread_a.join()
+    assert woken_a == [True]
+    assert time.time() - started < 0.5
+
+    thread_b.join()
+    assert woken_b == [False]
+
+
+def test_write_from_other_process_is_detected_per_key(store_config, db_manager):
+    store = ProgressStore(store_config, db_manager)
+    other_process = ProgressStore(store_config, db_manager)
+    other_process.set('pages:1', {'status': 'queued'})
+    other_process.set('pages:2', {'status': 'queued'})
+    prime(store, 'pages:1', 'pages:2')
+
+    thread_a, woken_a = wait_in_thread(store, 'pages:1', 2)
+    thread_b, woken_b = wait_in_thread(store, 'pages:2', 0.8)
+    other_process.publish_event('pages:1', 'page', {'page_number': 1})
+    thread_a.join()
+    thread_b.join()
+    assert woken_a == [True]
+    assert woken_b == [False]
+
+
+def test_change_before_wait_returns_immediately(store_config, db_manager):
+    store = ProgressStore(store_config, db_manager)
+    token = store.change_token('pages:1')
+    store.set('pages:1', {'status': 'generating'})
+    assert store.wait_for_change('pages:1', token, 5)
+
+
+def test_wait_returns_new_version(store_config, db_manager):
+    store = ProgressStore(store_config, db_manager)
+    version = store.set('pages:1', {'current_page': 0})
+    threading.Timer(0.1, store.set, args=('pages:1', {'current_page': 1})).start()
+    entry = store.wait('pages:1', version, timeout=2)
+    assert entry[1] == {'current_page': 1}
+    assert store.get_stats()['waiters'] == 0
@@ -0,0 +1,112 @@
+"""InlineImageStreamDecoder：任意分块方式下都能完整解码图片"""
+import io
+import os
+import base64
+import random
+import pytest
+from services.stream_decoder import InlineImageStreamDecoder
+
+IMAGE = os.urandom(5000)
+
+
+def make_response(image=IMAGE, mime_after_data=False, escape_slashes=True):
+    """构造 streamGenerateContent 的响应体（JSON中的斜杠按部分服务端的习惯转义为 \\/）"""
+    data = base64.b64encode(image).decode('ascii')
+    mime = 'image\\/png' if escape_slashes else 'image/png'
+    if escape_slashes:
+        data = data.replace('/', '\\/')
+    fields = [f'"mimeType": "{mime}"', f'"data": "{data}"']
+    if mime_after_data:
+        fields.reverse()
+    body = (
+        '[{"candidates": [{"content": {"role": "model", "parts": ['
+        '{"text": "这是生成的图片"}, '
+        '{"inlineData": {' + ', '.join(fields) + '}}'
+        ']}}], "usageMetadata": {"totalTokenCount": 1290}}]'
+    )
+    return body.encode('utf-8')
+
+
+def decode(chunks):
+    output = io.BytesIO()
+    decoder = InlineImageStreamDecoder(output)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder, decoder.finish(), output.getvalue()
+
+
+def split_fixed(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def split_random(data, seed):
+    rng = random.Random(seed)
+    chunks, start = [], 0
+    while start < len(data):
+        end = start + rng.randint(1, 64)
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 5, 7, 11, 13, 31, 64, 1000, 1 << 20])
+def test_fixed_chunk_sizes(size):
+    decoder, ok, image = decode(split_fixed(make_response(), size))
+    assert ok
+    assert image == IMAGE
+    assert decoder.bytes_written == len(IMAGE)
+    assert decoder.mime_type == 'image/png'
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_chunk_boundaries(seed):
+    _, ok, image = decode(split_random(make_response(), seed))
+    assert ok
+    assert image == IMAGE
+
+
+@pytest.mark.parametrize('size', [1, 3, 17])
+def test_mime_type_after_data(size):
+    decoder, ok, image = decode(split_fixed(make_response(mime_after_data=True), size))
+    assert ok
+    assert image == IMAGE
+    assert decoder.mime_type == 'image/png'
+
+
+@pytest.mark.parametrize('length', [1, 2, 3, 4, 5, 6])
+def test_base64_padding(length):
+    """图片长度不是3的倍数时 base64 带填充"""
+    image = os.urandom(length)
+    _, ok, decoded = decode(split_fixed(make_response(image, escape_slashes=False), 1))
+    assert ok
+    assert decoded == image
+
+
+def test_only_first_image_is_written():
+    body = make_response()
+    second = make_response(b'second image')
+    _, ok, image = decode(split_fixed(body[:-1] + b',' + second[1:], 7))
+    assert ok
+    assert image == IMAGE
+
+
+def test_response_without_image():
+    body = b'[{"candidates": [{"content": {"parts": [{"text": "no image"}]}, "finishReason": "SAFETY"}]}]'
+    decoder, ok, image = decode(split_fixed(body, 5))
+    assert not ok
+    assert not decoder.found
+    assert image == b''
+    assert 'SAFETY' in decoder.snippet
+
+
+def test_truncated_response():
+    body = make_response()
+    decoder, ok, _ = decode([body[:len(body) // 2]])
+    assert decoder.found
+    assert not ok
+
+
+def test_inline_data_without_data_field():
+    body = b'{"inlineData": {"mimeType": "image/png"' + b' ' * (InlineImageStreamDecoder.MAX_HEADER_BYTES + 10)
+    with pytest.raises(ValueError):
+        decode(split_fixed(body, 100))
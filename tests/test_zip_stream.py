@@ -0,0 +1,140 @@
+"""ZipStream：生成的归档能被 zipfile 正确读取"""
+import io
+import os
+import struct
+import zipfile
+import pytest
+from services.zip_stream import ZipStream
+
+FLAG_DATA_DESCRIPTOR = 0x08
+
+
+@pytest.fixture
+def page_files(tmp_path):
+    files = {}
+    for index, size in enumerate([0, 1, 4096, 300_001], start=1):
+        path = tmp_path / f'{index}.png'
+        path.write_bytes(os.urandom(size))
+        files[f'page_{index:03d}.png'] = path
+    return files
+
+
+def read_archive(archive):
+    data = b''.join(archive.generate())
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    assert zf.testzip() is None
+    return data, zf
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 1 << 20])
+def test_files_round_trip(page_files, chunk_size):
+    archive = ZipStream(chunk_size=chunk_size)
+    for arcname, path in page_files.items():
+        archive.add_file(str(path), arcname)
+    expected_length = archive.content_length()
+
+    data, zf = read_archive(archive)
+    assert len(data) == expected_length
+    assert zf.namelist() == list(page_files)
+    for arcname, path in page_files.items():
+        assert zf.read(arcname) == path.read_bytes()
+        info = zf.getinfo(arcname)
+        assert info.compress_type == zipfile.ZIP_STORED
+        assert not info.flag_bits & FLAG_DATA_DESCRIPTOR
+
+
+def test_bytes_lazy_and_unicode_names(page_files):
+    archive = ZipStream(chunk_size=7)
+    archive.add_file(str(page_files['page_003.png']), 'ppt/media/image1.png')
+    archive.add_bytes('<幻灯片/>'.encode('utf-8'), 'ppt/slides/幻灯片1.xml')
+    archive.add_lazy(lambda: b'jpeg' * 100, 'ppt/media/image2.jpeg')
+    assert archive.content_length() is None
+
+    _, zf = read_archive(archive)
+    assert zf.read('ppt/media/image1.png') == page_files['page_003.png'].read_bytes()
+    assert zf.read('ppt/slides/幻灯片1.xml').decode('utf-8') == '<幻灯片/>'
+    assert zf.read('ppt/media/image2.jpeg') == b'jpeg' * 100
+    for info in zf.infolist():
+        assert not info.flag_bits & FLAG_DATA_DESCRIPTOR
+
+
+def test_local_headers_carry_crc_and_sizes(page_files):
+    """本地文件头中直接写入CRC和大小（不依赖中央目录和数据描述符）"""
+    archive = ZipStream()
+    archive.add_file(str(page_files['page_003.png']), 'a.png')
+    archive.add_lazy(lambda: b'lazy data', 'b.bin')
+    data, zf = read_archive(archive)
+    for info in zf.infolist():
+        header = data[info.header_offset:info.header_offset + 30]
+        crc, compressed_size, size = struct.unpack('<3L', header[14:26])
+        assert (crc, compressed_size, size) == (info.CRC, info.file_size, info.file_size)
+
+
+def test_files_are_read_when_streamed(page_files):
+    """添加文件时不读取内容：发送前被同样大小的新文件替换时发送新内容"""
+    path = page_files['page_003.png']
+    archive = ZipStream()
+    archive.add_file(str(path), 'a.png')
+    replacement = path.with_suffix('.tmp')
+    replacement.write_bytes(os.urandom(path.stat().st_size))
+    os.replace(replacement, path)
+
+    _, zf = read_archive(archive)
+    assert zf.read('a.png') == path.read_bytes()
+
+
+def test_replaced_file_with_different_size_fails(page_files):
+    """总大小已按添加时的文件大小算出，大小改变时无法继续发送"""
+    path = page_files['page_003.png']
+    archive = ZipStream()
+    archive.add_file(str(path), 'a.png')
+    replacement = path.with_suffix('.tmp')
+    replacement.write_bytes(os.urandom(10))
+    os.replace(replacement, path)
+    with pytest.raises(IOError):
+        b''.join(archive.generate())
+
+
+def test_cached_crc_is_verified(page_files):
+    """CRC按 路径 + 修改时间 + 大小 缓存；内容被原地修改而修改时间和大小不变时发送失败而不是生成损坏的归档"""
+    path = page_files['page_003.png']
+    archive = ZipStream()
+    archive.add_file(str(path), 'a.png')
+    read_archive(archive)
+
+    stat = path.stat()
+    with open(path, 'r+b') as f:
+        f.write(b'changed')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    archive = ZipStream()
+    archive.add_file(str(path), 'a.png')
+    with pytest.raises(IOError):
+        b''.join(archive.generate())
+
+
+def test_one_file_open_at_a_time(page_files, monkeypatch):
+    import builtins
+    real_open = builtins.open
+    opened = []
+
+    def tracking_open(*args, **kwargs):
+        f = real_open(*args, **kwargs)
+        opened.append(f)
+        return f
+    monkeypatch.setattr(builtins, 'open', tracking_open)
+
+    archive = ZipStream()
+    for arcname, path in page_files.items():
+        archive.add_file(str(path), arcname)
+    assert opened == []
+
+    for _ in archive.generate():
+        assert sum(not f.closed for f in opened) <= 1
+    assert len(opened) == len(page_files)
+    assert all(f.closed for f in opened)
+
+
+def test_empty_archive():
+    _, zf = read_archive(ZipStream())
+    assert zf.namelist() == []
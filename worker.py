@@ -0,0 +1,75 @@
+"""独立后台任务执行者入口
+
+与Web进程共享数据库和文件目录（DATABASE_PATH、GENERATED_FOLDER 等配置需一致），
+从任务队列领取大纲、样式和页面生成任务执行。可以在多个进程或机器上同时运行，
+Web进程设置 RUN_EMBEDDED_WORKERS=False 后只负责提交任务。
+
+用法:
+    python worker.py [--workers N] [--job-types generate_pages,generate_styles]
+"""
+import sys
+import signal
+import logging
+import argparse
+import threading
+from config import Config
+from services.container import ServiceContainer
+from services.job_queue import JobWorkerPool
+
+# 配置日志
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='后台任务执行者')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'同时执行的任务数（默认 JOB_WORKERS={Config.JOB_WORKERS}）')
+    parser.add_argument('--job-types', default='',
+                        help='只执行指定类型的任务，逗号分隔（默认执行所有类型）')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # 确保存储目录存在
+    Config.init_app(None)
+    services = ServiceContainer(Config)
+
+    job_types = [job_type.strip() for job_type in args.job_types.split(',') if job_type.strip()]
+    unknown = set(job_types) - set(services.job_queue.job_types)
+    if unknown:
+        logger.error(f"未知的任务类型: {', '.join(sorted(unknown))}，可选: {', '.join(services.job_queue.job_types)}")
+        return 1
+
+    job_workers = JobWorkerPool(Config, services.job_queue, size=args.workers, job_types=job_types)
+
+    # 收到 SIGTERM/SIGINT 后停止领取新任务，等待执行中的任务结束后退出
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"收到停止信号 {signum}，不再领取新任务")
+        stop_requested.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    job_workers.start()
+    while not stop_requested.wait(1):
+        pass
+
+    if job_workers.stop(Config.WORKER_SHUTDOWN_TIMEOUT):
+        logger.info("执行中的任务已全部结束，执行者退出")
+    else:
+        logger.warning("等待超时，仍在执行的任务将在租约过期后由其他执行者重新领取")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())